@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time scraping a batch of pages with each of scrape_many's backends.
+
+The finds are regexes over generated pages, so the work is CPU-bound:
+threads share one core under the GIL, while processes use as many as
+there are workers.  "process-mapped" sends workers the pages' files to
+map, rather than pickling the pages.
+
+    python benchmarks/batch_backends.py [pages] [workers]
+"""
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pycaustic import Scraper
+from pycaustic.mapped import MappedFile
+
+INSTRUCTION = {
+    'find': r'<li>(\w+):(\w+)</li>',
+    'replace': '$1:$2',
+    'name': 'pair',
+    'then': [{
+        'find': r'^\w+',
+        'name': 'flower'
+    }, {
+        'find': r'\w+$',
+        'name': 'color'
+    }]
+}
+
+
+def page(n):
+    return '<ul>%s</ul>' % ''.join('<li>flower%s:color%s</li>' % (n, i)
+                                   for i in xrange(200))
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    inputs = [page(n) for n in xrange(pages)]
+    scraper = Scraper()
+
+    directory = tempfile.mkdtemp()
+    files = []
+    for n, input in enumerate(inputs):
+        path = os.path.join(directory, '%s.html' % n)
+        with open(path, 'wb') as fp:
+            fp.write(input)
+        files.append(MappedFile(path))
+
+    print '%s pages, %s workers' % (pages, workers)
+    try:
+        for label, backend, items in (('thread', 'thread', inputs),
+                                      ('process', 'process', inputs),
+                                      ('process-mapped', 'process', files)):
+            start = time.time()
+            for item in scraper.scrape_many(INSTRUCTION, items, workers=workers,
+                                            backend=backend):
+                assert item.ok, item.error
+            print '%-16s %6.2fs' % (label, time.time() - start)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
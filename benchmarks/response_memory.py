@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the memory each node of a Response tree keeps.
+
+Each configuration is scraped in its own process, which reports the size
+of the objects still alive after the scrape, per Result kept, and how many
+forked tag dicts are still alive.  Sizes are summed over the objects the
+garbage collector tracks, so strings, which every configuration shares,
+are left out.  The "dict" configuration scrapes with Results and DoneFinds
+laid out as they were before they had __slots__.
+
+    python benchmarks/response_memory.py [matches]
+"""
+
+import gc
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pycaustic import Scraper
+from pycaustic import responses, scraper
+from pycaustic.templates import InheritedDict
+
+CONFIGS = ('dict', 'slots', 'slots-no-context')
+
+INSTRUCTION = {
+    'find': r'\w+:\w+',
+    'name': 'pair',
+    'then': [{
+        'find': r'^\w+',
+        'name': 'flower'
+    }, {
+        'find': r'\w+$',
+        'name': 'color'
+    }]
+}
+
+
+class DictResult(object):
+    """
+    A Result as it was before __slots__.
+    """
+
+    def __init__(self, value, children=None):
+        self._value = value
+        self._children = responses._wrap_children(children)
+
+
+class DictDoneFind(object):
+    """
+    A DoneFind as it was before __slots__, which always kept its context.
+    """
+
+    def __init__(self, request, name, description, results):
+        self._id = request.id
+        self._uri = request.uri
+        self._tags = request.tags
+        self._instruction = request.instruction
+        self._name = name
+        self._description = description
+        self._results = results
+
+
+def live():
+    """
+    Obtain the total size of the objects the garbage collector tracks, and
+    how many of them are InheritedDicts.
+    """
+    gc.collect()
+    objects = gc.get_objects()
+    size = sum(sys.getsizeof(obj) for obj in objects)
+    forks = sum(1 for obj in objects if type(obj) is InheritedDict)
+    return size, forks
+
+
+def measure(config, matches):
+    """
+    Scrape matches pairs, each with two children, and print bytes per
+    Result kept.
+    """
+    if config == 'dict':
+        scraper.Result = DictResult
+        scraper.DoneFind = DictDoneFind
+    keep_context = config != 'slots-no-context'
+
+    input = ' '.join('flower%s:color%s' % (i, i) for i in xrange(matches))
+    s = Scraper(keep_context=keep_context)
+    s.scrape(INSTRUCTION, input=input[:100])
+
+    before, forks_before = live()
+    resp = s.scrape(INSTRUCTION, input=input)
+    after, forks_after = live()
+
+    results = len(resp._results) * 3
+    print '%-18s %8.1f bytes/result %8d live tag dicts' % (
+        config, float(after - before) / results, forks_after - forks_before)
+
+
+def main():
+    if len(sys.argv) > 2:
+        measure(sys.argv[2], int(sys.argv[1]))
+        return
+
+    matches = sys.argv[1] if len(sys.argv) > 1 else '100000'
+    for config in CONFIGS:
+        subprocess.check_call([sys.executable, os.path.abspath(__file__),
+                               matches, config])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time tag lookups through deep chains of InheritedDicts.
+
+Each find match forks its tags, so the tags of a deeply nested template
+are a chain with one InheritedDict per level.  This times looking up a
+tag from the top of the chain, a tag that is missing, and rendering a
+template with both, against the chain walk InheritedDict used to do.
+
+    python benchmarks/tag_lookup.py [depth]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pycaustic.templates import InheritedDict, compile_template
+
+LOOKUPS = 100000
+
+
+class WalkingDict(object):
+    """
+    InheritedDict's lookup before its keys were cached.
+    """
+
+    def __init__(self, parent):
+        self._parent = parent
+        self._this = dict()
+
+    def __setitem__(self, k, v):
+        self._this[k] = v
+
+    def __getitem__(self, k):
+        try:
+            return self._this.__getitem__(k)
+        except KeyError:
+            return self._parent.__getitem__(k)
+
+
+def chain(cls, depth):
+    """
+    Fork tags depth times, as nested finds do, setting a tag at each level.
+    """
+    tags = cls({'page': '1'})
+    for i in xrange(depth):
+        tags = cls(tags)
+        tags['level%s' % i] = str(i)
+    return tags
+
+
+def lookup(tags, key):
+    try:
+        tags[key]
+    except KeyError:
+        pass
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    template = compile_template('/items?page={{page}}&level={{level0}}')
+    print 'depth %s, %s lookups' % (depth, LOOKUPS)
+    for cls in (WalkingDict, InheritedDict):
+        tags = chain(cls, depth)
+        for label, fn in (('top tag', lambda: lookup(tags, 'page')),
+                          ('missing tag', lambda: lookup(tags, 'missing')),
+                          ('render', lambda: template.render(tags))):
+            seconds = min(timeit.repeat(fn, number=LOOKUPS, repeat=3))
+            print '%-14s %-12s %8.1f ns' % (cls.__name__, label,
+                                            seconds / LOOKUPS * 1e9)
+
+if __name__ == '__main__':
+    main()
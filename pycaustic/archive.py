@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import urllib
+import urlparse
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .cache import LRUCache
+from .errors import ArchiveError, ArchiveMissError
+from .mapped import MappedFile
+
+# Compressed bytes read at a time while splitting gzip members.
+CHUNK_SIZE = 65536
+
+# Headers that no longer apply once a recorded body is decoded.
+_TRANSFER_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+# The last gzip member read that holds several records, by (path, offset),
+# so that reading its records in order decompresses it once.
+_MEMBER_CACHE = LRUCache(maxsize=1)
+
+
+def url_key(url):
+    """
+    Normalize a URL for lookup in an Archive.  The scheme and host are
+    lowercased, default ports and fragments dropped, trailing slashes
+    stripped from the path, and the query sorted.
+    """
+    parts = urlparse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rpartition(':')[2]) in (('http', '80'), ('https', '443')):
+        netloc = netloc.rpartition(':')[0]
+    path = parts.path.rstrip('/') or '/'
+    query = urllib.urlencode(sorted(urlparse.parse_qsl(parts.query, True)))
+    return urlparse.urlunsplit((scheme, netloc, path, query, ''))
+
+
+def _dechunk(body):
+    """
+    Join the chunks of a body sent with chunked transfer encoding.
+    """
+    parts = []
+    pos = 0
+    while True:
+        line_end = body.find('\r\n', pos)
+        if line_end == -1:
+            raise ArchiveError("Truncated chunked body")
+        try:
+            size = int(body[pos:line_end].split(';')[0], 16)
+        except ValueError:
+            raise ArchiveError("Bad chunk size %r" % body[pos:line_end])
+        if size == 0:
+            return ''.join(parts)
+        start = line_end + 2
+        parts.append(body[start:start + size])
+        pos = start + size + 2
+
+
+def _decode(body, chunked, encoding):
+    if chunked:
+        body = _dechunk(body)
+    if encoding == 'gzip':
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        body = zlib.decompress(body)
+    return body
+
+
+class _Member(object):
+    """
+    A gzip member of a file, which is decompressed when it is read.
+
+    WARCs normally compress each record as its own member.  A member that
+    holds several records is kept once it is read, until another such
+    member is, so reading its records in order only decompresses it once.
+    Read out of order, each record may decompress the whole member again.
+    """
+
+    def __init__(self, path, offset):
+        self._path = path
+        self._offset = offset
+        self._records = 0
+
+    def read(self):
+        key = (self._path, self._offset)
+        if self._records > 1:
+            data = _MEMBER_CACHE.get(key)
+            if data is not None:
+                return data
+        with open(self._path, 'rb') as fp:
+            fp.seek(self._offset)
+            data = next(_members(fp))[1]
+        if self._records > 1:
+            _MEMBER_CACHE.set(key, data)
+        return data
+
+
+def _members(fp):
+    """
+    Obtain a generator of (offset, data) for each gzip member in a file,
+    from its current position.  WARCs compress each record as a member, so
+    records can be read again from their member's offset.  Raises
+    ArchiveError if the data isn't gzip.
+    """
+    offset = fp.tell()
+    pending = ''
+    while True:
+        data = pending or fp.read(CHUNK_SIZE)
+        if not data:
+            return
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        parts = []
+        consumed = 0
+        try:
+            while True:
+                parts.append(decompressor.decompress(data))
+                pending = decompressor.unused_data
+                consumed += len(data) - len(pending)
+                if pending:
+                    break
+                data = fp.read(CHUNK_SIZE)
+                if not data:
+                    parts.append(decompressor.flush())
+                    break
+        except zlib.error as e:
+            raise ArchiveError("Bad gzip member at offset %s: %s" % (offset, e))
+        yield offset, ''.join(parts)
+        offset += consumed
+
+
+def _warc_blocks(data):
+    """
+    Obtain a generator of (headers, start, end) for each record in WARC
+    data, which is a string or mmap.  Header names are lowercased, and the
+    record's block is data[start:end].
+    """
+    pos = 0
+    size = len(data)
+    while True:
+        while data[pos:pos + 2] == '\r\n':
+            pos += 2
+        if pos >= size:
+            return
+        head_end = data.find('\r\n\r\n', pos)
+        if head_end == -1 or data[pos:pos + 5] != 'WARC/':
+            raise ArchiveError("No WARC record at offset %s" % pos)
+        headers = {}
+        for line in data[pos:head_end].split('\r\n')[1:]:
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+        try:
+            length = int(headers['content-length'])
+        except (KeyError, ValueError):
+            raise ArchiveError("WARC record at offset %s has no length" % pos)
+        start = head_end + 4
+        yield headers, start, start + length
+        pos = start + length
+
+
+class Record(object):
+    """
+    A stored response to a URL.  Only where its body is kept is known until
+    the body is asked for.
+    """
+    __slots__ = ('_url', '_status', '_reason', '_headers', '_source',
+                 '_start', '_end', '_chunked', '_encoding')
+
+    def __init__(self, url, status, reason, headers, source, start=0,
+                 end=None, chunked=False, encoding=None):
+        self._url = url
+        self._status = status
+        self._reason = reason
+        self._headers = headers
+        self._source = source
+        self._start = start
+        self._end = end
+        self._chunked = chunked
+        self._encoding = encoding
+
+    def __repr__(self):
+        return 'Record(%r, %r)' % (self._url, self._status)
+
+    @property
+    def url(self):
+        return self._url
+
+    @property
+    def status(self):
+        return self._status
+
+    @property
+    def reason(self):
+        return self._reason
+
+    @property
+    def headers(self):
+        """
+        The response headers, less those about how the body was sent.
+        """
+        return self._headers
+
+    @property
+    def body(self):
+        """
+        The body as a string, read from disk and decoded.
+        """
+        if isinstance(self._source, _Member):
+            body = self._source.read()[self._start:self._end]
+        else:
+            with open(self._source, 'rb') as fp:
+                fp.seek(self._start)
+                body = fp.read() if self._end is None else fp.read(self._end - self._start)
+        return _decode(body, self._chunked, self._encoding)
+
+    @property
+    def input(self):
+        """
+        The body to scrape: a MappedFile if it can be read from disk as it
+        is, or else the decoded body.
+        """
+        if isinstance(self._source, _Member) or self._chunked or self._encoding:
+            return self.body
+        length = None if self._end is None else self._end - self._start
+        return MappedFile(self._source, self._start, length)
+
+
+def _warc_records(data, source):
+    """
+    Obtain a generator of the Records of the responses and resources in WARC
+    data.  Other records, such as requests, are skipped.
+    """
+    for headers, start, end in _warc_blocks(data):
+        warc_type = headers.get('warc-type')
+        url = headers.get('warc-target-uri', '').strip('<>')
+        if warc_type == 'resource':
+            content_type = headers.get('content-type')
+            yield Record(url, 200, 'OK',
+                         {'Content-Type': content_type} if content_type else {},
+                         source, start, end)
+        elif warc_type == 'response':
+            http_end = data.find('\r\n\r\n', start, end)
+            if http_end == -1:
+                raise ArchiveError("Response to %s has no HTTP headers" % url)
+            lines = data[start:http_end].split('\r\n')
+            status_line = lines[0].split(' ', 2)
+            try:
+                status = int(status_line[1])
+            except (IndexError, ValueError):
+                raise ArchiveError("Bad status line %r for %s" % (lines[0], url))
+            reason = status_line[2] if len(status_line) > 2 else ''
+
+            response_headers = {}
+            chunked = False
+            encoding = None
+            for line in lines[1:]:
+                key, _, value = line.partition(':')
+                key, value = key.strip(), value.strip()
+                lower = key.lower()
+                if lower == 'transfer-encoding':
+                    chunked = value.lower() == 'chunked'
+                elif lower == 'content-encoding':
+                    encoding = value.lower() if value.lower() in ('gzip', 'deflate') else None
+                if lower not in _TRANSFER_HEADERS:
+                    response_headers[key] = value
+            yield Record(url, status, reason, response_headers, source,
+                         http_end + 4, end, chunked, encoding)
+
+
+def warc_records(path):
+    """
+    Obtain a generator of the Records in a WARC file, which may be
+    compressed with gzip.  Only offsets are kept, not bodies.
+    """
+    with open(path, 'rb') as fp:
+        magic = fp.read(2)
+        fp.seek(0)
+        if magic == '\x1f\x8b':
+            for offset, data in _members(fp):
+                member = _Member(path, offset)
+                for record in _warc_records(data, member):
+                    member._records += 1
+                    yield record
+        else:
+            if not os.fstat(fp.fileno()).st_size:
+                return
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for record in _warc_records(data, path):
+                    yield record
+            finally:
+                data.close()
+
+
+def directory_records(directory, base_url=None):
+    """
+    Obtain a generator of Records of each file under a directory.  A file's
+    URL is its path from the directory, resolved against base_url, or else
+    its file URL.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if base_url is None:
+                url = urlparse.urljoin('file:', urllib.pathname2url(os.path.abspath(path)))
+            else:
+                relpath = os.path.relpath(path, directory).replace(os.path.sep, '/')
+                url = urlparse.urljoin(base_url, urllib.quote(relpath))
+            yield Record(url, 200, 'OK', {}, path)
+
+
+class Archive(object):
+    """
+    Stored responses by URL.  A scraper given an Archive loads from it
+    instead of the network, and `items` supplies its pages to
+    `Scraper.scrape_many`.  URLs are looked up by their `url_key`, and a
+    URL stored more than once is looked up as its last record.
+    """
+
+    def __init__(self, records=()):
+        self._records = []
+        self._by_url = {}
+        for record in records:
+            self.add(record)
+
+    @classmethod
+    def from_warc(cls, *paths):
+        """
+        Obtain an Archive of the responses in WARC files.
+        """
+        archive = cls()
+        for path in paths:
+            for record in warc_records(path):
+                archive.add(record)
+        return archive
+
+    @classmethod
+    def from_directory(cls, directory, base_url=None):
+        """
+        Obtain an Archive of the files under a directory.
+        """
+        return cls(directory_records(directory, base_url))
+
+    def add(self, record):
+        self._records.append(record)
+        self._by_url[url_key(record.url)] = record
+
+    def get(self, url):
+        """
+        Obtain the Record for a URL, or None.
+        """
+        return self._by_url.get(url_key(url))
+
+    def response(self, opts):
+        """
+        Obtain a requests.Response for a request built from opts from its
+        Record, whatever its method.  Raises ArchiveMissError if there is
+        none.
+        """
+        record = self.get(opts['url'])
+        if record is None:
+            raise ArchiveMissError("No record of '%s' in archive" % opts['url'])
+        resp = requests.models.Response()
+        resp.status_code = record.status
+        resp.reason = record.reason
+        resp.url = record.url
+        resp.headers = CaseInsensitiveDict(record.headers)
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp._content = record.body
+        return resp
+
+    def items(self, status=200):
+        """
+        Obtain a generator of ({'url': url}, input) for every record with
+        the status, as items for `Scraper.scrape_many`.
+        """
+        for record in self._records:
+            if record.status == status:
+                yield {'url': record.url}, record.input
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+import Queue
+import cPickle
+
+from .concurrency import ThreadPool
+from .mapped import MappedFile
+from .serialize import dumps
+
+BACKENDS = ('thread', 'gevent', 'process')
+
+# The plan, tags and force of a process backend's worker, compiled once by
+# `init_process`.
+_WORKER = None
+
+
+class Item(object):
+    """
+    The outcome of scraping one input of a batch.
+    """
+    __slots__ = ('_index', '_response', '_error')
+
+    def __init__(self, index, response=None, error=None):
+        self._index = index
+        self._response = response
+        self._error = error
+
+    def __repr__(self):
+        if self._error is not None:
+            return 'Item(%s, error=%r)' % (self._index, self._error)
+        return 'Item(%s)' % self._index
+
+    @property
+    def index(self):
+        """
+        The position of the input in the batch.
+        """
+        return self._index
+
+    @property
+    def response(self):
+        """
+        The Response or list of Responses, or None if the scrape raised.
+        From the process backend, this is the JSON of the Responses.
+        """
+        return self._response
+
+    @property
+    def error(self):
+        """
+        The exception the scrape raised, or None.
+        """
+        return self._error
+
+    @property
+    def ok(self):
+        return self._error is None
+
+
+def split_input(item, tags):
+    """
+    Obtain the tags and input to scrape for an item of a batch, which is an
+    input, a dict of tags, or a (tags, input) tuple.  Tags are laid over a
+    copy of the batch's tags.  A MappedFile input is mapped, and its buffer
+    scraped.
+
+    :returns: (tags, input)
+    """
+    if isinstance(item, tuple):
+        item_tags, input = item
+    elif isinstance(item, dict):
+        item_tags, input = item, ''
+    else:
+        item_tags, input = None, item
+    if isinstance(input, MappedFile):
+        input = input.open()
+    merged = dict(tags) if tags else {}
+    if item_tags:
+        merged.update(item_tags)
+    return merged, input
+
+
+def _call(scrape, index, item):
+    """
+    Scrape an item, catching anything it raises.
+
+    :returns: (index, response, error)
+    """
+    try:
+        return index, scrape(index, item), None
+    except Exception as e:
+        return index, None, e
+
+
+def _call_in_process(scrape, index, pickled_item):
+    """
+    `_call` in a worker process, on an item pickled by the parent.  The
+    outcome is pickled here, so that a result that can't be pickled is
+    reported as an error rather than lost, leaving the batch waiting.
+
+    :returns: The pickled (index, response, error)
+    """
+    try:
+        item = cPickle.loads(pickled_item)
+    except Exception as e:
+        outcome = (index, None, e)
+    else:
+        outcome = _call(scrape, index, item)
+    try:
+        return cPickle.dumps(outcome, cPickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        error = outcome[2] if outcome[2] is not None else e
+        return cPickle.dumps((index, None, Exception(repr(error))),
+                             cPickle.HIGHEST_PROTOCOL)
+
+
+def _unpickle_outcome(index, pickled):
+    """
+    Obtain the (index, response, error) a worker process pickled.
+    """
+    try:
+        return cPickle.loads(pickled)
+    except Exception as e:
+        return index, None, e
+
+
+def init_process(instruction, uri, tags, force, settings):
+    """
+    Compile the instruction of a batch once in each worker process, with a
+    Scraper built from the settings of the one that started the batch.  If
+    that fails, every item scraped by the worker fails with the error, so
+    that the pool doesn't keep starting workers.
+    """
+    global _WORKER
+    from .scraper import Scraper
+    try:
+        settings = dict(settings)
+        pool_size = settings.pop('pool_size')
+        if pool_size is not None:
+            settings['pool'] = ThreadPool(pool_size)
+        plan = Scraper(**settings).compile(instruction, uri=uri)
+        _WORKER = (plan, tags, force, None)
+    except Exception as e:
+        _WORKER = (None, tags, force, e)
+
+
+def scrape_in_process(index, item):
+    """
+    Scrape an item with the plan compiled by `init_process`.
+
+    :returns: The JSON of the Response or list of Responses
+    """
+    plan, tags, force, error = _WORKER
+    if error is not None:
+        raise error
+    item_tags, input = split_input(item, tags)
+    return dumps(plan.run(item_tags, input, force, id=index), truncated=False)
+
+
+def _submitter(backend, workers, scrape, done, initializer, initargs):
+    """
+    Start a pool for a backend.
+
+    :returns: (submit, close).  submit(index, item) scrapes an item in the
+              pool and puts its (index, response, error) in done.
+    """
+    if backend == 'thread':
+        pool = ThreadPool(workers)
+        return (lambda index, item: pool.spawn(
+                    lambda: done.put(_call(scrape, index, item))),
+                pool.close)
+    elif backend == 'gevent':
+        import gevent.pool
+        pool = gevent.pool.Pool(workers)
+        return (lambda index, item: pool.spawn(
+                    lambda: done.put(_call(scrape, index, item))),
+                pool.join)
+    elif backend == 'process':
+        import multiprocessing
+
+        pool = multiprocessing.Pool(workers, initializer, initargs)
+
+        def submit(index, item):
+            # Items are pickled here, as one that can't be would otherwise
+            # never come back.
+            try:
+                pickled = cPickle.dumps(item, cPickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                done.put((index, None, e))
+                return
+            pool.apply_async(_call_in_process, (scrape, index, pickled),
+                             callback=lambda outcome: done.put(
+                                 _unpickle_outcome(index, outcome)))
+
+        def close():
+            pool.terminate()
+            pool.join()
+
+        return submit, close
+    raise ValueError("Unknown batch backend '%s', must be one of %s" % (
+        backend, ', '.join(BACKENDS)))
+
+
+def run_batch(scrape, items, workers=10, backend='thread', ordered=True,
+              initializer=None, initargs=()):
+    """
+    Call scrape on every item in workers, keeping only a few more items in
+    flight than there are workers.  Anything scrape raises is reported in
+    the item's Item rather than stopping the batch.
+
+    :param: scrape A function of an item's index and the item.  For the
+            process backend, it must be a module-level function.
+    :param: items An iterable of items
+    :param: (optional) workers The number of items scraped at once
+    :param: (optional) backend 'thread', 'gevent' or 'process'
+    :param: (optional) ordered Whether to yield Items in the order of items,
+            rather than as they are finished
+    :param: (optional) initializer Called with initargs in each worker
+            process when it starts
+
+    :returns: generator of Item
+    """
+    if workers < 1:
+        raise ValueError("Batches need at least 1 worker")
+    if backend == 'gevent':
+        import gevent.queue
+        done = gevent.queue.Queue()
+    else:
+        done = Queue.Queue()
+    submit, close = _submitter(backend, workers, scrape, done,
+                               initializer, initargs)
+    window = workers * 2
+
+    items = enumerate(items)
+    exhausted = False
+    in_flight = 0
+    waiting = {}
+    next_index = 0
+    try:
+        while True:
+            while not exhausted and in_flight + len(waiting) < window:
+                try:
+                    index, item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                submit(index, item)
+                in_flight += 1
+
+            if in_flight == 0:
+                return
+
+            finished = Item(*done.get())
+            in_flight -= 1
+            if not ordered:
+                yield finished
+                continue
+
+            # Hold Items finished out of order until those before them are.
+            waiting[finished.index] = finished
+            while next_index in waiting:
+                yield waiting.pop(next_index)
+                next_index += 1
+    finally:
+        close()
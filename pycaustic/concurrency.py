@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import sys
+import threading
+import Queue
+
+# ThreadPools with running threads.  They are closed at exit, so that their
+# threads aren't left waiting on the queue as the interpreter shuts down.
+_OPEN_POOLS = set()
+
+
+class Task(object):
+    """
+    A function call spawned in a ThreadPool.  Like a greenlet, its result is
+    obtained from `get`.
+    """
+
+    def __init__(self, fn, args, kwargs):
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._started = False
+        self._done = threading.Event()
+        self._value = None
+        self._exc_info = None
+
+    def run(self):
+        """
+        Run the call, unless it has already been started elsewhere.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        try:
+            self._value = self._fn(*self._args, **self._kwargs)
+        except BaseException:
+            self._exc_info = sys.exc_info()
+        finally:
+            self._fn = self._args = self._kwargs = None
+            self._done.set()
+
+    def ready(self):
+        return self._done.is_set()
+
+    def get(self):
+        """
+        Obtain the result of the call, re-raising anything it raised.  If no
+        thread has started the call yet, it is run in the calling thread.
+        """
+        self.run()
+        self._done.wait()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._value
+
+
+class ThreadPool(object):
+    """
+    A fixed number of threads that can be used in place of a gevent pool,
+    for processes that cannot be monkey-patched.
+
+    Nested spawns cannot deadlock the pool: a thread waiting on a Task that
+    has not started runs it itself.
+
+    Threads are started on the first spawn, and stopped by `close`, or when
+    the pool is used as a context manager.  Pools still open at exit are
+    closed then.
+    """
+
+    def __init__(self, size=10):
+        if size < 1:
+            raise ValueError("ThreadPool size must be at least 1")
+        self._size = size
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            task.run()
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self._size:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            _OPEN_POOLS.add(self)
+
+    def spawn(self, fn, *args, **kwargs):
+        """
+        Call fn in the pool.
+
+        :returns: Task
+        """
+        if len(self._threads) < self._size:
+            self._start()
+        task = Task(fn, args, kwargs)
+        self._queue.put(task)
+        return task
+
+    def close(self):
+        """
+        Stop the pool's threads once queued tasks are finished.
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+            _OPEN_POOLS.discard(self)
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    @property
+    def size(self):
+        return self._size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@atexit.register
+def _close_pools():
+    for pool in list(_OPEN_POOLS):
+        pool.close()
+
+
+class _Flight(object):
+    """
+    A call in progress, and the callers waiting on it.
+    """
+
+    def __init__(self, event):
+        self.event = event
+        self.value = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical calls that are in progress at the same time, so
+    that callers with the same key share a single call and its result.
+
+    With a gevent pool, pass green=True so that waiting yields to other
+    greenlets rather than blocking the thread.
+    """
+
+    def __init__(self, green=False):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._coalesced = 0
+        self._green = green
+
+        if green:
+            import gevent.event
+            self._event = gevent.event.Event
+        else:
+            self._event = threading.Event
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Call fn, unless a call with key is already in progress, in which
+        case wait for and share its result.  Anything the call raises is
+        re-raised to every caller.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(self._event())
+                self._calls += 1
+            else:
+                self._coalesced += 1
+
+        if leader:
+            try:
+                flight.value = fn(*args, **kwargs)
+            except BaseException:
+                flight.exc_info = sys.exc_info()
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.event.set()
+        else:
+            flight.event.wait()
+
+        if flight.exc_info is not None:
+            raise flight.exc_info[0], flight.exc_info[1], flight.exc_info[2]
+        return flight.value
+
+    @property
+    def coalesced(self):
+        return self._coalesced
+
+    @property
+    def green(self):
+        """
+        Whether waiting yields to other greenlets.
+        """
+        return self._green
+
+    def stats(self):
+        """
+        Obtain a dict of how many calls were made, how many were coalesced
+        into another, and how many are in progress.
+        """
+        with self._lock:
+            return {
+                'calls': self._calls,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._flights)
+            }
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from lxml import etree
+
+from .cache import LRUCache
+from .mapped import BUFFER_TYPES, as_bytes
+
+_MISSING = object()
+
+
+class DocumentCache(object):
+    """
+    Parsed documents keyed by the input they were parsed from, so that
+    sibling and nested instructions over the same input share one parse.
+    Parsed documents must not be modified.
+
+    A faster JSON decoder, such as `ujson.loads`, may be supplied as
+    json_loads.  It should raise ValueError on invalid input.
+
+    Buffer inputs are copied into a string once, the first time one is
+    parsed, and the copy is reused for as long as the buffer is cached.
+    """
+
+    def __init__(self, maxsize=4, json_loads=None):
+        self._html = LRUCache(maxsize=maxsize)
+        self._json = LRUCache(maxsize=maxsize)
+        # (buffer, string) by the buffer's id.  The buffer is kept, so that
+        # its id can't be reused by another while it is cached.
+        self._copies = LRUCache(maxsize=maxsize)
+        self._json_loads = json.loads if json_loads is None else json_loads
+
+    def _bytes(self, input):
+        """
+        Obtain a string of an input, copying a buffer only once.
+        """
+        if not isinstance(input, BUFFER_TYPES):
+            return input
+        copy = self._copies.get(id(input))
+        if copy is None or copy[0] is not input:
+            copy = (input, as_bytes(input))
+            self._copies.set(id(input), copy)
+        return copy[1]
+
+    def html(self, input):
+        """
+        Obtain the lxml tree for an HTML input.
+        """
+        input = self._bytes(input)
+        tree = self._html.get(input)
+        if tree is None:
+            tree = etree.HTML(input)
+            self._html.set(input, tree)
+        return tree
+
+    def json(self, input):
+        """
+        Obtain the decoded value of a JSON input.  Raises ValueError if the
+        input is not JSON.
+        """
+        input = self._bytes(input)
+        value = self._json.get(input, _MISSING)
+        if value is _MISSING:
+            value = self._json_loads(input)
+            self._json.set(input, value)
+        return value
+
+    def stats(self):
+        """
+        Obtain a dict of counters for each kind of document.
+        """
+        return {
+            'html': self._html.stats(),
+            'json': self._json.stats()
+        }
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from .errors import LoadAbortedError
+
+# Content types, or content type suffixes, that can be scraped as text.
+TEXT_TYPES = ('text/', 'application/json', 'application/javascript',
+              'application/x-javascript', 'application/xml',
+              'application/xhtml+xml', '+json', '+xml')
+
+
+def is_text(content_type):
+    """
+    Determine whether a Content-Type header names a text type.  A missing
+    content type could be anything, so is assumed to be text.
+    """
+    if not content_type:
+        return True
+    media_type = content_type.split(';')[0].strip().lower()
+    return any(media_type.startswith(t) or media_type.endswith(t)
+               for t in TEXT_TYPES)
+
+
+class DownloadPolicy(object):
+    """
+    How response bodies are read.  Bodies are streamed, so that a load can
+    be abandoned as soon as it is known to be unwanted: once it is over
+    max_size bytes, or, with text_only=True, once its headers show it isn't
+    text.
+
+    A response that was read only in part is marked with `partial = True`,
+    so that it isn't cached.
+    """
+
+    def __init__(self, max_size=None, text_only=False, chunk_size=65536):
+        self._max_size = max_size
+        self._text_only = text_only
+        self._chunk_size = chunk_size
+
+    def _check_headers(self, resp):
+        content_type = resp.headers.get('Content-Type')
+        if self._text_only and not is_text(content_type):
+            raise LoadAbortedError("%s is not text, but %s" % (
+                resp.url, content_type))
+
+        length = resp.headers.get('Content-Length')
+        if self._max_size is not None and length and length.isdigit() \
+           and int(length) > self._max_size:
+            raise LoadAbortedError("%s is %s bytes, over the limit of %s" % (
+                resp.url, length, self._max_size))
+
+    def read(self, resp, stop=None):
+        """
+        Read the body of a streamed requests.Response, which is then
+        available from its `content` as usual.
+
+        :param: resp The streamed response
+        :param: stop A function called with the body so far, as a
+                bytearray, after each chunk.  It returns True once the rest
+                is not needed.
+
+        Raises LoadAbortedError if the response is unwanted.
+        """
+        try:
+            self._check_headers(resp)
+            body = bytearray()
+            partial = False
+            for chunk in resp.iter_content(self._chunk_size):
+                body.extend(chunk)
+                if self._max_size is not None and len(body) > self._max_size:
+                    raise LoadAbortedError("%s is over the limit of %s bytes" % (
+                        resp.url, self._max_size))
+                if stop is not None and stop(body):
+                    partial = True
+                    break
+        finally:
+            resp.close()
+
+        resp._content = str(body)
+        resp._content_consumed = True
+        resp.partial = partial
+        return resp
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def text_only(self):
+        return self._text_only
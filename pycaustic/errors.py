@@ -42,3 +42,43 @@ class SchemeSecurityError(CausticError):
     An error that is thrown when an unsafe scheme conversion is attempted
     (any scheme to local).
     """
+
+
+class CacheMissError(CausticError):
+    """
+    An error that is thrown when a response cache in replay mode does not
+    have the response to a load.
+    """
+    pass
+
+
+class CacheStoreError(CausticError):
+    """
+    An error that is thrown when a response can't be stored in a cache's
+    backend.  Response caches that record raise it; others don't store the
+    response.
+    """
+    pass
+
+
+class LoadAbortedError(CausticError):
+    """
+    An error that is thrown when a load's response is abandoned because it
+    is too large, or not text.
+    """
+    pass
+
+
+class ArchiveError(CausticError):
+    """
+    An error that is thrown when an archive can't be read.
+    """
+    pass
+
+
+class ArchiveMissError(CausticError):
+    """
+    An error that is thrown when a scraper loading from an archive has no
+    record of a load's URL.
+    """
+    pass
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from email.utils import parsedate_tz, mktime_tz
+
+import requests
+from requests.cookies import cookiejar_from_dict
+from requests.structures import CaseInsensitiveDict
+
+from .cache import LRUCache
+from .errors import CacheMissError, CacheStoreError
+from .instructions import MAX_AGE_PATTERN
+
+
+def request_key(opts):
+    """
+    Obtain a key identifying a request built from opts by its method, URL,
+    body, headers, and cookies.
+    """
+    identity = json.dumps([opts.get('method', 'get').upper(),
+                           opts['url'],
+                           opts.get('data'),
+                           opts.get('headers') or {},
+                           opts.get('cookies') or {}],
+                          sort_keys=True)
+    return hashlib.sha1(identity).hexdigest()
+
+
+class MemoryBackend(object):
+    """
+    Keeps cached responses in a least-recently-used cache in memory.
+    """
+
+    def __init__(self, maxsize=256):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, entry):
+        self._cache.set(key, entry)
+
+    def pop(self, key):
+        self._cache.pop(key)
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class DiskBackend(object):
+    """
+    Keeps cached responses in a directory, one file per response, so that
+    they survive between runs.  Each file is a line of JSON metadata
+    followed by the raw body, which is compressed with zlib if compress is
+    True.  Header bytes that aren't UTF-8 are stored as Latin-1, so they
+    read back as the characters with those codes.
+    """
+
+    def __init__(self, directory, compress=False):
+        self._directory = directory
+        self._compress = compress
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self._directory, key)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                entry = json.loads(f.readline())
+                entry['body'] = f.read()
+            if entry.pop('compressed', False):
+                entry['body'] = zlib.decompress(entry['body'])
+        except (IOError, OSError, ValueError, zlib.error):
+            return None
+        return entry
+
+    def set(self, key, entry):
+        meta = dict(entry)
+        body = meta.pop('body')
+        if self._compress:
+            body = zlib.compress(body)
+            meta['compressed'] = True
+        try:
+            try:
+                line = json.dumps(meta)
+            except UnicodeDecodeError:
+                line = json.dumps(meta, encoding='latin-1')
+        except (TypeError, ValueError) as e:
+            raise CacheStoreError("Can't store response from %s: %s" % (
+                meta.get('url'), e))
+
+        # Write and rename, so readers never see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(prefix='.', dir=self._directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(line)
+            f.write('\n')
+            f.write(body)
+        os.rename(tmp_path, self._path(key))
+
+    def pop(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self._directory):
+            self.pop(name)
+
+    def __len__(self):
+        return len([name for name in os.listdir(self._directory)
+                    if not name.startswith('.')])
+
+    @property
+    def directory(self):
+        return self._directory
+
+
+class ResponseCache(object):
+    """
+    Caches the responses to `load` instructions.
+
+    Responses are keyed on the method, URL, body, headers, and cookies of
+    the request.  They are fresh for their Cache-Control max-age, or until
+    their Expires date, or else for default_ttl seconds.  Stale responses
+    are revalidated with their ETag or Last-Modified, so an unchanged page
+    is not downloaded again.  `no-store` responses, responses that `Vary`
+    on everything, and anything but a 200 are not cached.
+
+    With replay=True, only cached responses are used, fresh or not, and
+    the network is never touched.  Loads that are not in the cache fail.
+
+    With record=True, every load goes to the network, and every response
+    is stored whatever its status or Cache-Control, so that it can be
+    replayed later.  A response that can't be stored raises
+    CacheStoreError, rather than failing later when it is replayed.
+
+    A scraper recording or replaying with a ResponseCache loads remote
+    instructions through it too.
+    """
+
+    def __init__(self, backend=None, default_ttl=0, replay=False, record=False):
+        if replay and record:
+            raise ValueError("A ResponseCache can't both record and replay")
+        self._backend = MemoryBackend() if backend is None else backend
+        self._default_ttl = default_ttl
+        self._replay = replay
+        self._record = record
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._revalidations = 0
+        self._not_modified = 0
+        self._stores = 0
+
+    def __getstate__(self):
+        # Pickled for worker processes, which need their own lock.
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def key(self, opts):
+        """
+        Obtain the cache key for a request built from opts.
+        """
+        return request_key(opts)
+
+    def _freshness(self, resp, now):
+        """
+        Obtain how many seconds a response is fresh for, or None if it may
+        not be stored.
+        """
+        cache_control = resp.headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control or resp.headers.get('Vary') == '*':
+            return None
+        elif 'no-cache' in cache_control:
+            return 0
+        max_age = MAX_AGE_PATTERN.search(cache_control)
+        if max_age:
+            return int(max_age.group(1))
+        expires = parsedate_tz(resp.headers.get('Expires', ''))
+        if expires:
+            return max(0, mktime_tz(expires) - now)
+        return self._default_ttl
+
+    def _entry(self, resp, expires):
+        return {
+            'status': resp.status_code,
+            'reason': resp.reason,
+            'url': resp.url,
+            'encoding': resp.encoding,
+            'headers': dict(resp.headers),
+            'cookies': resp.cookies.get_dict(),
+            'expires': expires,
+            'body': resp.content
+        }
+
+    def _response(self, entry):
+        """
+        Rebuild a requests.Response from a cache entry.
+        """
+        resp = requests.models.Response()
+        resp.status_code = entry['status']
+        resp.reason = entry['reason']
+        resp.url = entry['url']
+        resp.encoding = entry['encoding']
+        resp.headers = CaseInsensitiveDict(entry['headers'])
+        resp.cookies = cookiejar_from_dict(entry['cookies'])
+        resp._content = entry['body']
+        return resp
+
+    def fetch(self, opts, send):
+        """
+        Obtain the response to a request built from opts, from the cache if
+        possible.
+
+        :param: opts The keyword arguments for a requests.Request
+        :param: send A function taking opts and returning a
+                requests.Response from the network
+
+        Raises CacheMissError in replay mode if the response is not cached.
+        """
+        key = self.key(opts)
+        if self._record:
+            return self._record_fetch(key, opts, send)
+        entry = self._backend.get(key)
+        now = time.time()
+
+        if entry is not None and (self._replay or now < entry['expires']):
+            self._count('_hits')
+            return self._response(entry)
+        self._count('_misses')
+        if self._replay:
+            raise CacheMissError("No cached response for %s %s" % (
+                opts.get('method', 'get').upper(), opts['url']))
+
+        if entry is not None:
+            self._count('_revalidations')
+            cached_headers = CaseInsensitiveDict(entry['headers'])
+            headers = dict(opts.get('headers') or {})
+            if cached_headers.get('ETag'):
+                headers['If-None-Match'] = cached_headers['ETag']
+            if cached_headers.get('Last-Modified'):
+                headers['If-Modified-Since'] = cached_headers['Last-Modified']
+            opts = dict(opts, headers=headers)
+
+        resp = send(opts)
+        freshness = self._freshness(resp, now)
+
+        if entry is not None and resp.status_code == 304:
+            self._count('_not_modified')
+            cached_headers.update(resp.headers)
+            resp = self._response(dict(entry, headers=dict(cached_headers)))
+        elif resp.status_code != 200:
+            return resp
+
+        if getattr(resp, 'partial', False):
+            # Only some of the body was read.
+            return resp
+        elif freshness is None:
+            self._backend.pop(key)
+        else:
+            try:
+                self._backend.set(key, self._entry(resp, now + freshness))
+            except CacheStoreError:
+                return resp
+            self._count('_stores')
+        return resp
+
+    def _record_fetch(self, key, opts, send):
+        """
+        Send a request and store its response, whatever it is.  A response
+        with only some of its body read doesn't replace one with all of it.
+        """
+        self._count('_misses')
+        resp = send(opts)
+        if getattr(resp, 'partial', False) and self._backend.get(key) is not None:
+            return resp
+        self._backend.set(key, self._entry(resp, time.time()))
+        self._count('_stores')
+        return resp
+
+    def clear(self):
+        self._backend.clear()
+        with self._lock:
+            self._hits = self._misses = self._revalidations = 0
+            self._not_modified = self._stores = 0
+
+    @property
+    def backend(self):
+        return self._backend
+
+    @property
+    def replay(self):
+        return self._replay
+
+    @replay.setter
+    def replay(self, replay):
+        self._replay = replay
+
+    @property
+    def record(self):
+        return self._record
+
+    @record.setter
+    def record(self, record):
+        self._record = record
+
+    def stats(self):
+        """
+        Obtain a dict of counters, including how many stale responses were
+        revalidated and how many of those were not modified.
+        """
+        return {
+            'size': len(self._backend),
+            'hits': self._hits,
+            'misses': self._misses,
+            'revalidations': self._revalidations,
+            'not_modified': self._not_modified,
+            'stores': self._stores
+        }
+
+
+def fixtures(directory, record=False):
+    """
+    Obtain a ResponseCache that records responses to a directory, or
+    replays them from it without touching the network.  Use it as a
+    scraper's cache to make scrapes repeatable offline.
+    """
+    return ResponseCache(DiskBackend(directory, compress=True),
+                         replay=not record, record=record)
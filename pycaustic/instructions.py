@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+import time
+
+from .cache import LRUCache
+from .errors import InvalidInstructionError
+
+MAX_AGE_PATTERN = re.compile(r'max-age\s*=\s*(\d+)')
+
+
+def _immutable(self, *args, **kwargs):
+    raise TypeError("Frozen instructions cannot be modified")
+
+
+class FrozenDict(dict):
+    """
+    A dict that cannot be modified.  Still passes isinstance(x, dict).
+    """
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self), ))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class FrozenList(list):
+    """
+    A list that cannot be modified.  Still passes isinstance(x, list).
+    """
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _immutable
+    __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = reverse = sort = _immutable
+
+    def __reduce__(self):
+        return (FrozenList, (list(self), ))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(instruction):
+    """
+    Obtain a deeply immutable copy of an instruction, which can be shared
+    without defensive copies.
+    """
+    if isinstance(instruction, FrozenDict) or isinstance(instruction, FrozenList):
+        return instruction
+    elif isinstance(instruction, dict):
+        return FrozenDict((k, freeze(v)) for k, v in instruction.iteritems())
+    elif isinstance(instruction, list):
+        return FrozenList(freeze(v) for v in instruction)
+    else:
+        return instruction
+
+
+class InstructionFileCache(object):
+    """
+    A least-recently-used cache of frozen instructions loaded from files.
+    An entry is reloaded when its file's mtime or size changes.
+    """
+
+    def __init__(self, maxsize=1024):
+        self._cache = LRUCache(maxsize=maxsize)
+        self._invalidations = 0
+
+    def load(self, path):
+        """
+        Obtain the frozen instruction in the JSON file at path.
+
+        Raises IOError or OSError if the file cannot be read, and ValueError
+        if it is not JSON.
+        """
+        stat = os.stat(path)
+        signature = (stat.st_mtime, stat.st_size)
+
+        cached = self._cache.get(path)
+        if cached is not None:
+            if cached[0] == signature:
+                return cached[1]
+            self._invalidations += 1
+
+        with open(path) as f:
+            instruction = freeze(json.load(f))
+        self._cache.set(path, (signature, instruction))
+        return instruction
+
+    def clear(self):
+        self._cache.clear()
+        self._invalidations = 0
+
+    @property
+    def maxsize(self):
+        return self._cache.maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize):
+        self._cache.maxsize = maxsize
+
+    def stats(self):
+        """
+        Obtain a dict of counters, including how many entries were reloaded
+        because their file changed.
+        """
+        stats = self._cache.stats()
+        stats['invalidations'] = self._invalidations
+        return stats
+
+
+class RemoteInstructionCache(object):
+    """
+    A least-recently-used cache of frozen instructions loaded over HTTP.
+
+    Entries are fresh for the response's Cache-Control max-age, but never
+    for longer than ttl seconds.  Stale entries are revalidated with their
+    ETag or Last-Modified, so an unchanged instruction is not downloaded
+    again.  `no-store` responses are not cached.
+
+    Requests time out after timeout seconds, unless `load` is given its own
+    timeout, which may also be a (connect, read) tuple.
+    """
+
+    def __init__(self, maxsize=256, ttl=300, timeout=30):
+        self._cache = LRUCache(maxsize=maxsize)
+        self._ttl = ttl
+        self._timeout = timeout
+        self._revalidations = 0
+        self._not_modified = 0
+
+    def _freshness(self, resp):
+        cache_control = resp.headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control:
+            return None
+        elif 'no-cache' in cache_control:
+            return 0
+        max_age = MAX_AGE_PATTERN.search(cache_control)
+        if max_age:
+            return min(int(max_age.group(1)), self._ttl)
+        return self._ttl
+
+    def load(self, session, url, timeout=None, responses=None):
+        """
+        Obtain the frozen instruction at url, using session for any request.
+        A timeout of None uses the cache's.
+
+        If responses is a ResponseCache that records or replays, the
+        instruction is loaded through it instead, so that it is recorded
+        and replayed along with the responses to loads.
+
+        Raises a requests RequestException if it cannot be loaded, and
+        ValueError if it is not JSON.
+        """
+        if timeout is None:
+            timeout = self._timeout
+        if responses is not None and (responses.record or responses.replay):
+            resp = responses.fetch({'method': 'get', 'url': url},
+                                   lambda opts: session.request(timeout=timeout, **opts))
+            resp.raise_for_status()
+            return freeze(json.loads(resp.text))
+
+        now = time.time()
+        cached = self._cache.get(url)
+        headers = {}
+        if cached is not None:
+            instruction, expires, etag, last_modified = cached
+            if now < expires:
+                return instruction
+            self._revalidations += 1
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        resp = session.get(url, headers=headers, timeout=timeout)
+        freshness = self._freshness(resp)
+
+        if cached is not None and resp.status_code == 304:
+            self._not_modified += 1
+        else:
+            resp.raise_for_status()
+            instruction = freeze(json.loads(resp.text))
+            etag = resp.headers.get('ETag')
+            last_modified = resp.headers.get('Last-Modified')
+
+        if freshness is None:
+            self._cache.pop(url)
+        else:
+            self._cache.set(url, (instruction, now + freshness, etag, last_modified))
+        return instruction
+
+    def clear(self):
+        self._cache.clear()
+        self._revalidations = self._not_modified = 0
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    @ttl.setter
+    def ttl(self, ttl):
+        self._ttl = ttl
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self._timeout = timeout
+
+    def stats(self):
+        """
+        Obtain a dict of counters, including how many stale entries were
+        revalidated and how many of those were not modified.
+        """
+        stats = self._cache.stats()
+        stats['revalidations'] = self._revalidations
+        stats['not_modified'] = self._not_modified
+        return stats
+
+
+def extend_instruction(orig, extension):
+    """
+    Extend one instruction with another, returning the extended
+    instruction.  Neither orig nor extension is modified.
+    """
+    extended = dict(orig)
+    extension = dict(extension)
+
+    # keys that are turned into arrays & extended
+    for ex_key in ['extends', 'then']:
+        # Nothing to extend, skip out the pop at end
+        if ex_key not in extension:
+            continue
+        # We can just copy it over
+        elif ex_key not in extended:
+            extended[ex_key] = extension[ex_key]
+        else:
+            # Wrap the original value in a list
+            orig_val = extended[ex_key]
+            if not isinstance(orig_val, list):
+                orig_val = [orig_val]
+
+            # Put values at beginning, whether or not extension is a list.
+            ex_val = extension[ex_key]
+            if not isinstance(ex_val, list):
+                ex_val = [ex_val]
+            extended[ex_key] = ex_val + orig_val
+
+        # Clear out key for update at end
+        extension.pop(ex_key)
+
+    # keys that are updated
+    for up_key in ['cookies', 'headers', 'posts']:
+        # Nothing to update, skip out pop at end
+        if up_key not in extension:
+            continue
+        # We can just copy it over
+        elif up_key not in extended:
+            extended[up_key] = extension[up_key]
+        # If they're both dicts, then we update.  If not, then a replace
+        # will happen.
+        else:
+            orig_val = extended[up_key]
+            up_val = extension[up_key]
+            # Prefer orig_val
+            if isinstance(orig_val, dict) and isinstance(up_val, dict):
+                updated = dict(up_val)
+                updated.update(orig_val)
+                extended[up_key] = updated
+            # Keep things available for total replacement.
+            else:
+                continue
+
+        # Clear out key for update at end
+        extension.pop(up_key)
+
+    # everything else is replaced.
+    extended.update(extension)
+    return extended
+
+
+def _extends_list(extends):
+    if isinstance(extends, (basestring, dict)):
+        return [extends]
+    elif isinstance(extends, list):
+        return extends
+    else:
+        raise InvalidInstructionError("`extends` must be a dict, str, or list")
+
+
+class ExtendsResolver(object):
+    """
+    Flattens the `extends` of dict instructions, memoizing the frozen
+    results.
+
+    Frozen instructions are memoized by identity, others by their content.
+    A memoized result is reused only while every instruction it loaded is
+    still the one its loader returns, so a changed file is picked up.
+    """
+
+    def __init__(self, maxsize=1024):
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def _key(self, instruction, uri):
+        if isinstance(instruction, FrozenDict):
+            return (uri, id(instruction))
+        try:
+            return (uri, json.dumps(instruction, sort_keys=True))
+        except (TypeError, ValueError):
+            return None
+
+    def flatten(self, instruction, uri, load):
+        """
+        Obtain a dict instruction with its `extends` resolved, as a shared,
+        frozen dict.
+
+        :param: instruction The dict instruction
+        :param: uri The URI to resolve string `extends` from
+        :param: load A function taking a base URI and a reference, and
+                returning the loaded instruction and its resolved URI
+
+        Raises InvalidInstructionError on a bad or cyclic `extends`.
+        """
+        if 'extends' not in instruction:
+            return freeze(instruction)
+
+        key = self._key(instruction, uri)
+        cached = self._cache.get(key) if key is not None else None
+        if cached is not None:
+            source, flattened, dependencies = cached
+            if source is instruction or not isinstance(instruction, FrozenDict):
+                if all(load(base, ref)[0] is loaded
+                       for base, ref, loaded in dependencies):
+                    return flattened
+
+        flattened, dependencies = self._flatten(instruction, uri, load)
+        if key is not None:
+            source = instruction if isinstance(instruction, FrozenDict) else None
+            self._cache.set(key, (source, flattened, dependencies))
+        return flattened
+
+    def _flatten(self, instruction, uri, load):
+        """
+        Merge in each level of `extends` in turn.  Each pending extension
+        carries the URIs loaded to reach it, to catch cycles.
+        """
+        dependencies = []
+        instruction = dict(instruction)
+        level = [(ex, ()) for ex in _extends_list(instruction.pop('extends'))]
+
+        while level:
+            next_level = []
+            for ex, ancestry in level:
+                if isinstance(ex, basestring):
+                    loaded, resolved_uri = load(uri, ex)
+                    if resolved_uri in ancestry:
+                        raise InvalidInstructionError("Cyclic `extends`: %s" % (
+                            ' -> '.join(ancestry + (resolved_uri, ))))
+                    if not isinstance(loaded, dict):
+                        raise InvalidInstructionError(
+                            "`extends` target '%s' must be a dict" % resolved_uri)
+                    dependencies.append((uri, ex, loaded))
+                    ex, ancestry = loaded, ancestry + (resolved_uri, )
+                elif not isinstance(ex, dict):
+                    raise InvalidInstructionError("element of `extends` list must be a dict or str")
+
+                # Later extensions' own extends are resolved first.
+                if 'extends' in ex:
+                    ex = dict(ex)
+                    next_level = [(e, ancestry) for e in
+                                  _extends_list(ex.pop('extends'))] + next_level
+                instruction = extend_instruction(instruction, ex)
+            level = next_level
+
+        return freeze(instruction), tuple(dependencies)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
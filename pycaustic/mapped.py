@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+
+# Inputs that regex finds read in place, without copying into a string.
+BUFFER_TYPES = (buffer, mmap.mmap)
+
+
+def as_bytes(input):
+    """
+    Obtain a string of a buffer input, for parsers that can't read buffers.
+    """
+    if isinstance(input, BUFFER_TYPES):
+        return input[:]
+    return input
+
+
+class MappedFile(object):
+    """
+    A file, or part of one, to scrape through a read-only memory map
+    instead of reading it into memory.  It pickles as its path, so it is
+    cheap to send to worker processes.
+    """
+
+    def __init__(self, path, offset=0, length=None):
+        self._path = path
+        self._offset = offset
+        self._length = length
+
+    def __repr__(self):
+        return 'MappedFile(%r, %r, %r)' % (self._path, self._offset, self._length)
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def offset(self):
+        return self._offset
+
+    @property
+    def length(self):
+        """
+        The number of bytes to scrape, or None for the rest of the file.
+        """
+        return self._length
+
+    def open(self):
+        """
+        Map the file.  The map stays open for as long as the buffer is
+        referenced.
+
+        :returns: A buffer over the mapped part of the file
+        """
+        with open(self._path, 'rb') as fp:
+            size = os.fstat(fp.fileno()).st_size
+            if size == 0:
+                # Empty files can't be mapped.
+                return buffer('')
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._length is None:
+            return buffer(mapped, self._offset)
+        return buffer(mapped, self._offset, self._length)
@@ -1,12 +1,26 @@
 # -*- coding: utf-8 -*-
 
+import sre_compile
+import sre_parse
+from sre_constants import (ANY, ASSERT, ASSERT_NOT, AT, AT_END, AT_END_STRING,
+                           BRANCH, GROUPREF, GROUPREF_EXISTS, IN, LITERAL,
+                           MAX_REPEAT, MAXREPEAT, MIN_REPEAT, NOT_LITERAL,
+                           SUBPATTERN)
+
+from jsonpath_rw import parse as jsonpath_parse
+
+from .cache import LRUCache
 from .errors import PatternError
+from .mapped import BUFFER_TYPES
 try:
     import re2 as re
     assert re # quiet pyflakes!
 except ImportError:
     import re
 
+# The standard re module matches buffers and mmaps in place.
+MATCHES_BUFFERS = re.__name__ == 're'
+
 # Pattern/replacement to turn all unescaped $ followed by
 # numbers into backslashes
 DOLLAR_PATTERN = re.compile(r'(?<!\\)\$(?=\d+)')
@@ -21,6 +35,14 @@ BS_REPL = r'\\\1'
 UNDOLLAR_PATTERN = re.compile(r'\\\$(?=\d+)')
 UNDOLLAR_REPL = r'$'
 
+# Compiled Regex objects shared by the whole process, keyed by their
+# constructor arguments.
+REGEX_CACHE = LRUCache(maxsize=512)
+
+# Parsed jsonpath expressions, keyed by expression.  jsonpath_rw's parser
+# is slow enough that these are always worth keeping.
+JSONPATH_CACHE = LRUCache(maxsize=512)
+
 def _switch_backreferences(input):
     return UNDOLLAR_PATTERN.sub(UNDOLLAR_REPL,
             BS_PATTERN.sub(BS_REPL,
@@ -29,6 +51,86 @@ def _switch_backreferences(input):
 #def _switch_backreferences(input):
 #    return DOLLAR_PATTERN.sub(DOLLAR_REPL, input)
 
+# Opcodes that match exactly one character.
+_CHAR_OPS = (ANY, IN, LITERAL, NOT_LITERAL)
+
+def _local(items):
+    """
+    Whether parsed items never look outside the text they match, beyond
+    the characters on either side.
+    """
+    for op, av in items:
+        if op in (ASSERT, ASSERT_NOT, GROUPREF, GROUPREF_EXISTS):
+            return False
+        elif op == AT and av in (AT_END, AT_END_STRING):
+            return False
+        elif op == BRANCH and not all(_local(branch) for branch in av[1]):
+            return False
+        elif op in (MAX_REPEAT, MIN_REPEAT) and not _local(av[2]):
+            return False
+        elif op == SUBPATTERN and not _local(av[-1]):
+            return False
+    return True
+
+def _flatten(items):
+    """
+    Obtain parsed items as one sequence, with groups opened up.  Is None
+    if there are alternatives, or repeats of more than one character.
+    """
+    flat = []
+    for op, av in items:
+        if op == SUBPATTERN:
+            inner = _flatten(av[-1])
+            if inner is None:
+                return None
+            flat.extend(inner)
+        elif op == BRANCH:
+            return None
+        elif op in (MAX_REPEAT, MIN_REPEAT) and \
+             (len(av[2]) != 1 or av[2][0][0] not in _CHAR_OPS):
+            return None
+        else:
+            flat.append((op, av))
+    return flat
+
+def _lookahead(compiled):
+    """
+    Obtain how far past the start of a match a compiled pattern may look.
+    A match found in the start of some input is the same in all of it once
+    there is input that far along.  Is -1 if there is no bound, but the
+    match is settled once there is input past its end, and None if only the
+    whole input can tell.
+    """
+    try:
+        parsed = sre_parse.parse(compiled.pattern, compiled.flags)
+    except Exception:
+        # re2 accepts some patterns that sre doesn't.
+        return None
+    if not _local(parsed):
+        return None
+    width = parsed.getwidth()[1]
+    if width < MAXREPEAT:
+        return width
+
+    # Without a bound, the pattern must never backtrack: every repeat of a
+    # varying length ends the pattern, or is followed by a literal.  Greedy
+    # repeats also can't match that literal.
+    items = _flatten(parsed)
+    if items is None:
+        return None
+    for i, (op, av) in enumerate(items):
+        if op not in (MAX_REPEAT, MIN_REPEAT) or av[0] == av[1] or \
+           i == len(items) - 1:
+            continue
+        next_op, next_av = items[i + 1]
+        if next_op != LITERAL:
+            return None
+        if op == MAX_REPEAT:
+            item = sre_parse.SubPattern(parsed.pattern, list(av[2]))
+            if sre_compile.compile(item, compiled.flags).match(unichr(next_av)):
+                return None
+    return -1
+
 class Regex(object):
     """
     Due to differences between the way the prior Java's regex expand templates
@@ -70,19 +172,32 @@ class Regex(object):
                            " be performed with a byte strings.  Please decode to " +
                             " UTF-8 and try again. Offending string: %s" % replace)
 
+        self._lookahead = False
+
+    @property
+    def lookahead(self):
+        """
+        How far past the start of a match this may look, or -1 if only past
+        its end, or None if there's no telling.  Worked out on first use.
+        """
+        if self._lookahead is False:
+            self._lookahead = _lookahead(self.regex)
+        return self._lookahead
+
     def substitutions(self, input, min_match=0, max_match=None):
         """
         Obtain an iterator over replacements from the input via the regex.
         """
 
         # re2 is much faster with byte strings.  Only pass it byte strings
-        # in UTF-8.
-        try:
-            input = str(input)
-        except UnicodeError:
-            raise TypeError("For performance reasons, substitutions may only " +
-                           " be performed on byte strings.  Please decode to " +
-                            " UTF-8 and try again. Offending string: %s" % input)
+        # in UTF-8.  re matches buffers in place, so they aren't copied.
+        if not (MATCHES_BUFFERS and isinstance(input, BUFFER_TYPES)):
+            try:
+                input = str(input)
+            except UnicodeError:
+                raise TypeError("For performance reasons, substitutions may only " +
+                               " be performed on byte strings.  Please decode to " +
+                                " UTF-8 and try again. Offending string: %s" % input)
 
         for i, match in enumerate(self.regex.finditer(input)):
 
@@ -102,3 +217,68 @@ class Regex(object):
             # re2 raises different errors
             except IndexError as e:
                 raise PatternError(e)
+
+
+class MatchCounter(object):
+    """
+    Counts matches of a Regex in input that arrives a piece at a time, to
+    tell when there are enough.  Matches that more input might change
+    aren't counted, so the Regex must have a lookahead.
+    """
+
+    def __init__(self, regex, needed):
+        self._regex = regex.regex
+        self._lookahead = regex.lookahead
+        self._needed = needed
+        self._pos = 0
+        self._count = 0
+
+    def feed(self, input):
+        """
+        Count matches in the input so far, which must start with all the
+        input that was fed before.
+
+        :returns: True once there are enough matches
+        """
+        count = self._count
+        end = len(input)
+        for match in self._regex.finditer(input, self._pos):
+            if self._lookahead < 0:
+                if match.end() >= end:
+                    break
+            elif match.start() + self._lookahead >= end:
+                break
+            count += 1
+            # Resume after the last match that consumed input.  Empty
+            # matches since then are counted again next time.
+            if match.end() > match.start():
+                self._pos, self._count = match.end(), count
+            if count >= self._needed:
+                return True
+        return False
+
+
+def cached_regex(regex_str, ignore_case, multiline, dot_matches_all, replace):
+    """
+    Obtain a Regex from REGEX_CACHE, compiling and caching it on a miss.
+    Regex objects are never modified once built, so they may be shared.
+    """
+    key = (regex_str, ignore_case, multiline, dot_matches_all, replace)
+    regex = REGEX_CACHE.get(key)
+    if regex is None:
+        regex = Regex(regex_str, ignore_case, multiline, dot_matches_all, replace)
+        REGEX_CACHE.set(key, regex)
+    return regex
+
+
+def cached_jsonpath(expression):
+    """
+    Obtain a parsed jsonpath expression from JSONPATH_CACHE, parsing and
+    caching it on a miss.  Raises whatever jsonpath_rw raises on a bad
+    expression.
+    """
+    jsonpath_expr = JSONPATH_CACHE.get(expression)
+    if jsonpath_expr is None:
+        jsonpath_expr = jsonpath_parse(expression)
+        JSONPATH_CACHE.set(expression, jsonpath_expr)
+    return jsonpath_expr
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+
+from lxml import etree
+
+from .patterns import cached_regex, cached_jsonpath
+from .templates import Substitution, compile_templates
+from .errors import InvalidInstructionError
+
+FIND_KEYS = ('find', 'xpath', 'jsonpath')
+LOAD_METHODS = ('head', 'get', 'post')
+
+_UNCOMPILED = object()
+
+
+class Field(object):
+    """
+    A template from an instruction, compiled once.  Templates that
+    reference no tags are substituted once, ahead of time.
+    """
+
+    def __init__(self, template):
+        self._template = template
+        self._compiled = compile_templates(template)
+        sub = Substitution(self._compiled, {})
+        self._static = None if sub.missing_tags else sub
+
+    @property
+    def template(self):
+        return self._template
+
+    @property
+    def is_static(self):
+        return self._static is not None
+
+    def substitute(self, tags):
+        """
+        Obtain a Substitution of this field for the supplied tags.
+        """
+        if self._static is None:
+            return Substitution(self._compiled, tags)
+        else:
+            return self._static
+
+
+class Plan(object):
+    """
+    An instruction compiled by a Scraper.  Plans can be run any number of
+    times against different tags and input, and should be treated as
+    immutable.
+    """
+
+    def __init__(self, scraper, instruction, uri):
+        self._scraper = scraper
+        self._instruction = instruction
+        self._uri = uri
+
+    @property
+    def instruction(self):
+        return self._instruction
+
+    @property
+    def uri(self):
+        return self._uri
+
+    def _compile_child(self, instruction):
+        """
+        Compile an instruction nested in this one, or return None if it is
+        empty.
+        """
+        if instruction:
+            return self._scraper._compile(instruction, self._uri)
+        else:
+            return None
+
+    def run(self, tags=None, input='', force=False, id=None):
+        """
+        Run this plan.
+
+        :param: (optional) tags Tags to use for substitution
+        :type: dict
+        :param: (optional) input Input for Find
+        :type: str
+        :param: (optional) force Whether to actually load a load.  Overriden
+                by force_all of the compiling Scraper
+        :type: bool
+        :param: (optional) id ID for request
+        :type: str
+
+        :returns: Response or list of Responses
+        """
+        if tags is None:
+            tags = {}
+        return self._scraper._scrape_plan(self, tags, input, force, id)
+
+
+class ReferencePlan(Plan):
+    """
+    A string instruction that is resolved when run.  The target of each
+    distinct resolved reference is compiled once, the first time it is
+    needed, which also allows instructions to refer to themselves.
+    """
+
+    def __init__(self, scraper, instruction, uri):
+        super(ReferencePlan, self).__init__(scraper, instruction, uri)
+        self._reference = Field(instruction)
+        self._targets = {}
+
+    @property
+    def reference(self):
+        return self._reference
+
+    def target(self, resolved):
+        """
+        Obtain the compiled Plan for a resolved reference.
+        """
+        plan = self._targets.get(resolved)
+        if plan is None:
+            plan = self._scraper.compile(resolved, uri=self._uri)
+            self._targets[resolved] = plan
+        return plan
+
+
+class ListPlan(Plan):
+    """
+    A list of plans, each of which is run in the same context.
+    """
+
+    def __init__(self, scraper, instruction, uri, plans):
+        super(ListPlan, self).__init__(scraper, instruction, uri)
+        self._plans = tuple(plans)
+
+    @property
+    def plans(self):
+        return self._plans
+
+
+class DictPlan(Plan):
+    """
+    A compiled dict instruction, with its `extends` already resolved.
+    Children are compiled the first time they are needed, so templates may
+    nest themselves.
+    """
+
+    def __init__(self, scraper, instruction, uri):
+        super(DictPlan, self).__init__(scraper, instruction, uri)
+        self._tags = instruction.get('tags', {})
+        self._description = instruction.get('description', None)
+        self._name = Field(instruction.get('name'))
+        self._then = _UNCOMPILED
+
+    @property
+    def tags(self):
+        return self._tags
+
+    @property
+    def description(self):
+        return self._description
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def then(self):
+        """
+        The Plan for children, or None if there are none.
+        """
+        if self._then is _UNCOMPILED:
+            self._then = self._compile_child(self._instruction.get('then'))
+        return self._then
+
+
+class FindPlan(DictPlan):
+    """
+    A compiled find, xpath, or jsonpath instruction.
+    """
+
+    def __init__(self, scraper, instruction, uri):
+        super(FindPlan, self).__init__(scraper, instruction, uri)
+        keys = [k for k in FIND_KEYS if k in instruction]
+        if len(keys) > 1:
+            raise InvalidInstructionError("Conflicting find/xpath/jsonpath")
+
+        self._key = keys[0]
+        self._else = _UNCOMPILED
+        self._expression = Field(instruction[self._key])
+
+        self._replace = instruction.get('replace', '$0')
+        self._ignore_case = instruction.get('case_insensitive', False)
+        self._multiline = instruction.get('multiline', False)
+        self._dot_matches_all = instruction.get('dot_matches_all', True)
+
+        self._tag_match = Field(instruction.get('tag_match'))
+        self._join = Field(instruction.get('join', None))
+
+        # Default to full range, use single match if it was defined
+        match = instruction.get('match', None)
+        self._min_match = Field(instruction.get('min_match', 0) if match is None else match)
+        self._max_match = Field(instruction.get('max_match', -1) if match is None else match)
+
+        if 'input' in instruction:
+            self._input = Field(instruction['input'])
+        else:
+            self._input = None
+
+        # Precompile the pattern when it doesn't depend upon tags.  Bad
+        # patterns are left for `pattern` to report when run.
+        self._pattern = None
+        if self._expression.is_static:
+            try:
+                self._pattern = self._compile_pattern(
+                    self._expression.substitute({}).result)
+            except Exception:
+                pass
+
+    def _compile_pattern(self, expression):
+        if self._key == 'find':
+            return cached_regex(expression, self._ignore_case, self._multiline,
+                                self._dot_matches_all, self._replace)
+        elif self._key == 'xpath':
+            return etree.XPath(expression)
+        else:
+            return cached_jsonpath(expression)
+
+    def pattern(self, expression):
+        """
+        Obtain the compiled pattern for a substituted expression: a Regex,
+        an lxml XPath, or a jsonpath expression.  Raises whatever error
+        compilation raises.
+        """
+        if self._pattern is None:
+            return self._compile_pattern(expression)
+        else:
+            return self._pattern
+
+    @property
+    def key(self):
+        """
+        One of 'find', 'xpath', or 'jsonpath'.
+        """
+        return self._key
+
+    @property
+    def expression(self):
+        return self._expression
+
+    @property
+    def tag_match(self):
+        return self._tag_match
+
+    @property
+    def join(self):
+        return self._join
+
+    @property
+    def min_match(self):
+        return self._min_match
+
+    @property
+    def max_match(self):
+        return self._max_match
+
+    @property
+    def input(self):
+        """
+        The Field for input specified in the instruction, or None if input
+        should come from the request.
+        """
+        return self._input
+
+    @property
+    def else_(self):
+        """
+        The Plan to run when there are no matches, or None.
+        """
+        if self._else is _UNCOMPILED:
+            self._else = self._compile_child(self._instruction.get('else'))
+        return self._else
+
+
+class LoadPlan(DictPlan):
+    """
+    A compiled load instruction.
+    """
+
+    def __init__(self, scraper, instruction, uri):
+        super(LoadPlan, self).__init__(scraper, instruction, uri)
+        self._method = instruction.get('method', 'get')
+        if self._method not in LOAD_METHODS:
+            raise InvalidInstructionError("Illegal HTTP method: %s" % self._method)
+
+        self._url = Field(instruction['load'])
+        self._posts = Field(instruction.get('posts'))
+        self._cookies = Field(instruction.get('cookies', {}))
+        self._headers = Field(instruction.get('headers', {}))
+
+        self._incremental = instruction.get('incremental', False)
+        if not isinstance(self._incremental, bool):
+            raise InvalidInstructionError("`incremental` must be true or false")
+
+        self._retries = instruction.get('retries')
+        if self._retries is not None and (
+                not isinstance(self._retries, int) or self._retries < 0):
+            raise InvalidInstructionError("`retries` must be a non-negative integer")
+        self._backoff = instruction.get('backoff')
+        if self._backoff is not None and not isinstance(self._backoff, (int, float)):
+            raise InvalidInstructionError("`backoff` must be a number")
+        self._timeout = instruction.get('timeout')
+        if isinstance(self._timeout, list) and len(self._timeout) == 2:
+            # A (connect, read) pair
+            self._timeout = tuple(self._timeout)
+        if self._timeout is not None and not (
+                isinstance(self._timeout, (int, float)) or
+                (isinstance(self._timeout, tuple) and
+                 all(isinstance(t, (int, float)) for t in self._timeout))):
+            raise InvalidInstructionError("`timeout` must be a number or a "
+                                          "[connect, read] pair of numbers")
+
+    @property
+    def method(self):
+        return self._method
+
+    @property
+    def url(self):
+        return self._url
+
+    @property
+    def posts(self):
+        return self._posts
+
+    @property
+    def cookies(self):
+        return self._cookies
+
+    @property
+    def headers(self):
+        return self._headers
+
+    @property
+    def incremental(self):
+        """
+        True if the body should only be read until the regex finds in
+        `then` have their max_match.
+        """
+        return self._incremental
+
+    @property
+    def retries(self):
+        return self._retries
+
+    @property
+    def backoff(self):
+        return self._backoff
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @property
+    def retry_overrides(self):
+        """
+        True if the instruction overrides the scraper's retry policy.
+        """
+        return (self._retries is not None or self._backoff is not None or
+                self._timeout is not None)
@@ -1,69 +1,253 @@
 # -*- coding: utf-8 -*-
 
-import json
+_SLOT_NAMES = {}
 
-class Result(object):
+
+class _Slotted(object):
+    """
+    A base for classes with __slots__ that pickles and copies the slots
+    of the whole class hierarchy, under any pickle protocol.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def _slot_names(cls):
+        names = _SLOT_NAMES.get(cls)
+        if names is None:
+            names = _SLOT_NAMES[cls] = tuple(
+                name for klass in cls.__mro__
+                for name in getattr(klass, '__slots__', ()))
+        return names
+
+    def __getstate__(self):
+        state = {}
+        for name in self._slot_names():
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
+
+class Body(_Slotted):
+    """
+    The body of a loaded page.  It is kept once, as UTF-8, and only decoded
+    to text when that is asked for.
+    """
+    __slots__ = ('_content', '_text')
+
+    def __init__(self, content):
+        self._content = content
+        self._text = None
+
+    def __len__(self):
+        return len(self._content)
+
+    @property
+    def content(self):
+        """
+        The body as a UTF-8 bytestring.
+        """
+        return self._content
+
+    @property
+    def text(self):
+        """
+        The body as unicode, decoded the first time it is asked for.
+        """
+        if self._text is None:
+            self._text = self._content.decode('utf-8', 'replace')
+        return self._text
+
+
+def truncate_value(value):
+    """
+    Shorten a long result value for display.
+    """
+    if value is not None and len(value) > 200:
+        return value[:100] + '...' + value[-100:]
+    return value
+
+
+def _wrap_children(children):
+    """
+    Obtain a result's children as a non-empty list, or None.
+    """
+    if children is None:
+        return None
+    elif isinstance(children, list):
+        return children if len(children) > 0 else None
+    elif isinstance(children, Response):
+        return [children]
+    else:
+        raise TypeError('result children must be response or list')
+
+
+class Result(_Slotted):
     """
-    The successful result of a single instruction.
+    The successful result of a single instruction.  The value of a load is
+    its Body's text, or None if the scraper doesn't keep bodies.
     """
+    __slots__ = ('_value', '_children')
+
     def __init__(self, value, children=None):
         self._value = value
-        if children is None:
-            self._children = None
-        else:
-            if isinstance(children, list):
-                if len(children) > 0:
-                    self._children = children
-                else:
-                    self._children = None
-            elif isinstance(children, Response):
-                self._children = [children]
-            else:
-                raise TypeError('result children must be response or list')
+        self._children = _wrap_children(children)
 
     def __str__(self):
-        return json.dumps(self.as_dict(), default=lambda x: "Unencodable (%s)" % x)
+        from .serialize import dumps
+        return dumps(self)
 
     @property
     def value(self):
+        if isinstance(self._value, Body):
+            return self._value.text
         return self._value
 
+    @property
+    def body(self):
+        """
+        The Body of a load, or None.
+        """
+        return self._value if isinstance(self._value, Body) else None
+
     @property
     def children(self):
         return self._children
 
     def _construct_dict(self):
         d = {
-            'value': self._value
+            'value': self.value
         }
-        if self._children:
-            d['children'] = [child.as_dict() for child in self._children]
+        if self.children:
+            d['children'] = [child.as_dict() for child in self.children]
         return d
 
     def as_dict(self, truncated=True):
         as_dict = self._construct_dict()
 
-        if truncated == True and len(as_dict['value']) > 200:
-            val = as_dict['value']
-            as_dict['value'] = val[:100] + '...' + val[-100:]
-            return as_dict
+        if truncated == True:
+            as_dict['value'] = truncate_value(as_dict['value'])
+        return as_dict
+
+
+class LazyResult(Result):
+    """
+    A Result whose children are only scraped when they are first asked
+    for.
+    """
+    __slots__ = ('_scrape', )
+
+    def __init__(self, value, scrape=None):
+        super(LazyResult, self).__init__(value)
+        self._scrape = scrape
+
+    @property
+    def children(self):
+        if self._scrape is not None:
+            self._children = _wrap_children(self._scrape())
+            self._scrape = None
+        return self._children
+
+    def __getstate__(self):
+        # Children are scraped before pickling, as the scrape can't be.
+        self.children
+        return super(LazyResult, self).__getstate__()
+
+
+class LazyResults(_Slotted):
+    """
+    A sequence of Results that are produced as they are needed, from an
+    iterator of Results.  Produced Results are kept, so the sequence can be
+    read more than once.  Anything raised producing a Result, such as a
+    PatternError or a TemplateError for missing tags, is raised to the
+    reader.
+    """
+    __slots__ = ('_results', '_produced')
+
+    def __init__(self, results):
+        self._results = iter(results)
+        self._produced = []
+
+    def _produce(self, count=None):
+        """
+        Produce Results until there are count, or until there are none
+        left if count is None.
+        """
+        while self._results is not None and (
+                count is None or len(self._produced) < count):
+            try:
+                self._produced.append(next(self._results))
+            except StopIteration:
+                self._results = None
+
+    def __iter__(self):
+        i = 0
+        while True:
+            self._produce(i + 1)
+            if i >= len(self._produced):
+                return
+            yield self._produced[i]
+            i += 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # Only slices counted from the front can stop early.
+            if index.stop is not None and index.stop >= 0 and \
+               (index.start or 0) >= 0 and (index.step or 1) > 0:
+                self._produce(index.stop)
+            else:
+                self._produce()
+        elif index >= 0:
+            self._produce(index + 1)
         else:
-            return as_dict
+            self._produce()
+        return self._produced[index]
+
+    def __len__(self):
+        self._produce()
+        return len(self._produced)
+
+    def __nonzero__(self):
+        self._produce(1)
+        return len(self._produced) > 0
+
+    def __getstate__(self):
+        # Every Result is produced before pickling, as the iterator can't be.
+        self._produce()
+        return super(LazyResults, self).__getstate__()
 
+    @property
+    def produced(self):
+        """
+        How many Results have been produced so far.
+        """
+        return len(self._produced)
 
-class Response(object):
+
+class Response(_Slotted):
     """
     Wrapper for a Caustic response.
     """
+    __slots__ = ('_id', '_uri', '_tags', '_instruction')
 
     def __init__(self, request):
         self._id = request.id
         self._uri = request.uri
-        self._tags = request.tags
-        self._instruction = request.instruction
+        # Requests that don't keep their context leave these out.
+        if request.keep_context:
+            self._tags = request.tags
+            self._instruction = request.instruction
+        else:
+            self._tags = self._instruction = None
 
     def __str__(self):
-        return json.dumps(self.as_dict(), default=lambda x: "Unencodable (%s)" % x)
+        from .serialize import dumps
+        return dumps(self)
 
     @property
     def id(self):
@@ -84,12 +268,19 @@ class Response(object):
     def _status(self):
         raise NotImplementedError("Must use subclass")
 
+    def _fields(self):
+        """
+        Obtain the (key, value) pairs of this response's dict, other than
+        its results.
+        """
+        return [
+            ('uri', self._uri),
+            ('status', self.status),
+            ('tags', self._tags)
+        ]
+
     def _construct_dict(self):
-        return {
-            'uri': self._uri,
-            'status': self.status,
-            'tags': self._tags
-        }
+        return dict(self._fields())
 
     def as_dict(self, truncated=True):
         return self._construct_dict()
@@ -99,19 +290,24 @@ class Ready(Response):
     """
     A Response with results. Should be subclassed.
     """
+    __slots__ = ('_name', '_description', '_results', '_flattened')
+
     def __init__(self, request, name, description, results):
         super(Ready, self).__init__(request)
         self._name = name
         self._description = description
         self._results = results
+        self._flattened = None
+
+    def _fields(self):
+        return super(Ready, self)._fields() + [
+            ('name', self._name),
+            ('description', self._description)
+        ]
 
     def _construct_dict(self):
         d = super(Ready, self)._construct_dict()
-        d.update({
-            'name': self._name,
-            'description': self._description,
-            'results': [r.as_dict() for r in self._results]
-        })
+        d['results'] = [r.as_dict() for r in self._results]
         return d
 
     @property
@@ -135,8 +331,33 @@ class Ready(Response):
         """
         Obtain a dict or list containing all results, descending as deeply
         as possible. One-to-one relations are flattened.
-        """
 
+        The values are worked out once, and shared, so must not be
+        modified.  Children are flattened before their parents with a
+        stack, so deep trees don't hit the recursion limit.
+        """
+        if self._flattened is not None:
+            return self._flattened
+
+        stack = [(self, False)]
+        while stack:
+            resp, children_done = stack.pop()
+            if resp._flattened is not None:
+                continue
+            elif children_done:
+                resp._flattened = resp._flatten()
+            else:
+                stack.append((resp, True))
+                for r in resp.results:
+                    for c in r.children or ():
+                        if isinstance(c, Ready) and c._flattened is None:
+                            stack.append((c, False))
+        return self._flattened
+
+    def _flatten(self):
+        """
+        Flatten this response, once its children have been.
+        """
         flattened_values = []
         for r in self.results:
             branch = {}
@@ -148,7 +369,7 @@ class Ready(Response):
             if r.children:
                 for c in r.children:
                     if isinstance(c, Ready):
-                        child_flat_values = c.flattened_values
+                        child_flat_values = c._flattened
 
                         if isinstance(child_flat_values, dict):
                             branch.update(child_flat_values)
@@ -166,6 +387,8 @@ class DoneFind(Ready):
     """
     The response from a successful find.
     """
+    __slots__ = ()
+
     def _status(self):
         return 'found'
 
@@ -174,21 +397,41 @@ class DoneLoad(Ready):
     """
     The response from a successful load.
     """
-    def __init__(self, request, name, description, result, cookies):
+    __slots__ = ('_cookies', '_attempts', '_elapsed')
+
+    def __init__(self, request, name, description, result, cookies,
+                 attempts=1, elapsed=None):
         super(DoneLoad, self).__init__(request, name, description, [result])
         self._cookies = cookies
+        self._attempts = attempts
+        self._elapsed = elapsed
 
-    def _construct_dict(self):
-        d = super(DoneLoad, self)._construct_dict()
-        d.update({
-            'cookies': self._cookies.get_dict()
-        })
-        return d
+    def _fields(self):
+        return super(DoneLoad, self)._fields() + [
+            ('cookies', self._cookies.get_dict()),
+            ('attempts', self._attempts),
+            ('elapsed', self._elapsed)
+        ]
 
     @property
     def cookies(self):
         return self._cookies
 
+    @property
+    def attempts(self):
+        """
+        How many requests were made for this load.  Is 0 if the response
+        was cached, or shared with an identical load.
+        """
+        return self._attempts
+
+    @property
+    def elapsed(self):
+        """
+        The seconds this load took, including retries.
+        """
+        return self._elapsed
+
     def _status(self):
         return 'loaded'
 
@@ -197,18 +440,18 @@ class Wait(Response):
     """
     Wait caustic response.
     """
+    __slots__ = ('_name', '_description')
+
     def __init__(self, request, name, description):
         super(Wait, self).__init__(request)
         self._name = name
         self._description = description
 
-    def _construct_dict(self):
-        d = super(Wait, self)._construct_dict()
-        d.update({
-            'name': self._name,
-            'description': self._description
-        })
-        return d
+    def _fields(self):
+        return super(Wait, self)._fields() + [
+            ('name', self._name),
+            ('description', self._description)
+        ]
 
     @property
     def name(self):
@@ -225,16 +468,16 @@ class MissingTags(Response):
     """
     Missing tags caustic response.
     """
+    __slots__ = ('_missing_tags', )
+
     def __init__(self, request, missing_tags):
         super(MissingTags, self).__init__(request)
         self._missing_tags = missing_tags
 
-    def _construct_dict(self):
-        d = super(MissingTags, self)._construct_dict()
-        d.update({
-            'missing': self._missing_tags
-        })
-        return d
+    def _fields(self):
+        return super(MissingTags, self)._fields() + [
+            ('missing', self._missing_tags)
+        ]
 
     @property
     def missing_tags(self):
@@ -248,20 +491,43 @@ class Failed(Response):
     """
     Failure caustic response.
     """
-    def __init__(self, request, reason):
+    __slots__ = ('_reason', '_attempts', '_elapsed')
+
+    def __init__(self, request, reason, attempts=None, elapsed=None):
         super(Failed, self).__init__(request)
         self._reason = reason
-
-    def _construct_dict(self):
-        d = super(Failed, self)._construct_dict()
-        d.update({
-            'failed': self._reason
-        })
-        return d
+        self._attempts = attempts
+        self._elapsed = elapsed
+
+    def _fields(self):
+        fields = super(Failed, self)._fields() + [
+            ('failed', self._reason)
+        ]
+        if self._attempts is not None:
+            fields += [
+                ('attempts', self._attempts),
+                ('elapsed', self._elapsed)
+            ]
+        return fields
 
     @property
     def reason(self):
         return self._reason
 
+    @property
+    def attempts(self):
+        """
+        How many requests were made for a failed load.  Is None if the
+        failure was not from a load.
+        """
+        return self._attempts
+
+    @property
+    def elapsed(self):
+        """
+        The seconds a failed load took, including retries.
+        """
+        return self._elapsed
+
     def _status(self):
         return 'failed'
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import random
+import time
+from email.utils import parsedate_tz, mktime_tz
+
+import requests
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryPolicy(object):
+    """
+    How long to wait for a load, and how to retry it.
+
+    A load that times out, cannot connect, or gets one of statuses back is
+    tried again up to retries more times.  Before each retry it waits a
+    random time of up to backoff * 2 ** n seconds (capped at max_backoff),
+    or for as long as the response's Retry-After asks.  A response asking
+    for longer than max_backoff is not retried, but returned.
+
+    timeout is passed to requests, so it may be a number of seconds or a
+    (connect, read) tuple.  None waits forever.
+
+    With a gevent pool, pass green=True so that waiting yields to other
+    greenlets rather than blocking the thread.
+    """
+
+    def __init__(self, retries=0, timeout=None, backoff=0.5, max_backoff=30,
+                 statuses=RETRY_STATUSES, green=False):
+        self._retries = retries
+        self._timeout = timeout
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._statuses = frozenset(statuses)
+        self._green = green
+
+        if green:
+            import gevent
+            self._sleep = gevent.sleep
+        else:
+            self._sleep = time.sleep
+
+    def override(self, retries=None, timeout=None, backoff=None):
+        """
+        Obtain a copy of this policy with some settings replaced.  Settings
+        that are None are kept.
+        """
+        return RetryPolicy(
+            retries=self._retries if retries is None else retries,
+            timeout=self._timeout if timeout is None else timeout,
+            backoff=self._backoff if backoff is None else backoff,
+            max_backoff=self._max_backoff,
+            statuses=self._statuses,
+            green=self._green)
+
+    def _retry_after(self, resp):
+        """
+        Obtain the seconds a response's Retry-After asks us to wait, or None.
+        """
+        retry_after = resp.headers.get('Retry-After') if resp is not None else None
+        if not retry_after:
+            return None
+        elif retry_after.strip().isdigit():
+            return int(retry_after)
+        date = parsedate_tz(retry_after)
+        if date:
+            return max(0, mktime_tz(date) - time.time())
+        return None
+
+    def delay(self, retry, resp=None):
+        """
+        Obtain how long to wait before a retry, or None if the response's
+        Retry-After asks for longer than max_backoff.
+
+        :param: retry How many retries have already been made
+        :param: resp The response that is being retried, if any
+        """
+        retry_after = self._retry_after(resp)
+        if retry_after is not None:
+            return retry_after if retry_after <= self._max_backoff else None
+        return random.uniform(0, min(self._max_backoff, self._backoff * 2 ** retry))
+
+    def call(self, send, opts, attempts=None):
+        """
+        Send a request built from opts, retrying as necessary.
+
+        :param: send A function taking opts and a timeout, and returning a
+                requests.Response
+        :param: attempts A list that the status code or exception of each
+                attempt is appended to
+        :returns: the last requests.Response
+
+        Raises the last exception if the final attempt raised.
+        """
+        if attempts is None:
+            attempts = []
+        retry = 0
+        while True:
+            resp = None
+            try:
+                resp = send(opts, self._timeout)
+                attempts.append(resp.status_code)
+                if resp.status_code not in self._statuses or retry >= self._retries:
+                    return resp
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                attempts.append(e)
+                if retry >= self._retries:
+                    raise
+            delay = self.delay(retry, resp)
+            if delay is None:
+                return resp
+            self._sleep(delay)
+            retry += 1
+
+    @property
+    def retries(self):
+        return self._retries
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @property
+    def backoff(self):
+        return self._backoff
+
+    @property
+    def green(self):
+        """
+        Whether waiting yields to other greenlets.
+        """
+        return self._green
@@ -1,34 +1,56 @@
 # -*- coding: utf-8 -*-
 
-import copy
-import json
+import cPickle
+import functools
 import os
 import requests
+import threading
+import time
 import urlparse
 
-from jsonpath_rw import parse as jsonpath_parse
-from collections import OrderedDict
 from lxml import etree
 
-from .patterns import Regex
+from .batch import run_batch, split_input, init_process, scrape_in_process
+from .concurrency import ThreadPool, SingleFlight
+from .documents import DocumentCache
+from .download import DownloadPolicy
+from .httpcache import DiskBackend, request_key
+from .instructions import (InstructionFileCache, RemoteInstructionCache,
+                           ExtendsResolver)
+from .mapped import BUFFER_TYPES
+from .patterns import MatchCounter
+from .plans import FIND_KEYS, ReferencePlan, ListPlan, FindPlan, LoadPlan
+from .retry import RetryPolicy
+from .stream import Leaf
 from .responses import ( DoneLoad, DoneFind, Wait, MissingTags,
-                         Failed, Result )
+                         Failed, Result, LazyResult, LazyResults, Body )
 from .templates import Substitution, InheritedDict
-from .errors import InvalidInstructionError, SchemeSecurityError, PatternError
+from .errors import (InvalidInstructionError, SchemeSecurityError,
+                     PatternError, TemplateError, CacheMissError,
+                     LoadAbortedError, ArchiveMissError)
 
 CURDIR = os.getcwd()
-FILE_CACHE = OrderedDict()
-MAX_FILE_CACHE_SIZE = 50
+# How many instruction files FILE_CACHE keeps.  Changes take effect on the
+# next instruction file loaded.
+MAX_FILE_CACHE_SIZE = 1024
+FILE_CACHE = InstructionFileCache(maxsize=MAX_FILE_CACHE_SIZE)
+REMOTE_CACHE = RemoteInstructionCache()
+RESOLVER = ExtendsResolver()
+
+_NO_MATCH = object()
 
 class Request(object):
 
-    def __init__(self, instruction, tags, input, force, request_id, uri):
-        try:
-            input = str(input)
-        except UnicodeError:
-            raise TypeError("For performance reasons, only bytestrings may be "
-                            "read as input.  Please encode as UTF-8 to match on "
-                            "extended characters.\n\nOffending string: %s" % input)
+    def __init__(self, instruction, tags, input, force, request_id, uri,
+                 documents=None, path=(), keep_context=True):
+        # Buffers, such as of mapped files, are kept as they are.
+        if not isinstance(input, BUFFER_TYPES):
+            try:
+                input = str(input)
+            except UnicodeError:
+                raise TypeError("For performance reasons, only bytestrings may be "
+                                "read as input.  Please encode as UTF-8 to match on "
+                                "extended characters.\n\nOffending string: %s" % input)
 
         #self._instruction = copy.deepcopy(instruction)
         self._instruction = instruction
@@ -37,6 +59,9 @@ class Request(object):
         self._force = force
         self._id = request_id
         self._uri = uri
+        self._documents = documents
+        self._path = path
+        self._keep_context = keep_context
 
     @property
     def instruction(self):
@@ -62,6 +87,33 @@ class Request(object):
     def uri(self):
         return self._uri
 
+    @property
+    def documents(self):
+        """
+        The DocumentCache shared by every request in this scrape.
+        """
+        return self._documents
+
+    @property
+    def path(self):
+        """
+        The names of the results this request is scraping under.
+        """
+        return self._path
+
+    @property
+    def keep_context(self):
+        """
+        Whether responses to this request keep its instruction and tags.
+        """
+        return self._keep_context
+
+    def child_path(self, name):
+        """
+        The path for requests scraping under a result named name.
+        """
+        return self._path + (name, ) if name is not None else self._path
+
 
 class Loader(object):
 
@@ -88,8 +140,40 @@ _loader = Loader()
 
 class Scraper(object):
 
-    def __init__(self, session=None, force_all=False, pool=None):
+    def __init__(self, session=None, force_all=False, pool=None, documents=None,
+                 json_loads=None, scheduler=None, cache=None, flights=None,
+                 retry=None, keep_bodies=True, download=None, lazy=False,
+                 sink=None, keep_context=True, archive=None,
+                 keep_results=True):
+        if not keep_results and sink is None:
+            raise ValueError("Results can only be dropped once sent to a sink")
         self._pool = pool
+        self._archive = archive
+        self._keep_context = keep_context
+        self._sink = sink
+        self._keep_results = keep_results
+        self._lazy = lazy
+        self._download = download
+        self._keep_bodies = keep_bodies
+        self._scheduler = scheduler
+        self._cache = cache
+        green = pool is not None and not isinstance(pool, ThreadPool)
+        # Waiting on threading primitives in a greenlet would block every
+        # other greenlet.
+        for setting, value in (('scheduler', scheduler), ('flights', flights),
+                               ('retry', retry)):
+            if green and value is not None and not value.green:
+                raise ValueError("A %s used with a gevent pool must be made "
+                                 "with green=True" % setting)
+        self._flights = SingleFlight(green=green) if flights is None else flights
+        self._retry = RetryPolicy(green=green) if retry is None else retry
+        if green:
+            import gevent.lock
+            self._sink_lock = gevent.lock.Semaphore()
+        else:
+            self._sink_lock = threading.Lock()
+        self._documents = documents
+        self._json_loads = json_loads
 
         if session is None:
             self._session = requests.Session()
@@ -113,75 +197,47 @@ class Scraper(object):
 
         try:
             if resolved_uri.scheme in ['http', 'https']:
-                instruction = json.loads(requests.get(resolved_uri).text)
+                # Remote instructions share the scraper's pooled session,
+                # its load timeout if it has one, and its response cache if
+                # that records or replays.
+                instruction = REMOTE_CACHE.load(self._session,
+                                                urlparse.urlunsplit(resolved_uri),
+                                                self._retry.timeout, self._cache)
             elif resolved_uri.scheme is '':
-                resolved_uri_str = urlparse.urlunsplit(resolved_uri)
-
-                # Use our file cache if we can
-                instruction = copy.deepcopy(FILE_CACHE.get(resolved_uri_str))
-
-                # Otherwise, load and save in the cache
-                if instruction is None:
-                    instruction = json.load(open(resolved_uri_str))
-                    FILE_CACHE[resolved_uri_str] = copy.deepcopy(instruction)
-                    if len(FILE_CACHE) > MAX_FILE_CACHE_SIZE:
-                        FILE_CACHE.popitem(last=False)
+                # Instructions from the cache are frozen, so they can be
+                # shared without copying.
+                if FILE_CACHE.maxsize != MAX_FILE_CACHE_SIZE:
+                    FILE_CACHE.maxsize = MAX_FILE_CACHE_SIZE
+                instruction = FILE_CACHE.load(urlparse.urlunsplit(resolved_uri))
 
             else:
                 raise InvalidInstructionError("Reference to unsupported scheme '%s'" % (
                     resolved_uri.scheme))
             return instruction, urlparse.urlunsplit(resolved_uri)
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, CacheMissError) as e:
             raise InvalidInstructionError("Couldn't load '%s': %s" % (resolved_uri, e))
-        except IOError as e:
+        except (IOError, OSError) as e:
             raise InvalidInstructionError("Couldn't open '%s': %s" % (resolved_uri, e))
         except ValueError as e:
             raise InvalidInstructionError("Invalid JSON in '%s'" % resolved_uri)
 
-    def _scrape_find(self, req, instruction, description, then, else_):
+    def _scrape_find(self, req, plan):
         """
-        Scrape a find instruction
+        Scrape a find plan
         """
-        if sum(('find' in instruction, 'xpath' in instruction, 'jsonpath' in instruction, )) > 1:
-            raise InvalidInstructionError("Conflicting find/xpath/jsonpath")
-
         tags = req.tags
-        xpath_sub, find_sub, jsonpath_sub = (None, None, None)
-        if 'find' in instruction:
-            k = 'find'
-            find_sub = Substitution(instruction[k], tags)
-            k_sub = find_sub
-            replace_unsubbed = instruction.get('replace', '$0')
-            ignore_case = instruction.get('case_insensitive', False)
-            multiline = instruction.get('multiline', False)
-            dot_matches_all = instruction.get('dot_matches_all', True)
-        elif 'xpath' in instruction:
-            k = 'xpath'
-            xpath_sub = Substitution(instruction[k], tags)
-            k_sub = xpath_sub
-        elif 'jsonpath' in instruction:
-            k = 'jsonpath'
-            jsonpath_sub = Substitution(instruction[k], tags)
-            k_sub = jsonpath_sub
-
-        tag_match_sub = Substitution(instruction.get('tag_match'), tags)
-        name_sub = Substitution(instruction.get('name'), tags)
-        join_sub = Substitution(instruction.get('join', None), tags)
-
-        # Default to full range
-        min_match_raw = instruction.get('min_match', 0)
-        max_match_raw = instruction.get('max_match', -1)
-        match_raw = instruction.get('match', None)
-
-        # Use single match if it was defined
-        min_match_sub = Substitution(min_match_raw if match_raw is None else match_raw, tags)
-        max_match_sub = Substitution(max_match_raw if match_raw is None else match_raw, tags)
-
-        substitutions = [find_sub, name_sub, min_match_sub, max_match_sub, tag_match_sub,
-                         join_sub, xpath_sub]
+        k_sub = plan.expression.substitute(tags)
+        name_sub = plan.name.substitute(tags)
+        min_match_sub = plan.min_match.substitute(tags)
+        max_match_sub = plan.max_match.substitute(tags)
+        tag_match_sub = plan.tag_match.substitute(tags)
+        join_sub = plan.join.substitute(tags)
+
+        substitutions = [k_sub, name_sub, min_match_sub, max_match_sub, tag_match_sub,
+                         join_sub]
         # Parameterize input if it was supplied
-        if 'input' in instruction:
-            input_sub = Substitution(instruction['input'], tags)
+        if plan.input is not None:
+            input_sub = plan.input.substitute(tags)
             substitutions.append(input_sub)
             if not len(input_sub.missing_tags):
                 input = input_sub.result
@@ -205,55 +261,72 @@ class Scraper(object):
         single_match = min_match == max_match or join != None
         max_match = None if max_match == -1 else max_match + 1
 
+        # Single matches set tags for their siblings, so must be scraped
+        # right away.
+        lazy = self._lazy and not single_match
+
         name = name_sub.result if name_sub.result else None
 
-        tags = req.tags
         tag_match = tag_match_sub.result
+        expression = plan.instruction[plan.key]
 
-        if find_sub:
+        if plan.key == 'find':
             try:
-                regex = Regex(find_sub.result, ignore_case, multiline, dot_matches_all,
-                              replace_unsubbed)
+                regex = plan.pattern(k_sub.result)
 
                 # This lets through max_match = None, which is OK for generator
                 if min_match > -1 and max_match > -1:
                     subs = regex.substitutions(input, min_match, max_match)
+                elif lazy and min_match > -1 and max_match is None:
+                    subs = regex.substitutions(input, min_match)
                 # Negative values mean we can't utilize the generator, sadly...
                 else:
                     subs = [s for s in regex.substitutions(input)][min_match:max_match]
             except PatternError as e:
-                return Failed(req, "'%s' failed because of %s" % (instruction[k], e))
+                return Failed(req, "'%s' failed because of %s" % (expression, e))
 
-        elif xpath_sub:
+        elif plan.key == 'xpath':
             try:
-                tree = etree.HTML(input)
-                subs = [m.text for m in tree.xpath(xpath_sub.result)][min_match:max_match]
+                xpath = plan.pattern(k_sub.result)
+                tree = req.documents.html(input)
+                subs = [m.text for m in xpath(tree)][min_match:max_match]
 
-            except etree.XPathEvalError as e:
-                return Failed(req, "'%s' failed because of %s" % (instruction[k],
+            except etree.XPathError as e:
+                return Failed(req, "'%s' failed because of %s" % (expression,
                                                                   str(e)))
 
-        elif jsonpath_sub:
+        elif plan.key == 'jsonpath':
             try:
-                json_input = json.loads(input)
+                json_input = req.documents.json(input)
             except ValueError as e:
                 return Failed(req, "'%s' failed because its input '%s' was not JSON" % (
-                    instruction[k], input[:200]))
+                    expression, input[:200]))
 
             try:
-                jsonpath_expr = jsonpath_parse(jsonpath_sub.result)
-            except:
+                jsonpath_expr = plan.pattern(k_sub.result)
+            except Exception:
                 return Failed(req, "'%s' failed because it is not a valid jsonpath expression" % (
-                    instruction[k]))
+                    expression))
 
             subs = [m.value for m in jsonpath_expr.find(json_input)][min_match:max_match]
 
+        if lazy:
+            subs = iter(subs)
+            try:
+                first = next(subs, _NO_MATCH)
+            except PatternError as e:
+                return Failed(req, "'%s' failed because of %s" % (expression, e))
+            if first is not _NO_MATCH:
+                return self._lazy_find(req, plan, name, tag_match, first, subs)
+            subs = []
+
         # Join subs into a single result.
         if join:
             subs = [join.join(subs)]
 
         greenlets = []
         replaced_subs = []
+        forks = []
         # Call children once for each substitution, using it as input
         # and with a modified set of tags.
         for i, s_unsubbed in enumerate(subs):
@@ -284,66 +357,239 @@ class Scraper(object):
             if name is not None:
                 fork_tags[name] = s_subbed
 
-            if then:
-                child_scraper = Scraper(session=self._session, force_all=self._force_all, pool=self._pool)
-                greenlets.append(child_scraper.scrape_async(then,
-                                                            id=req.id,
-                                                            tags=fork_tags,
-                                                            input=s_subbed,
-                                                            uri=req.uri))
+            forks.append(fork_tags)
+            if plan.then:
+                greenlets.append(self._scrape_plan_async(plan.then, fork_tags,
+                                                         s_subbed, req.id,
+                                                         req.documents,
+                                                         req.child_path(name)))
             else:
                 greenlets.append(None)
 
         if len(greenlets) == 0:
-            if else_:
-                return self.scrape_async(else_,
-                                         id=req.id,
-                                         tags=tags,
-                                         input=input,
-                                         uri=req.uri)
+            if plan.else_:
+                return self._scrape_plan(plan.else_, tags, input, False, req.id,
+                                         req.documents, req.path)
             else:
                 return Failed(req, "No matches for '%s', evaluated to '%s'" % (
-                    instruction[k], k_sub.result))
-
-        #gevent.joinall(greenlets)
+                    expression, k_sub.result))
 
         # Build Results with responses from greenlets, substitute in tags
         results = []
         for i, replaced_sub in enumerate(replaced_subs):
             g = greenlets[i]
-            if g == None:
+            if g is None:
+                self._emit(req, name, replaced_sub, forks[i])
+                if not self._keep_results:
+                    continue
                 child_resps = []
-            elif self._pool:
+            elif self._pool is not None:
                 child_resps = g.get()
             else:
                 child_resps = g
             results.append(Result(replaced_sub, child_resps))
 
-        return DoneFind(req, name, description, results)
+        return DoneFind(req, name, plan.description, results)
 
-    def _scrape_load(self, req, instruction, description, then):
+    def _lazy_result(self, req, plan, name, tag_match, i, s_unsubbed):
         """
-        Scrape a load instruction
+        Build the LazyResult of a find's ith match.
 
-        :returns: DoneLoad, Wait, MissingTags, or Failed
+        :returns: (LazyResult, None), or (None, missing tags)
         """
-        if 'load' not in instruction:
-            raise InvalidInstructionError("Missing URL in `load` key")
+        fork_tags = InheritedDict(req.tags)
+        if tag_match:
+            fork_tags[tag_match] = str(i)
+
+        s_sub = Substitution(s_unsubbed, fork_tags)
+        if s_sub.missing_tags:
+            return None, s_sub.missing_tags
+        s_subbed = s_sub.result
+
+        if name is not None:
+            fork_tags[name] = s_subbed
+
+        if plan.then:
+            scrape = functools.partial(self._scrape_plan, plan.then, fork_tags,
+                                       s_subbed, False, req.id, req.documents,
+                                       req.child_path(name))
+        else:
+            scrape = None
+            self._emit(req, name, s_subbed, fork_tags)
+        return LazyResult(s_subbed, scrape), None
 
-        method = instruction.get('method', 'get')
-        if method not in ['head', 'get', 'post']:
-            raise InvalidInstructionError("Illegal HTTP method: %s" % method)
+    def _lazy_find(self, req, plan, name, tag_match, first, rest):
+        """
+        Build the DoneFind of a find in lazy mode.  Matches after the first
+        are only found, and children only scraped, as they are read.
 
+        :returns: DoneFind, or MissingTags for the first match
+        """
+        result, missing_tags = self._lazy_result(req, plan, name, tag_match,
+                                                 0, first)
+        if missing_tags:
+            return MissingTags(req, missing_tags)
+
+        # Leaves are sent to the sink as they are produced, whether or not
+        # they are kept.
+        keep = self._keep_results or plan.then
+
+        def results():
+            if keep:
+                yield result
+            for i, s_unsubbed in enumerate(rest, 1):
+                result_i, missing_tags = self._lazy_result(req, plan, name,
+                                                           tag_match, i, s_unsubbed)
+                if missing_tags:
+                    raise TemplateError("Match %s of '%s' is missing tags %s" % (
+                        i, plan.instruction[plan.key], missing_tags))
+                if keep:
+                    yield result_i
+
+        return DoneFind(req, name, plan.description, LazyResults(results()))
+
+    def _emit(self, req, name, value, tags):
+        """
+        Send the Leaf of a result with no children to the sink, if there is
+        one.  The Body of a load is only decoded to be sent.
+        """
+        if self._sink is not None:
+            if isinstance(value, Body):
+                value = value.text
+            leaf = Leaf(req.child_path(name), value, tags, req.id)
+            with self._sink_lock:
+                self._sink(leaf)
+
+    def _send(self, opts, timeout=None, finds=None):
+        """
+        Send a request built from opts.  If the scraper has a download
+        policy, or there are incremental finds, the body is streamed.
+
+        :returns: requests.Response
+        """
+        download = self._download
+        if download is None and finds:
+            download = DownloadPolicy()
+        stream = download is not None
+
+        # Only gevent pools need grequests' monkey-patching.
+        if self._pool is None or isinstance(self._pool, ThreadPool):
+            prepared_req = requests.Request(**opts).prepare()
+            resp = self._session.send(prepared_req, timeout=timeout,
+                                      stream=stream)
+        else:
+            grequests = _loader.grequests
+            async_req = grequests.AsyncRequest(session=self._session,
+                                               timeout=timeout, stream=stream,
+                                               **opts)
+            async_req.send()
+            # grequests keeps exceptions rather than raising them.
+            if async_req.response is None:
+                raise async_req.exception
+            resp = async_req.response
+
+        if finds:
+            counters = [MatchCounter(regex, needed) for regex, needed in finds]
+            download.read(resp, lambda body: all(c.feed(body) for c in counters))
+        elif stream:
+            download.read(resp)
+        return resp
+
+    def _fetch(self, opts, timeout=None, finds=None):
+        """
+        Send a request built from opts once the scheduler allows it.  With
+        an archive, the response comes from it without waiting.
+
+        :returns: requests.Response
+        """
+        if self._archive is not None:
+            return self._archive.response(opts)
+        if self._scheduler is None:
+            return self._send(opts, timeout, finds)
+        with self._scheduler.slot(opts['url']):
+            return self._send(opts, timeout, finds)
+
+    def _incremental_finds(self, plan, tags):
+        """
+        Obtain the regex of each find in an incremental load's `then`, with
+        how many matches it needs for its max_match.  Is None if the whole
+        body must be read.
+
+        :returns: tuple of (Regex, int), or None
+        """
+        if not plan.incremental or not plan.then:
+            return None
+        finds = plan.then.plans if isinstance(plan.then, ListPlan) else [plan.then]
+
+        incremental_finds = []
+        for find in finds:
+            if not isinstance(find, FindPlan) or find.key != 'find' or \
+               find.input is not None:
+                return None
+            expression_sub = find.expression.substitute(tags)
+            max_match_sub = find.max_match.substitute(tags)
+            if expression_sub.missing_tags or max_match_sub.missing_tags:
+                return None
+            try:
+                max_match = int(max_match_sub.result)
+                regex = find.pattern(expression_sub.result)
+            except (ValueError, PatternError):
+                return None
+            # A pattern that can match differently once there's more input,
+            # like a greedy .*, needs the whole body.
+            if max_match < 0 or regex.lookahead is None:
+                return None
+            incremental_finds.append((regex, max_match + 1))
+        return tuple(incremental_finds)
+
+    def _load(self, opts, policy, attempts, finds=None):
+        """
+        Obtain the response to a request built from opts, along with its
+        Body.  The outcome of each attempt is appended to attempts.
+
+        :returns: (requests.Response, Body)
+        """
+        def fetch(opts, timeout):
+            return self._fetch(opts, timeout, finds)
+
+        def send(opts):
+            # Archived responses would be the same if retried.
+            if self._archive is not None:
+                resp = fetch(opts, None)
+                attempts.append(resp.status_code)
+                return resp
+            return policy.call(fetch, opts, attempts)
+
+        # Cached responses don't need to wait for the scheduler.
+        if self._cache is None:
+            resp = send(opts)
+        else:
+            resp = self._cache.fetch(opts, send)
+
+        # Make sure we're using UTF-8.  The body is only decoded if it
+        # isn't UTF-8 already.
+        if resp.encoding and resp.encoding.lower() == 'utf-8':
+            body = Body(resp.content)
+        else:
+            body = Body(resp.text.encode('utf-8', 'ignore'))
+        return resp, body
+
+    def _scrape_load(self, req, plan):
+        """
+        Scrape a load plan
+
+        :returns: DoneLoad, Wait, MissingTags, or Failed
+        """
         tags = req.tags
-        urlSub = Substitution(instruction['load'], tags)
-        nameSub = Substitution(instruction.get('name'), tags)
-        postsSub = Substitution(instruction.get('posts'), tags)
-        cookiesSub = Substitution(instruction.get('cookies', {}), tags)
-        headersSub = Substitution(instruction.get('headers', {}), tags)
+        urlSub = plan.url.substitute(tags)
+        nameSub = plan.name.substitute(tags)
+        postsSub = plan.posts.substitute(tags)
+        cookiesSub = plan.cookies.substitute(tags)
+        headersSub = plan.headers.substitute(tags)
 
         # Extract our missing tags, if any
         missing_tags = Substitution.add_missing(urlSub, nameSub, postsSub,
-                                                cookiesSub)
+                                                cookiesSub, headersSub)
         if len(missing_tags):
             return MissingTags(req, missing_tags)
 
@@ -351,14 +597,24 @@ class Scraper(object):
         name = nameSub.result if nameSub.result else None
 
         if req.force != True:
-            return Wait(req, name, description)
+            return Wait(req, name, plan.description)
 
         posts = postsSub.result
         cookies = cookiesSub.result
         headers = headersSub.result
+        method = plan.method
+
+        if plan.retry_overrides:
+            policy = self._retry.override(retries=plan.retries,
+                                          timeout=plan.timeout,
+                                          backoff=plan.backoff)
+        else:
+            policy = self._retry
+        attempts = []
+        start = time.time()
 
         try:
-            opts = dict(url=urlSub.result,
+            opts = dict(url=url,
                         cookies=cookies,
                         headers=headers,
                         method=method)
@@ -367,135 +623,156 @@ class Scraper(object):
                 # Force use of POST if post-data was set.
                 opts['method'] = 'post'
 
-            if self._pool is None:
-                prepared_req = requests.Request(**opts).prepare()
-                resp = self._session.send(prepared_req)
-            else:
-                grequests = _loader.grequests
-                async_req = grequests.AsyncRequest(session=self._session,
-                                                   **opts)
-                async_req.send()
-                resp = async_req.response
-
-            # Make sure we're using UTF-8
-            if resp.encoding and resp.encoding.lower() == 'utf-8':
-                resp_content = resp.content
-            else:
-                resp_content = resp.text.encode('utf-8', 'ignore')
+            # Identical loads in progress at once share a single response.
+            # Incremental loads can only share with loads that stop at the
+            # same point.
+            finds = self._incremental_finds(plan, tags)
+            key = request_key(opts)
+            if finds:
+                key = (key, finds)
+            resp, body = self._flights.do(key, self._load, opts, policy,
+                                          attempts, finds)
+            elapsed = time.time() - start
 
             if resp.status_code == 200:
                 # Call children using the response text as input
-                child_scraper = Scraper(session=self._session, force_all=self._force_all, pool=self._pool)
-
-                scraper_results = child_scraper.scrape(then,
-                                                       id=req.id,
-                                                       tags=tags,
-                                                       input=resp_content,
-                                                       uri=req.uri)
-                result = Result(resp.text, scraper_results)
-                return DoneLoad(req, name, description, result, resp.cookies)
-            else:
-                return Failed(req, "Status code %s from %s" % (
-                    resp.status_code, url))
-        except requests.exceptions.RequestException as e:
-            return Failed(req, "%s" % e)
-
-    def _extend_instruction(self, orig, extension):
-        """
-        Extend one instruction with another.  Orig and extension are modified
-        in-place!
-        """
-        # keys that are turned into arrays & extended
-        for ex_key in ['extends', 'then']:
-            # Nothing to extend, skip out the pop at end
-            if ex_key not in extension:
-                continue
-            # We can just copy it over
-            elif ex_key not in orig:
-                orig[ex_key] = extension[ex_key]
-            else:
-                # Wrap the original value in a list
-                if not isinstance(orig[ex_key], list):
-                    orig[ex_key] = [orig[ex_key]]
-
-                # Insert values at beginning if extension is also list, append otherwise.
-                if isinstance(extension[ex_key], list):
-                    for i, v in enumerate(extension[ex_key]):
-                        orig[ex_key].insert(i, v)
+                if plan.then:
+                    scraper_results = self._scrape_plan(plan.then, tags,
+                                                        body.content, False,
+                                                        req.id, req.documents,
+                                                        req.child_path(name))
                 else:
-                    orig[ex_key].insert(0, extension[ex_key])
-
-            # Clear out key for update at end
-            extension.pop(ex_key)
-
-        # keys that are updated
-        for up_key in ['cookies', 'headers', 'posts']:
-            # Nothing to update, skip out pop at end
-            if up_key not in extension:
-                continue
-            # We can just copy it over
-            elif up_key not in orig:
-                orig[up_key] = extension[up_key]
-            # If they're both dicts, then we update.  If not, then a replace
-            # will happen.
+                    scraper_results = []
+                    self._emit(req, name, body, tags)
+                keep_body = self._keep_bodies and (self._keep_results or plan.then)
+                result = Result(body if keep_body else None, scraper_results)
+                return DoneLoad(req, name, plan.description, result,
+                                resp.cookies, len(attempts), elapsed)
             else:
-                orig_val = orig[up_key]
-                up_val = extension[up_key]
-                # Prefer orig_val
-                if isinstance(orig_val, dict) and isinstance(up_val, dict):
-                    up_val.update(orig_val)
-                    orig[up_key] = up_val
-                # Keep things available for total replacement.
-                else:
-                    continue
+                return Failed(req, "Status code %s from %s" % (
+                    resp.status_code, url), len(attempts), elapsed)
+        except (requests.exceptions.RequestException, CacheMissError,
+                LoadAbortedError, ArchiveMissError) as e:
+            return Failed(req, "%s" % e, len(attempts), time.time() - start)
 
-            # Clear out key for update at end
-            extension.pop(up_key)
+    def _flatten(self, instruction, uri):
+        """
+        Resolve the `extends` of a dict instruction.
 
-        # everything else is replaced.
-        orig.update(extension)
+        :returns: a shared, frozen dict instruction without `extends`
+        """
+        return RESOLVER.flatten(instruction, uri, self._load_uri)
 
-    def _scrape_dict(self, req, instruction):
+    def _compile(self, instruction, uri):
         """
-        Scrape a dict instruction.
+        Compile an instruction whose strings should be resolved lazily.
 
-        :returns: Response
+        :returns: Plan
         """
+        if isinstance(instruction, basestring):
+            return ReferencePlan(self, instruction, uri)
+
+        elif isinstance(instruction, list):
+            return ListPlan(self, instruction, uri,
+                            [self._compile(i, uri) for i in instruction])
 
-        while 'extends' in instruction:
-            extends = instruction.pop('extends')
-            if isinstance(extends, basestring):
-                loaded_instruction, target_uri = self._load_uri(req.uri, extends)
-                self._extend_instruction(instruction, loaded_instruction)
-            elif isinstance(extends, dict):
-                self._extend_instruction(instruction, extends)
-            elif isinstance(extends, list):
-                for ex in extends:
-                    if isinstance(ex, basestring):
-                        loaded_instruction, target_uri = self._load_uri(req.uri, ex)
-                        self._extend_instruction(instruction, loaded_instruction)
-                    elif isinstance(ex, dict):
-                        self._extend_instruction(instruction, ex)
-                    else:
-                        raise InvalidInstructionError("element of `extends` list must be a dict or str")
+        elif isinstance(instruction, dict):
+            instruction = self._flatten(instruction, uri)
+
+            if any(k in instruction for k in FIND_KEYS):
+                return FindPlan(self, instruction, uri)
+            elif 'load' in instruction:
+                return LoadPlan(self, instruction, uri)
             else:
-                raise TypeError()
+                raise InvalidInstructionError("Could not find `find` or `load` key.")
+
+        # Fail.
+        else:
+            raise InvalidInstructionError(instruction)
+
+    def _scrape_plan(self, plan, tags, input, force, req_id, documents=None,
+                     path=()):
+        """
+        Run a compiled plan.  Unless this scraper was given a DocumentCache
+        to share between scrapes, each top-level scrape gets its own.  path
+        is the names of the results the plan is run under.
+
+        :returns: Response or list of Responses
+        """
+        if documents is None:
+            documents = self._documents or DocumentCache(json_loads=self._json_loads)
+
+        # Override force with force_all
+        if self._force_all is True:
+            force = True
+
+        # Have to track down the instruction.
+        if isinstance(plan, ReferencePlan):
+            reference_sub = plan.reference.substitute(tags)
+            if reference_sub.missing_tags:
+                req = Request(plan.instruction, tags, input, force, req_id,
+                              plan.uri, documents, path, self._keep_context)
+                return MissingTags(req, reference_sub.missing_tags)
+            return self._scrape_plan(plan.target(reference_sub.result), tags,
+                                     input, force, req_id, documents, path)
+
+        req = Request(plan.instruction, tags, input, force, req_id, plan.uri,
+                      documents, path, self._keep_context)
+
+        # Handle each element of list separately within this context.  They
+        # share tags, which a member may set for those after it, so they are
+        # run in order, even with a pool.
+        if isinstance(plan, ListPlan):
+            return [self._scrape_plan(p, tags, input, force, req_id,
+                                      documents, path)
+                    for p in plan.plans]
 
         # Imperfect solution, but updating tags in request directly
         # should be safe at this point.
-        tags = instruction.get('tags', {})
-        req.tags.update(tags)
+        req.tags.update(plan.tags)
 
-        then = instruction.get('then', [])
-        else_ = instruction.get('else', [])
-        description = instruction.get('description', None)
+        if isinstance(plan, FindPlan):
+            return self._scrape_find(req, plan)
+        else:
+            return self._scrape_load(req, plan)
 
-        if 'find' in instruction or 'xpath' in instruction or 'jsonpath' in instruction:
-            return self._scrape_find(req, instruction, description, then, else_)
-        elif 'load' in instruction:
-            return self._scrape_load(req, instruction, description, then)
+    def _scrape_plan_async(self, plan, tags, input, req_id, documents, path):
+        """
+        Run a compiled plan like `_scrape_plan`, except in the pool if there
+        is one.
+        """
+        if self._pool is None:
+            return self._scrape_plan(plan, tags, input, False, req_id,
+                                     documents, path)
         else:
-            raise InvalidInstructionError("Could not find `find` or `load` key.")
+            return self._pool.spawn(self._scrape_plan, plan, tags, input, False,
+                                    req_id, documents, path)
+
+    def compile(self, instruction, uri=None):
+        """
+        Compile an instruction into a Plan.  `extends` are resolved, literal
+        templates substituted, and patterns compiled once, so that the plan
+        can be run many times against different tags and input.
+
+        :param: instruction An instruction, either as a string, dict, or list
+        :type: str, dict, list
+        :param: (optional) uri URI to resolve from
+        :type: str
+
+        :returns: Plan
+        """
+        if uri is None:
+            uri = CURDIR + os.path.sep
+
+        # Resolve what we can of the instruction now, the rest must wait for
+        # tags.
+        while isinstance(instruction, basestring):
+            instructionSub = Substitution(instruction, {})
+            if instructionSub.missing_tags:
+                break
+            instruction, uri = self._load_uri(uri, instructionSub.result)
+
+        return self._compile(instruction, uri)
 
     def scrape(self, instruction, tags={}, input='', force=False, **kwargs):
         """
@@ -521,53 +798,85 @@ class Scraper(object):
         #req_id = kwargs.pop('id', str(uuid.uuid4()))
         req_id = kwargs.pop('id', None)
 
-        # Override force with force_all
-        if self._force_all is True:
-            force = True
+        return self.compile(instruction, uri=uri).run(tags, input, force, id=req_id)
 
-        # Have to track down the instruction.
-        while isinstance(instruction, basestring):
-            instructionSub = Substitution(instruction, tags)
-            if instructionSub.missing_tags:
-                return MissingTags(self, instructionSub.missingTags)
-            instruction, uri = self._load_uri(uri, instructionSub.result)
+    def scrape_many(self, instruction, items, workers=10, backend='thread',
+                    ordered=True, tags=None, force=False, uri=None):
+        """
+        Scrape one instruction over a batch.  The instruction is compiled
+        once, and each item is scraped with its index as the request ID.
 
-        req = Request(instruction, tags, input, force, req_id, uri)
-
-        # Handle each element of list separately within this context.
-        if isinstance(instruction, list):
-            if self._pool is None:
-                return map(lambda i: Scraper(session=self._session,
-                                             force_all=self._force_all,
-                                             pool=self._pool
-                                            ).scrape(i,
-                                                     id=req_id,
-                                                     tags=tags,
-                                                     input=input,
-                                                     force=force,
-                                                     uri=uri),
-                           instruction)
-            else:
-                greenlets = map(lambda i: Scraper(session=self._session,
-                                                  force_all=self._force_all,
-                                                  pool = self._pool
-                                                 ).scrape_async(i,
-                                                                id=req_id,
-                                                                tags=tags,
-                                                                input=input,
-                                                                force=force,
-                                                                uri=uri),
-                                instruction)
-                _loader.gevent.joinall(greenlets)
-                return [g.get() for g in greenlets]
-
-        # Dict instructions are ones we can actually handle
-        elif isinstance(instruction, dict):
-            return self._scrape_dict(req, instruction)
+        :param: instruction An instruction, either as a string, dict, or list
+        :type: str, dict, list
+        :param: items An iterable of inputs, dicts of tags, or (tags, input)
+                tuples
+        :param: (optional) workers The number of items scraped at once
+        :type: int
+        :param: (optional) backend 'thread', 'gevent' or 'process'.  Each
+                worker process compiles the instruction once with a Scraper
+                built from this one's settings, and returns the JSON of its
+                Responses.
+        :type: str
+        :param: (optional) ordered Whether to yield in the order of items,
+                rather than as each is finished
+        :type: bool
+        :param: (optional) tags Tags to use for every item
+        :type: dict
 
-        # Fail.
-        else:
-            raise InvalidInstructionError(instruction)
+        :returns: generator of batch.Item
+        """
+        # Compiled here even for worker processes, so that a bad
+        # instruction raises now.
+        plan = self.compile(instruction, uri=uri)
+
+        if backend == 'process':
+            return run_batch(scrape_in_process, items, workers, backend, ordered,
+                             init_process, (instruction, uri, tags, force,
+                                            self._worker_settings()))
+
+        def scrape(index, item):
+            item_tags, input = split_input(item, tags)
+            return plan.run(item_tags, input, force, id=index)
+
+        return run_batch(scrape, items, workers, backend, ordered)
+
+    def _worker_settings(self):
+        """
+        Obtain the keyword arguments to build a Scraper like this one in a
+        worker process.  Each worker has its own DocumentCache and coalesces
+        its own loads.  Raises ValueError for settings that can't be carried
+        over.
+
+        :returns: dict, with the size of any ThreadPool as pool_size
+        """
+        if self._sink is not None:
+            raise ValueError("Worker processes can't send leaves to a sink")
+        if self._scheduler is not None:
+            raise ValueError("Worker processes can't share a scheduler")
+        if self._pool is not None and not isinstance(self._pool, ThreadPool):
+            raise ValueError("Worker processes can't share a gevent pool")
+        if self._cache is not None and \
+           not isinstance(getattr(self._cache, 'backend', None), DiskBackend):
+            raise ValueError("Worker processes can only share a cache with a "
+                             "DiskBackend")
+
+        settings = dict(session=self._session,
+                        force_all=self._force_all,
+                        json_loads=self._json_loads,
+                        cache=self._cache,
+                        retry=self._retry,
+                        keep_bodies=self._keep_bodies,
+                        download=self._download,
+                        lazy=self._lazy,
+                        keep_context=self._keep_context,
+                        archive=self._archive,
+                        pool_size=self._pool.size if self._pool is not None else None)
+        try:
+            cPickle.dumps(settings, cPickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            raise ValueError("Scraper settings can't be sent to worker "
+                             "processes: %s" % e)
+        return settings
 
     def scrape_async(self, instruction, tags={}, input='', force=False, **kwargs):
         """
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+import json
+from collections import Mapping
+
+from .responses import Response, Ready, Result, truncate_value
+from .templates import InheritedDict
+
+# Output is buffered into writes of about this many characters.
+BUFFER_SIZE = 65536
+
+
+def _unencodable(obj):
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    return "Unencodable (%s)" % obj
+
+ENCODER = json.JSONEncoder(default=_unencodable)
+
+
+def _tags(resp, parent_tags, all_tags):
+    """
+    Obtain the tags to write for a Response.  Unless all_tags is set, a
+    nested Response only has those set since the Response above it.
+    """
+    tags = resp._tags
+    if not all_tags and isinstance(tags, InheritedDict):
+        return tags.since(parent_tags)
+    return tags
+
+
+def _write(responses, write, truncated, all_tags=False):
+    """
+    Write the JSON of a Response tree a piece at a time, without building
+    its dicts.  The tree is walked with a stack rather than recursion, so
+    deep trees can be written.  Each node is stacked with the tags of the
+    Response above it.
+    """
+    encode = ENCODER.encode
+    stack = [(responses, None)]
+    while stack:
+        node, parent_tags = stack.pop()
+        if isinstance(node, basestring):
+            write(node)
+        elif isinstance(node, list):
+            parts = ['[']
+            for i, item in enumerate(node):
+                if i:
+                    parts.append(', ')
+                parts.append(item)
+            parts.append(']')
+            stack.extend((part, parent_tags) for part in reversed(parts))
+        elif isinstance(node, Result):
+            value = node.value
+            if truncated:
+                value = truncate_value(value)
+            write('{"value": ' + encode(value))
+            if node.children:
+                stack.extend([('}', None), (node.children, parent_tags)])
+                write(', "children": ')
+            else:
+                write('}')
+        elif isinstance(node, Response):
+            fields = []
+            for k, v in node._fields():
+                if k == 'tags':
+                    v = _tags(node, parent_tags, all_tags)
+                fields.append(encode(k) + ': ' + encode(v))
+            write('{' + ', '.join(fields))
+            if isinstance(node, Ready):
+                stack.extend([('}', None), (list(node.results), node._tags)])
+                write(', "results": ')
+            else:
+                write('}')
+        else:
+            write(encode(node))
+
+
+class _BufferedWriter(object):
+
+    def __init__(self, fp):
+        self._fp = fp
+        self._parts = []
+        self._size = 0
+
+    def write(self, s):
+        self._parts.append(s)
+        self._size += len(s)
+        if self._size >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            self._fp.write(''.join(self._parts))
+            self._parts = []
+            self._size = 0
+
+
+def dump(responses, fp, truncated=True, all_tags=False):
+    """
+    Write a Response, or list of Responses, to a file-like object as the
+    JSON of their `as_dict`, except that nested Responses only have the
+    tags that differ from the Response above them.
+
+    :param: responses The Response or list of Responses
+    :param: fp A file-like object with a `write` method
+    :param: (optional) truncated Whether to shorten long values, as
+            `as_dict` does
+    :param: (optional) all_tags Whether to write every Response's tags
+            in full, as `as_dict` does
+    """
+    writer = _BufferedWriter(fp)
+    _write(responses, writer.write, truncated, all_tags)
+    writer.flush()
+
+
+def dumps(responses, truncated=True, all_tags=False):
+    """
+    Obtain the JSON of a Response, or list of Responses, as `dump` would
+    write it.
+    """
+    parts = []
+    _write(responses, parts.append, truncated, all_tags)
+    return ''.join(parts)
+
+
+def dump_lines(responses, fp, truncated=True, all_tags=False):
+    """
+    Write each of a list of Responses to a file-like object as a line of
+    JSON, as `dump` would write it.
+    """
+    if not isinstance(responses, list):
+        responses = [responses]
+    writer = _BufferedWriter(fp)
+    for resp in responses:
+        _write(resp, writer.write, truncated, all_tags)
+        writer.write('\n')
+    writer.flush()
+
+
+def dump_rows(responses, fp):
+    """
+    Write the `flattened_values` of a Response, or list of Responses, to a
+    file-like object as lines of JSON, one for each row.
+    """
+    if not isinstance(responses, list):
+        responses = [responses]
+    writer = _BufferedWriter(fp)
+    for resp in responses:
+        if not isinstance(resp, Ready):
+            continue
+        rows = resp.flattened_values
+        if not isinstance(rows, list):
+            rows = [rows]
+        for row in rows:
+            writer.write(ENCODER.encode(row))
+            writer.write('\n')
+    writer.flush()
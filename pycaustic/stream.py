@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+from .responses import Ready
+
+
+class Leaf(object):
+    """
+    A result with no children, along with the names of the results it was
+    found under.
+    """
+    __slots__ = ('_path', '_value', '_tags', '_request_id')
+
+    def __init__(self, path, value, tags, request_id=None):
+        self._path = path
+        self._value = value
+        self._tags = tags
+        self._request_id = request_id
+
+    def __repr__(self):
+        return 'Leaf(%r, %r)' % (self._path, self._value)
+
+    @property
+    def path(self):
+        """
+        A tuple of the names from the top of the scrape down to this
+        result.  Unnamed instructions are left out.
+        """
+        return self._path
+
+    @property
+    def name(self):
+        """
+        The name of this result, or None if it has none.
+        """
+        return self._path[-1] if self._path else None
+
+    @property
+    def value(self):
+        return self._value
+
+    @property
+    def tags(self):
+        """
+        The tags available to this result, including its own name and the
+        names of the results it was found under.
+        """
+        return self._tags
+
+    @property
+    def request_id(self):
+        return self._request_id
+
+
+def _results(responses, path):
+    """
+    Obtain a generator of each result of a list of Responses, with the path
+    of names down to it and the id of its request.
+    """
+    for resp in responses:
+        if not isinstance(resp, Ready):
+            continue
+        resp_path = path + (resp.name, ) if resp.name is not None else path
+        for result in resp.results:
+            yield result, resp_path, resp.id
+
+
+def leaves(responses, path=()):
+    """
+    Obtain a generator of the Leaf of each result with no children in a
+    Response tree, depth first.  Scraped with `lazy=True`, the tree is only
+    scraped as far as the generator is read.  The tree is walked with a
+    stack rather than recursion, so deep trees can be read.
+
+    Leaves from a tree read this way don't carry tags.
+    """
+    if not isinstance(responses, list):
+        responses = [responses]
+    stack = [_results(responses, path)]
+    while stack:
+        try:
+            result, resp_path, request_id = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            continue
+        if result.children:
+            stack.append(_results(result.children, resp_path))
+        else:
+            yield Leaf(resp_path, result.value, None, request_id)
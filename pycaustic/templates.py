@@ -4,53 +4,279 @@ import re
 import urllib
 import numbers
 from collections import MutableMapping
+from .cache import LRUCache
 from .errors import TemplateError, TemplateResultError
 
+# Marks a key that no InheritedDict in a chain has, so is looked up in the
+# chain's plain dict root.
+_ROOT = object()
+
+
 class InheritedDict(MutableMapping):
     """
     A dict that falls back on its parents for all key-misses, but never
     overwrites its parent.
+
+    Forking is cheap: nothing is copied.  Keys resolved from parents are
+    cached, so repeat lookups don't walk the chain.  Every InheritedDict in
+    a chain shares a clock, which writes to an InheritedDict with children
+    advance, and which invalidates the caches.
     """
 
     def __init__(self, parent):
         super(InheritedDict, self).__init__()
         self._parent = parent
         self._this = dict()
+        self._resolved = None
+        self._stamp = None
+        self._forked = False
+        if isinstance(parent, InheritedDict):
+            parent._forked = True
+            self._clock = parent._clock
+            self._root = parent._root
+        else:
+            self._clock = [0]
+            self._root = parent
 
     def __setitem__(self, k, v):
-        return self._this.__setitem__(k, v)
+        self._this[k] = v
+        if self._forked:
+            self._clock[0] += 1
 
     def __delitem__(self, k):
-        return self._this.__delitem__(k)
+        del self._this[k]
+        if self._forked:
+            self._clock[0] += 1
 
     def __getitem__(self, k):
         try:
-            return self._this.__getitem__(k)
+            return self._this[k]
+        except KeyError:
+            pass
+
+        clock = self._clock[0]
+        if self._stamp != clock:
+            self._resolved = {}
+            self._stamp = clock
+        resolved = self._resolved
+        try:
+            v = resolved[k]
+        except KeyError:
+            v = resolved[k] = self._resolve(k, clock)
+
+        if v is _ROOT:
+            if self._root is None:
+                raise KeyError(k)
+            return self._root[k]
+        return v
+
+    def _resolve(self, k, clock):
+        """
+        Find a key in the InheritedDicts above this one, using their caches
+        where they are current.
+
+        :returns: The value, or _ROOT if none of them has it.
+        """
+        node = self._parent
+        while isinstance(node, InheritedDict):
+            try:
+                return node._this[k]
+            except KeyError:
+                pass
+            if node._stamp == clock:
+                try:
+                    return node._resolved[k]
+                except KeyError:
+                    pass
+            node = node._parent
+        return _ROOT
+
+    def since(self, ancestor):
+        """
+        Obtain a dict of the keys set in this and its parents below
+        ancestor.  Is all the keys if ancestor isn't one of its parents.
+        """
+        keys = {}
+        node = self
+        while isinstance(node, InheritedDict) and node is not ancestor:
+            for k, v in node._this.iteritems():
+                keys.setdefault(k, v)
+            node = node._parent
+        if node is not ancestor:
+            return dict(self)
+        return keys
+
+    def __getstate__(self):
+        # The caches may hold _ROOT, which a copy wouldn't recognise, so
+        # they are left out.
+        state = self.__dict__.copy()
+        state['_resolved'] = state['_stamp'] = None
+        return state
+
+    def __contains__(self, k):
+        try:
+            self[k]
         except KeyError:
-            return self._parent.__getitem__(k)
+            return False
+        return True
 
-    def __len__(self, k):
-        parent_keys = set(self._parent.keys())
-        this_keys = set(self._this.keys())
-        return len(parent_keys.union(this_keys))
+    has_key = __contains__
+
+    def __len__(self):
+        return sum(1 for k in self)
 
     def __iter__(self):
         """
-        Unclear how to iterate over this and not repeat elements.
+        Iterate over the keys of this and its parents, nearest first,
+        without repeats.
         """
-        raise NotImplementedError
+        seen = set()
+        node = self
+        while isinstance(node, InheritedDict):
+            for k in node._this:
+                if k not in seen:
+                    seen.add(k)
+                    yield k
+            node = node._parent
+        if node is not None:
+            for k in node:
+                if k not in seen:
+                    yield k
+
+    def __repr__(self):
+        return 'InheritedDict(%r)' % dict(self)
+
+
+TEMPLATE_CACHE = LRUCache(maxsize=2048)
+_SPLITTERS = {}
+
+
+def _splitter(open_encoded, close_encoded, open_unencoded, close_unencoded):
+    """
+    Obtain the regex that finds tag references for a set of delimiters.
+    Unencoded references are tried first, as their delimiters contain the
+    encoded ones.
+    """
+    key = (open_encoded, close_encoded, open_unencoded, close_unencoded)
+    splitter = _SPLITTERS.get(key)
+    if splitter is None:
+        splitter = re.compile(
+            re.escape(open_unencoded) + r'([\w\d]+)' + re.escape(close_unencoded) +
+            '|' +
+            re.escape(open_encoded) + r'([\w\d]+)' + re.escape(close_encoded))
+        _SPLITTERS[key] = splitter
+    return splitter
+
+
+class Template(object):
+    """
+    A string template parsed into literal segments and tag references, so
+    that it can be rendered without any regex work.
+    """
 
-    def has_key(self, k):
-        this_has_key = self._this.has_key(k)
-        if this_has_key:
-            return this_has_key
+    def __init__(self, template, open_encoded='{{', close_encoded='}}',
+                 open_unencoded='{{{', close_unencoded='}}}'):
+        self._literals = []
+        self._refs = []
+
+        if open_encoded in template or open_unencoded in template:
+            splitter = _splitter(open_encoded, close_encoded,
+                                 open_unencoded, close_unencoded)
+            pos = 0
+            for match in splitter.finditer(template):
+                self._literals.append(template[pos:match.start()])
+                unencoded, encoded = match.groups()
+                if unencoded is None:
+                    self._refs.append((encoded, True))
+                else:
+                    self._refs.append((unencoded, False))
+                pos = match.end()
+            self._literals.append(template[pos:])
         else:
-            return self._parent.has_key(k)
+            self._literals.append(template)
+
+        self._tags = frozenset(tag for tag, encode in self._refs)
+
+    @property
+    def tags(self):
+        """
+        The set of tags that must be available to render this template.
+        """
+        return self._tags
+
+    @property
+    def is_literal(self):
+        return not self._refs
+
+    def render(self, tags):
+        """
+        Render this template.
+
+        :returns: (result, missing_tags).  The result is None if any tags
+                  were missing.
+        """
+        literals = self._literals
+        if not self._refs:
+            return literals[0], []
+
+        parts = [literals[0]]
+        missing_tags = []
+        for i, (tag, encode) in enumerate(self._refs):
+            try:
+                val = tags[tag]
+            except KeyError:
+                missing_tags.append(tag)
+                continue
+            parts.append(urllib.quote_plus(val, safe='') if encode else val)
+            parts.append(literals[i + 1])
+
+        if missing_tags:
+            return None, missing_tags
+        return ''.join(parts), missing_tags
+
+
+def compile_template(template, open_encoded='{{', close_encoded='}}',
+                     open_unencoded='{{{', close_unencoded='}}}'):
+    """
+    Obtain a Template for a string from TEMPLATE_CACHE, parsing and caching
+    it on a miss.  Only templates from instructions are cached, as plans are
+    compiled; scraped values are substituted without it.
+    """
+    key = (template, open_encoded, close_encoded, open_unencoded, close_unencoded)
+    compiled = TEMPLATE_CACHE.get(key)
+    if compiled is None:
+        compiled = Template(template, open_encoded, close_encoded,
+                            open_unencoded, close_unencoded)
+        TEMPLATE_CACHE.set(key, compiled)
+    return compiled
+
+
+def compile_templates(template):
+    """
+    Obtain a template from an instruction -- a string, number, or dict of
+    strings -- with its strings compiled to Templates, for `Substitution`.
+    """
+    if isinstance(template, basestring):
+        try:
+            return compile_template(str(template))
+        except UnicodeError:
+            raise TypeError("Template %s must be a bytestring" % template)
+    elif isinstance(template, dict):
+        return dict((compile_templates(k) if isinstance(k, basestring) else k,
+                     compile_templates(v) if isinstance(v, basestring) else v)
+                    for k, v in template.iteritems())
+    elif isinstance(template, numbers.Number):
+        return compile_template(str(template))
+    return template
 
 
 class Substitution(object):
     """
-    A single string substitution operation.
+    A single string substitution operation.  Tags are substituted in one
+    pass, so any templates in their values are left as they are.
+
+    The template may also be a Template, or a dict of them, from
+    `compile_templates`.
     """
 
     def __init__(self, template, tags={},
@@ -58,12 +284,14 @@ class Substitution(object):
                  open_unencoded='{{{', close_unencoded='}}}'):
         self._tags = tags
         self._missing_tags = []
-        self._encoded_re = re.compile(open_encoded + r'([\w\d]+)' + close_encoded)
-        self._unencoded_re = re.compile(open_unencoded + r'([\w\d]+)' + close_unencoded)
+        self._delimiters = (open_encoded, close_encoded,
+                            open_unencoded, close_unencoded)
 
         # A substitution on None just returns None
         if template is None:
             self._result = None
+        elif isinstance(template, Template):
+            self._result = self._sub(template)
         # Simple string, sub out components
         elif isinstance(template, basestring):
             try:
@@ -82,22 +310,16 @@ class Substitution(object):
             raise TemplateError("Substitutions can only be made on strings and dicts")
 
     def _sub(self, template):
-        tmp = self._unencoded_re.sub(self._replace_tag_unencoded, template)
-        return self._encoded_re.sub(self._replace_tag_encoded, tmp)
-
-    def _replace_tag_unencoded(self, match):
-        return self._replace_tag(match, False)
-
-    def _replace_tag_encoded(self, match):
-        return self._replace_tag(match, True)
-
-    def _replace_tag(self, match, encode):
-        tag_name = match.group(1)
-        if self._tags.has_key(tag_name):
-            val = self._tags.get(tag_name)
-            return val if not encode else urllib.quote_plus(val, safe='')
-        else:
-            self._missing_tags.append(tag_name)
+        if not isinstance(template, Template):
+            # Most strings substituted at scrape time are scraped values
+            # with no tags in them.
+            if self._delimiters[0] not in template and \
+               self._delimiters[2] not in template:
+                return template
+            template = Template(template, *self._delimiters)
+        result, missing_tags = template.render(self._tags)
+        self._missing_tags.extend(missing_tags)
+        return result
 
     @property
     def missing_tags(self):
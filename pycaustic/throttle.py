@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import urlparse
+from collections import deque
+from contextlib import contextmanager
+
+
+class _Host(object):
+    """
+    Scheduling state for a single host.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.waiters = deque()
+        self.next_allowed = 0.0
+        self.requests = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+
+class HostScheduler(object):
+    """
+    Schedules requests so that no host gets more than per_host at once, or
+    more than rate per second (in bursts of up to burst).  If total is set,
+    no more than that many requests run at once across all hosts, and free
+    slots are handed out round-robin between hosts with waiting requests.
+
+    With a gevent pool, pass green=True so that waiting yields to other
+    greenlets rather than blocking the thread.
+    """
+
+    def __init__(self, per_host=2, rate=None, burst=1, total=None, green=False):
+        self._per_host = per_host
+        self._interval = 1.0 / rate if rate else 0.0
+        self._burst = burst
+        self._total = total
+        self._active = 0
+        self._hosts = {}
+        self._ring = deque()
+        self._lock = threading.Lock()
+        self._green = green
+
+        if green:
+            import gevent
+            import gevent.event
+            self._event = gevent.event.Event
+            self._sleep = gevent.sleep
+        else:
+            self._event = threading.Event
+            self._sleep = time.sleep
+
+    def _host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _Host()
+        return state
+
+    def _has_room(self, state):
+        return (state.active < self._per_host and
+                (self._total is None or self._active < self._total))
+
+    def _grant(self, state):
+        """
+        Start a request for a host.  Returns how long it must wait for the
+        host's rate limit.
+        """
+        state.active += 1
+        state.requests += 1
+        self._active += 1
+
+        if not self._interval:
+            return 0.0
+        now = time.time()
+        earliest = now - self._interval * (self._burst - 1)
+        start = max(state.next_allowed, earliest)
+        state.next_allowed = start + self._interval
+        return max(0.0, start - now)
+
+    def _dispatch(self):
+        """
+        Grant waiting requests while there is room, one host at a time.
+        """
+        skipped = 0
+        while self._ring and skipped < len(self._ring):
+            host = self._ring[0]
+            self._ring.rotate(-1)
+            state = self._hosts[host]
+            if not state.waiters:
+                self._ring.remove(host)
+                skipped = 0
+            elif self._has_room(state):
+                waiter = state.waiters.popleft()
+                waiter[1] = self._grant(state)
+                waiter[0].set()
+                if not state.waiters:
+                    self._ring.remove(host)
+                skipped = 0
+            else:
+                skipped += 1
+
+    def acquire(self, url):
+        """
+        Wait until a request to url may start.
+        """
+        host = urlparse.urlsplit(url).netloc.lower()
+        queued_at = time.time()
+        with self._lock:
+            state = self._host(host)
+            # Anyone already waiting was waiting for room, so there's no
+            # one to jump ahead of if there's room now.
+            if not state.waiters and self._has_room(state):
+                delay = self._grant(state)
+                waiter = None
+            else:
+                waiter = [self._event(), None]
+                state.waiters.append(waiter)
+                if host not in self._ring:
+                    self._ring.append(host)
+
+        if waiter is not None:
+            waiter[0].wait()
+            delay = waiter[1]
+        if delay:
+            self._sleep(delay)
+
+        waited = time.time() - queued_at
+        with self._lock:
+            state.wait_time += waited
+            state.max_wait = max(state.max_wait, waited)
+        return host
+
+    def release(self, host):
+        """
+        Finish a request to a host returned by `acquire`.
+        """
+        with self._lock:
+            self._hosts[host].active -= 1
+            self._active -= 1
+            self._dispatch()
+
+    @property
+    def green(self):
+        """
+        Whether waiting yields to other greenlets.
+        """
+        return self._green
+
+    @contextmanager
+    def slot(self, url):
+        """
+        Hold a slot for a request to url for the duration of the block.
+        """
+        host = self.acquire(url)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def stats(self):
+        """
+        Obtain a dict of overall and per-host queue depth, active requests,
+        and time spent waiting.
+        """
+        with self._lock:
+            hosts = dict((host, {
+                'active': state.active,
+                'queued': len(state.waiters),
+                'requests': state.requests,
+                'wait_time': state.wait_time,
+                'max_wait': state.max_wait
+            }) for host, state in self._hosts.iteritems())
+        return {
+            'active': sum(h['active'] for h in hosts.itervalues()),
+            'queued': sum(h['queued'] for h in hosts.itervalues()),
+            'wait_time': sum(h['wait_time'] for h in hosts.itervalues()),
+            'hosts': hosts
+        }
@@ -1,8 +1,74 @@
+import errno
+import socket
 import sys
 import os
+import threading
+import BaseHTTPServer
+import SocketServer
 if sys.version[:3] < '2.7':
     import unittest2 as unittest
     unittest
 else:
     import unittest
 sys.path.insert(0, os.path.abspath('..'))
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that stop reading partway, like aborted downloads, hang up
+        # on the handler.  That's expected, so it isn't reported.
+        error = sys.exc_info()[1]
+        if isinstance(error, socket.error) and \
+           error.errno in (errno.EPIPE, errno.ECONNRESET):
+            return
+        BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+
+class LocalServer(object):
+    """
+    A stand-in HTTP server on localhost, run in a background thread.
+
+    `responder` is called with each request handler, and should return a
+    tuple of (status, headers dict, body).  Every handled request's
+    (method, path, headers, body) is appended to `requests`.
+    """
+
+    def __init__(self, responder):
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else ''
+                server.requests.append((self.command, self.path,
+                                        dict(self.headers), body))
+                status, headers, content = responder(self)
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(content)
+
+            do_GET = do_POST = do_HEAD = _respond
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        args=(0.01, ))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def url(self, path='/'):
+        return 'http://127.0.0.1:%s%s' % (self._httpd.server_address[1], path)
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from helpers import unittest
+from pycaustic import Scraper, archive as archive_module
+from pycaustic.archive import Archive, Record, url_key
+from pycaustic.errors import ArchiveError
+from pycaustic.mapped import MappedFile
+from pycaustic.retry import RetryPolicy
+
+ROSES = '<p>roses:red</p><a href="/violets">violets</a>'
+VIOLETS = '<p>violets:blue</p>'
+
+
+def warc_record(warc_type, url, block, content_type='application/http; msgtype=response'):
+    return ('WARC/1.0\r\n'
+            'WARC-Type: %s\r\n'
+            'WARC-Target-URI: %s\r\n'
+            'Content-Type: %s\r\n'
+            'Content-Length: %s\r\n'
+            '\r\n%s\r\n\r\n' % (warc_type, url, content_type, len(block), block))
+
+
+def http_response(body, status='200 OK', headers=()):
+    return 'HTTP/1.1 %s\r\n%s\r\n%s' % (
+        status, ''.join('%s: %s\r\n' % header for header in headers), body)
+
+
+RECORDS = [
+    warc_record('warcinfo', '', 'software: test', 'application/warc-fields'),
+    warc_record('request', 'http://example.com/', 'GET / HTTP/1.1\r\n\r\n',
+                'application/http; msgtype=request'),
+    warc_record('response', 'http://example.com/',
+                http_response(ROSES, headers=[('Content-Type', 'text/html; charset=utf-8')])),
+    warc_record('response', 'http://example.com/violets',
+                http_response('13\r\n' + VIOLETS + '\r\n0\r\n\r\n',
+                              headers=[('Transfer-Encoding', 'chunked')])),
+    warc_record('response', 'http://example.com/missing',
+                http_response('gone', '404 Not Found')),
+    warc_record('resource', 'http://example.com/tulips.txt', 'tulips:yellow',
+                'text/plain')
+]
+
+INSTRUCTION = {
+    'find': r'(\w+):\w+',
+    'replace': '$1',
+    'name': 'flower'
+}
+
+
+def gzip_member(data):
+    out = StringIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as fp:
+        fp.write(data)
+    return out.getvalue()
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.plain = os.path.join(self.directory, 'crawl.warc')
+        with open(self.plain, 'wb') as fp:
+            fp.write(''.join(RECORDS))
+        self.gzipped = os.path.join(self.directory, 'crawl.warc.gz')
+        with open(self.gzipped, 'wb') as fp:
+            fp.write(''.join(gzip_member(record) for record in RECORDS))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_records(self):
+        """
+        Responses and resources are read from plain and gzipped WARCs.
+        """
+        for path in (self.plain, self.gzipped):
+            archive = Archive.from_warc(path)
+            self.assertEquals(['http://example.com/', 'http://example.com/violets',
+                               'http://example.com/missing',
+                               'http://example.com/tulips.txt'],
+                              [record.url for record in archive])
+            self.assertEquals(ROSES, archive.get('http://example.com/').body)
+            self.assertEquals(VIOLETS, archive.get('http://example.com/violets').body)
+            self.assertEquals(404, archive.get('http://example.com/missing').status)
+            self.assertEquals('text/plain',
+                              archive.get('http://example.com/tulips.txt').headers['Content-Type'])
+
+    def test_one_member(self):
+        """
+        A WARC compressed as one member is decompressed once to read its
+        records in order.
+        """
+        with open(self.gzipped, 'wb') as fp:
+            fp.write(gzip_member(''.join(RECORDS)))
+        archive = Archive.from_warc(self.gzipped)
+        members = archive_module._members
+        reads = []
+
+        def counting_members(fp):
+            reads.append(fp.tell())
+            return members(fp)
+        archive_module._members = counting_members
+        try:
+            self.assertEquals([ROSES, VIOLETS, 'gone', 'tulips:yellow'],
+                              [record.body for record in archive])
+        finally:
+            archive_module._members = members
+        self.assertEquals([0], reads)
+
+    def test_inputs_mapped(self):
+        """
+        Plain bodies are scraped from the file they are stored in.
+        """
+        archive = Archive.from_warc(self.plain)
+        self.assertIsInstance(archive.get('http://example.com/').input, MappedFile)
+        self.assertEquals(VIOLETS, archive.get('http://example.com/violets').input)
+        self.assertEquals(ROSES, str(archive.get('http://example.com/').input.open()))
+
+    def test_normalized_urls(self):
+        """
+        URLs are found whatever their case, port, trailing slash, fragment
+        or query order.
+        """
+        archive = Archive.from_warc(self.plain)
+        for url in ('HTTP://Example.com:80/violets/', 'http://example.com/violets#top'):
+            self.assertEquals(VIOLETS, archive.get(url).body)
+        self.assertEquals(ROSES, archive.get('http://example.com').body)
+        self.assertEquals(url_key('http://example.com/?b=2&a=1'),
+                          url_key('http://example.com?a=1&b=2'))
+        self.assertNotEqual(url_key('http://example.com/?a=1'),
+                            url_key('http://example.com/?a=2'))
+
+    def test_bad_warc(self):
+        """
+        Files that aren't WARCs can't be read.
+        """
+        with open(self.plain, 'wb') as fp:
+            fp.write('roses are red')
+        self.assertRaises(ArchiveError, Archive.from_warc, self.plain)
+
+    def test_bad_gzip(self):
+        """
+        Corrupt gzip data can't be read.
+        """
+        data = gzip_member(RECORDS[0])
+        with open(self.gzipped, 'wb') as fp:
+            fp.write(data[:10] + '\xff' * 20 + data[30:])
+        self.assertRaises(ArchiveError, Archive.from_warc, self.gzipped)
+
+    def test_directory(self):
+        """
+        Files under a directory are stored at their path from a base URL.
+        """
+        pages = os.path.join(self.directory, 'pages')
+        os.makedirs(os.path.join(pages, 'flowers'))
+        with open(os.path.join(pages, 'flowers', 'roses.html'), 'wb') as fp:
+            fp.write(ROSES)
+        archive = Archive.from_directory(pages, 'http://example.com/')
+        self.assertEquals(ROSES, archive.get('http://example.com/flowers/roses.html').body)
+
+    def test_scrape_many(self):
+        """
+        Every page of an archive can be scraped in a batch, with its URL.
+        """
+        archive = Archive.from_warc(self.gzipped)
+        items = list(Scraper().scrape_many(
+            [INSTRUCTION, {'find': r'[\w.]+$', 'input': '{{{url}}}', 'name': 'page'}],
+            archive.items()))
+        self.assertEquals(3, len(items))
+        flowers, page = items[2].response
+        self.assertEquals({'flower': 'tulips'}, flowers.flattened_values)
+        self.assertEquals({'page': 'tulips.txt'}, page.flattened_values)
+
+    def test_loads(self):
+        """
+        Loads are looked up in the archive, and fail if they aren't there.
+        """
+        scraper = Scraper(archive=Archive.from_warc(self.plain))
+        instruction = {'load': 'http://example.com/{{page}}', 'then': INSTRUCTION}
+        resp = scraper.scrape(instruction, tags={'page': 'violets'}, force=True)
+        self.assertEquals('loaded', resp.status)
+        self.assertEquals({'flower': 'violets'},
+                          resp.results[0].children[0].flattened_values)
+        self.assertEquals('failed', scraper.scrape(instruction, tags={'page': 'missing'},
+                                                   force=True).status)
+        resp = scraper.scrape(instruction, tags={'page': 'lilies'}, force=True)
+        self.assertIn('archive', resp.reason)
+
+    def test_not_retried(self):
+        """
+        Archived responses that would be retried aren't.
+        """
+        archive = Archive.from_warc(self.plain)
+        archive.add(Record('http://example.com/busy', 503, 'Busy', {}, self.plain))
+        scraper = Scraper(archive=archive,
+                          retry=RetryPolicy(retries=3, backoff=10, max_backoff=10))
+        resp = scraper.scrape({'load': 'http://example.com/busy'}, force=True)
+        self.assertEquals('failed', resp.status)
+        self.assertEquals(1, resp.attempts)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from helpers import unittest, LocalServer
+from pycaustic import Scraper
+from pycaustic.errors import InvalidInstructionError
+from pycaustic.throttle import HostScheduler
+from pycaustic.batch import run_batch, split_input
+from pycaustic.serialize import dumps
+
+INSTRUCTION = {
+    'find': r'\w+',
+    'name': 'flower',
+    'then': {'find': '{{season}}', 'name': 'season'}
+}
+INPUTS = ['roses spring', 'violets summer spring', 'tulips']
+
+
+class TestSplitInput(unittest.TestCase):
+
+    def test_forms(self):
+        """
+        Items can be inputs, tags, or both, over the batch's tags.
+        """
+        base = {'season': 'spring'}
+        self.assertEquals(({'season': 'spring'}, 'roses'), split_input('roses', base))
+        self.assertEquals(({'season': 'fall'}, ''), split_input({'season': 'fall'}, base))
+        self.assertEquals(({'season': 'spring', 'color': 'red'}, 'roses'),
+                          split_input(({'color': 'red'}, 'roses'), base))
+        self.assertEquals({'season': 'spring'}, base)
+
+
+class TestRunBatch(unittest.TestCase):
+
+    def slow_first(self, index, item):
+        if index == 0:
+            time.sleep(0.05)
+        return item * 2
+
+    def test_ordered(self):
+        """
+        Items come out in input order.
+        """
+        items = list(run_batch(self.slow_first, xrange(10), workers=4))
+        self.assertEquals(range(10), [item.index for item in items])
+        self.assertEquals([i * 2 for i in range(10)], [item.response for item in items])
+
+    def test_as_completed(self):
+        """
+        Unordered batches yield items as they finish.
+        """
+        items = list(run_batch(self.slow_first, xrange(10), workers=4, ordered=False))
+        self.assertEquals(set(range(10)), set(item.index for item in items))
+        self.assertNotEquals(0, items[0].index)
+
+    def test_failures(self):
+        """
+        Exceptions are reported per item, without stopping the batch.
+        """
+        def scrape(index, item):
+            if index == 1:
+                raise ValueError('no roses')
+            return item
+
+        items = list(run_batch(scrape, 'abc', workers=2))
+        self.assertEquals([True, False, True], [item.ok for item in items])
+        self.assertIsInstance(items[1].error, ValueError)
+
+    def test_gevent(self):
+        """
+        Batches can run in a gevent pool.
+        """
+        items = list(run_batch(self.slow_first, xrange(5), backend='gevent'))
+        self.assertEquals([0, 2, 4, 6, 8], [item.response for item in items])
+
+    def test_unknown_backend(self):
+        """
+        Unknown backends are rejected.
+        """
+        self.assertRaises(ValueError, list, run_batch(self.slow_first, [], backend='fork'))
+
+
+class TestScrapeMany(unittest.TestCase):
+
+    def test_same_as_scrape(self):
+        """
+        Each item is scraped as `scrape` would, with its index as ID.
+        """
+        scraper = Scraper()
+        items = list(scraper.scrape_many(INSTRUCTION, INPUTS, workers=2,
+                                         tags={'season': 'spring'}))
+        for i, (item, input) in enumerate(zip(items, INPUTS)):
+            expected = scraper.scrape(INSTRUCTION, tags={'season': 'spring'}, input=input)
+            self.assertEquals(expected.status, item.response.status)
+            self.assertEquals(i, item.response.id)
+        self.assertEquals(3, len(items[1].response.results))
+
+    def test_bad_input(self):
+        """
+        Items that raise are reported as errors.
+        """
+        items = list(Scraper().scrape_many(INSTRUCTION, [u'ros\xe9s', 'roses']))
+        self.assertIsInstance(items[0].error, TypeError)
+        self.assertTrue(items[1].ok)
+
+    def test_process(self):
+        """
+        Worker processes return the JSON of each item's Responses.
+        """
+        scraper = Scraper()
+        items = list(scraper.scrape_many(INSTRUCTION, INPUTS + [u'ros\xe9s'],
+                                         workers=2, backend='process',
+                                         tags={'season': 'spring'}))
+        for i, input in enumerate(INPUTS):
+            expected = scraper.scrape(INSTRUCTION, tags={'season': 'spring'},
+                                      input=input, id=i)
+            self.assertEquals(dumps(expected, truncated=False), items[i].response)
+        self.assertIsInstance(items[-1].error, TypeError)
+
+    def test_process_unpicklable_item(self):
+        """
+        Items that can't be sent to a worker process fail on their own.
+        """
+        items = list(Scraper().scrape_many(
+            INSTRUCTION, ['roses', ({'lock': threading.Lock()}, 'violets'), 'tulips'],
+            workers=1, backend='process'))
+        self.assertEquals([True, False, True], [item.ok for item in items])
+
+    def test_process_bad_instruction(self):
+        """
+        Instructions that can't be compiled raise before any worker starts.
+        """
+        self.assertRaises(InvalidInstructionError, Scraper().scrape_many,
+                          'does-not-exist.json', ['roses'], backend='process')
+
+    def test_process_settings(self):
+        """
+        Worker processes scrape with the settings of the scraper, and
+        settings that can't be carried over are refused.
+        """
+        server = LocalServer(lambda handler: (200, {}, 'roses'))
+        try:
+            items = list(Scraper(force_all=True).scrape_many(
+                {'load': server.url('/')}, [''], workers=1, backend='process'))
+            self.assertIn('"loaded"', items[0].response)
+        finally:
+            server.stop()
+        self.assertRaises(ValueError, Scraper(sink=lambda leaf: None).scrape_many,
+                          INSTRUCTION, INPUTS, backend='process')
+        self.assertRaises(ValueError, Scraper(scheduler=HostScheduler()).scrape_many,
+                          INSTRUCTION, INPUTS, backend='process')
+
+if __name__ == '__main__':
+    unittest.main()
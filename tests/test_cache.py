@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from helpers import unittest
+from pycaustic.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_set(self):
+        """
+        Values can be stored and retrieved.
+        """
+        cache = LRUCache(maxsize=2)
+        cache.set('roses', 'red')
+        self.assertEquals('red', cache.get('roses'))
+        self.assertIsNone(cache.get('violets'))
+        self.assertEquals('blue', cache.get('violets', 'blue'))
+
+    def test_evicts_least_recently_used(self):
+        """
+        Hits refresh recency, so the least recently used entry is evicted.
+        """
+        cache = LRUCache(maxsize=2)
+        cache.set('roses', 'red')
+        cache.set('violets', 'blue')
+        cache.get('roses')
+        cache.set('daisies', 'white')
+
+        self.assertIn('roses', cache)
+        self.assertNotIn('violets', cache)
+        self.assertIn('daisies', cache)
+
+    def test_stats(self):
+        """
+        Hits, misses, and evictions are counted.
+        """
+        cache = LRUCache(maxsize=1)
+        cache.set('roses', 'red')
+        cache.get('roses')
+        cache.get('violets')
+        cache.set('violets', 'blue')
+        self.assertEquals({
+            'size': 1,
+            'maxsize': 1,
+            'hits': 1,
+            'misses': 1,
+            'evictions': 1
+        }, cache.stats())
+
+    def test_shrink(self):
+        """
+        Shrinking evicts down to the new size.
+        """
+        cache = LRUCache(maxsize=3)
+        for k in 'abc':
+            cache.set(k, k)
+        cache.maxsize = 1
+        self.assertEquals(1, len(cache))
+        self.assertIn('c', cache)
+        self.assertEquals(2, cache.evictions)
+
+    def test_invalid_size(self):
+        """
+        A cache must hold something.
+        """
+        with self.assertRaises(ValueError):
+            LRUCache(maxsize=0)
+
+if __name__ == '__main__':
+    unittest.main()
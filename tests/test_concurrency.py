@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from helpers import unittest, LocalServer
+from pycaustic import Scraper
+from pycaustic.concurrency import ThreadPool, SingleFlight
+
+
+class TestThreadPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ThreadPool(2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_get(self):
+        """
+        Tasks supply their result from get.
+        """
+        self.assertEquals(4, self.pool.spawn(lambda x: x * 2, 2).get())
+
+    def test_exception(self):
+        """
+        Exceptions are raised from get.
+        """
+        task = self.pool.spawn(lambda: {}['roses'])
+        with self.assertRaises(KeyError):
+            task.get()
+
+    def test_nested_no_deadlock(self):
+        """
+        Tasks waiting on tasks don't starve a small pool.
+        """
+        pool = ThreadPool(1)
+
+        def fan_out(depth):
+            if depth == 0:
+                return 1
+            tasks = [pool.spawn(fan_out, depth - 1) for _ in range(3)]
+            return sum(t.get() for t in tasks)
+
+        try:
+            self.assertEquals(27, pool.spawn(fan_out, 3).get())
+        finally:
+            pool.close()
+
+
+    def test_closed_at_exit(self):
+        """
+        Pools left open are closed at exit, without errors from their
+        threads.
+        """
+        script = ('from pycaustic.concurrency import ThreadPool\n'
+                  'ThreadPool(4).spawn(lambda: None).get()\n')
+        proc = subprocess.Popen([sys.executable, '-c', script],
+                                stderr=subprocess.PIPE,
+                                cwd=os.path.abspath('..'))
+        self.assertEquals('', proc.communicate()[1])
+        self.assertEquals(0, proc.returncode)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_coalesce(self):
+        """
+        Calls with the same key in progress at once share one call.
+        """
+        flights = SingleFlight()
+        calls = []
+        results = []
+
+        def slow(value):
+            calls.append(value)
+            time.sleep(0.1)
+            return value
+
+        threads = [threading.Thread(target=lambda: results.append(
+            flights.do('roses', slow, 'red'))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(['red'], calls)
+        self.assertEquals(['red'] * 4, results)
+        self.assertEquals({'calls': 1, 'coalesced': 3, 'in_flight': 0},
+                          flights.stats())
+
+    def test_sequential_not_coalesced(self):
+        """
+        Calls that don't overlap are each made.
+        """
+        flights = SingleFlight()
+        self.assertEquals(1, flights.do('roses', lambda: 1))
+        self.assertEquals(2, flights.do('roses', lambda: 2))
+        self.assertEquals(0, flights.coalesced)
+
+    def test_exception(self):
+        """
+        Exceptions are raised to the caller.
+        """
+        with self.assertRaises(KeyError):
+            SingleFlight().do('roses', lambda: {}['roses'])
+
+
+class TestThreadPoolScraper(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalServer(self.respond)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def respond(self, handler):
+        time.sleep(0.2)
+        return 200, {'Content-Type': 'text/plain; charset=utf-8'}, handler.path[1:]
+
+    def test_same_results(self):
+        """
+        Find trees produce the same results as without a pool.
+        """
+        instruction = {
+            "find": r"\w+",
+            "name": "word",
+            "then": [{
+                "find": "^.",
+                "name": "first"
+            }, {
+                "find": ".$",
+                "name": "last"
+            }]
+        }
+        with ThreadPool(4) as pool:
+            threaded = Scraper(pool=pool).scrape(instruction, input='roses violets')
+        self.assertEquals(Scraper().scrape(instruction, input='roses violets').flattened_values,
+                          threaded.flattened_values)
+
+    def fan_out(self):
+        return {'find': r'\w+', 'name': 'flower',
+                'then': {'load': self.server.url('/{{flower}}'), 'name': 'page'}}
+
+    def test_loads_concurrent(self):
+        """
+        Loads for each match run concurrently, and keep their order.
+        """
+        input = 'roses violets petunias daisies'
+        start = time.time()
+        with ThreadPool(4) as pool:
+            resp = Scraper(pool=pool, force_all=True).scrape(self.fan_out(), input=input,
+                                             force=True)
+        self.assertLess(time.time() - start, 0.6)
+        self.assertEquals(['roses', 'violets', 'petunias', 'daisies'],
+                          [r['page'] for r in resp.flattened_values])
+
+    def test_list_in_order(self):
+        """
+        Members of a list run in order, so they can use tags set by those
+        before them.
+        """
+        instruction = [{'find': r'(\w+)$', 'replace': '$1', 'name': 'x', 'match': 0},
+                       {'find': '{{x}}', 'name': 'y'}]
+        input = ' '.join('word%s' % i for i in xrange(5000))
+        with ThreadPool(4) as pool:
+            scraper = Scraper(pool=pool)
+            for _ in xrange(10):
+                resps = scraper.scrape(instruction, input=input)
+                self.assertEquals(['found', 'found'], [r.status for r in resps])
+
+    def test_identical_loads_coalesced(self):
+        """
+        Identical loads in progress at once make a single request.
+        """
+        input = 'roses roses roses roses'
+        flights = SingleFlight()
+        with ThreadPool(4) as pool:
+            resp = Scraper(pool=pool, flights=flights, force_all=True).scrape(
+                self.fan_out(), input=input, force=True)
+        self.assertEquals(['roses'] * 4, [r['page'] for r in resp.flattened_values])
+        self.assertEquals(1, len(self.server.requests))
+        self.assertEquals(3, flights.coalesced)
+
+if __name__ == '__main__':
+    unittest.main()
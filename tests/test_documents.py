@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+from helpers import unittest
+from pycaustic import Scraper
+from pycaustic.documents import DocumentCache
+from pycaustic.patterns import cached_jsonpath
+
+
+class TestDocumentCache(unittest.TestCase):
+
+    def test_html_parsed_once(self):
+        """
+        The same input should only be parsed once.
+        """
+        documents = DocumentCache()
+        tree = documents.html('<p>roses</p>')
+        self.assertIs(tree, documents.html('<p>roses</p>'))
+        self.assertIsNot(tree, documents.html('<p>violets</p>'))
+
+    def test_sibling_xpaths_share_tree(self):
+        """
+        Sibling xpath instructions over the same input share one tree.
+        """
+        documents = DocumentCache()
+        resp = Scraper(documents=documents).scrape([{
+            "name": "first",
+            "xpath": "//p[1]"
+        }, {
+            "name": "second",
+            "xpath": "//p[2]"
+        }, {
+            "name": "third",
+            "xpath": "//p[3]"
+        }], input="<p>roses</p><p>violets</p><p>petunias</p>")
+
+        self.assertEquals(['roses', 'violets', 'petunias'],
+                          [r.results[0].value for r in resp])
+        self.assertEquals(1, documents.stats()['html']['misses'])
+        self.assertEquals(2, documents.stats()['html']['hits'])
+
+    def test_buffer_copied_once(self):
+        """
+        A buffer input is only copied into a string once.
+        """
+        documents = DocumentCache()
+        buf = buffer('<p>roses</p>')
+        tree = documents.html(buf)
+        self.assertIs(tree, documents.html(buf))
+        copy = documents._bytes(buf)
+        self.assertEquals('<p>roses</p>', copy)
+        self.assertIs(copy, documents._bytes(buf))
+        self.assertEquals([1], documents.json(buffer('[1]')))
+
+    def test_per_scrape(self):
+        """
+        Without a shared cache, each scrape gets its own.
+        """
+        scraper = Scraper()
+        for flower in ('roses', 'violets'):
+            resp = scraper.scrape({
+                "name": "flower",
+                "xpath": "//p"
+            }, input="<p>%s</p>" % flower)
+            self.assertEquals({"flower": flower}, resp.flattened_values)
+
+    def test_json_decoded_once(self):
+        """
+        The same JSON input should only be decoded once, even if it is null.
+        """
+        documents = DocumentCache()
+        value = documents.json('{"roses": "red"}')
+        self.assertIs(value, documents.json('{"roses": "red"}'))
+        self.assertIsNone(documents.json('null'))
+        self.assertIsNone(documents.json('null'))
+        self.assertEquals(2, documents.stats()['json']['misses'])
+
+    def test_json_invalid(self):
+        """
+        Invalid JSON raises ValueError every time.
+        """
+        documents = DocumentCache()
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                documents.json('roses are red')
+
+    def test_json_loads(self):
+        """
+        A different decoder can be plugged in.
+        """
+        calls = []
+
+        def json_loads(input):
+            calls.append(input)
+            return json.loads(input)
+
+        resp = Scraper(json_loads=json_loads).scrape([{
+            "name": "roses",
+            "jsonpath": "$.roses"
+        }, {
+            "name": "violets",
+            "jsonpath": "$.violets"
+        }], input=json.dumps({"roses": "red", "violets": "blue"}))
+
+        self.assertEquals(['red', 'blue'], [r.results[0].value for r in resp])
+        self.assertEquals(1, len(calls))
+
+    def test_jsonpath_cached(self):
+        """
+        jsonpath expressions are parsed once.
+        """
+        self.assertIs(cached_jsonpath('$.petunias[*]'),
+                      cached_jsonpath('$.petunias[*]'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from helpers import unittest, LocalServer
+from pycaustic import Scraper
+from pycaustic.download import DownloadPolicy, is_text
+from pycaustic.httpcache import ResponseCache
+from pycaustic.patterns import MatchCounter, cached_regex
+
+BIG_BODY = 'roses violets ' * 100000
+
+
+class TestIsText(unittest.TestCase):
+
+    def test_text_types(self):
+        """
+        Text, JSON and XML types are text.
+        """
+        self.assertTrue(is_text('text/html; charset=utf-8'))
+        self.assertTrue(is_text('application/json'))
+        self.assertTrue(is_text('application/rss+xml'))
+        self.assertTrue(is_text(None))
+
+    def test_binary_types(self):
+        """
+        Images and archives aren't.
+        """
+        self.assertFalse(is_text('image/png'))
+        self.assertFalse(is_text('application/zip'))
+
+
+class TestMatchCounter(unittest.TestCase):
+
+    def test_pieces(self):
+        """
+        Matches are counted as input arrives, ignoring any at the end.
+        """
+        counter = MatchCounter(cached_regex(r'\d+', False, False, False, '$0'), 2)
+        self.assertFalse(counter.feed('12 3'))
+        self.assertFalse(counter.feed('12 34'))
+        self.assertTrue(counter.feed('12 34 '))
+
+    def test_bounded(self):
+        """
+        Matches of a bounded pattern count once input is its width along.
+        """
+        counter = MatchCounter(cached_regex(r'a(bc)?', False, False, False, '$0'), 1)
+        self.assertFalse(counter.feed('ab'))
+        self.assertFalse(counter.feed('abx'))
+        self.assertTrue(counter.feed('abxy'))
+
+
+class TestScraperDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalServer(self.respond)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def respond(self, handler):
+        if handler.path == '/image':
+            return 200, {'Content-Type': 'image/png'}, '\x89PNG'
+        elif handler.path == '/big':
+            return 200, {'Content-Type': 'text/plain'}, BIG_BODY
+        return 200, {'Content-Type': 'text/plain'}, 'roses'
+
+    def test_max_size(self):
+        """
+        Loads over the maximum size fail.
+        """
+        scraper = Scraper(download=DownloadPolicy(max_size=1000))
+        self.assertEquals('failed', scraper.scrape({'load': self.server.url('/big')},
+                                                   force=True).status)
+        self.assertEquals('loaded', scraper.scrape({'load': self.server.url('/')},
+                                                   force=True).status)
+
+    def test_text_only(self):
+        """
+        Loads of non-text types fail if only text is wanted.
+        """
+        scraper = Scraper(download=DownloadPolicy(text_only=True))
+        resp = scraper.scrape({'load': self.server.url('/image')}, force=True)
+        self.assertEquals('failed', resp.status)
+        self.assertIn('image/png', resp.reason)
+
+    def test_incremental(self):
+        """
+        Incremental loads stop reading once their finds have max_match.
+        """
+        instruction = {
+            'load': self.server.url('/big'),
+            'incremental': True,
+            'then': {'find': r'\w+', 'name': 'flower', 'max_match': 2}
+        }
+        cache = ResponseCache()
+        resp = Scraper(cache=cache).scrape(instruction, force=True)
+        self.assertEquals([{'flower': 'roses'}, {'flower': 'violets'},
+                           {'flower': 'roses'}],
+                          resp.results[0].children[0].flattened_values)
+        self.assertLess(len(resp.results[0].value), len(BIG_BODY))
+        self.assertEquals(0, cache.stats()['size'])
+
+    def test_incremental_needs_max_match(self):
+        """
+        Incremental loads with unbounded finds read the whole body.
+        """
+        instruction = {
+            'load': self.server.url('/big'),
+            'incremental': True,
+            'then': {'find': r'\w+', 'name': 'flower', 'max_match': 2}
+        }
+        instruction['then'] = [instruction['then'], {'find': 'violets'}]
+        resp = Scraper().scrape(instruction, force=True)
+        self.assertEquals(len(BIG_BODY), len(resp.results[0].value))
+
+    def test_incremental_greedy(self):
+        """
+        Incremental loads whose finds could match more of a longer body
+        read the whole body.
+        """
+        instruction = {
+            'load': self.server.url('/big'),
+            'incremental': True,
+            'then': {'find': r'roses.*violets', 'name': 'flowers', 'max_match': 0}
+        }
+        resp = Scraper().scrape(instruction, force=True)
+        self.assertEquals(len(BIG_BODY), len(resp.results[0].value))
+        flowers = resp.results[0].children[0].flattened_values['flowers']
+        self.assertEquals(BIG_BODY[:-1], flowers)
+
+if __name__ == '__main__':
+    unittest.main()
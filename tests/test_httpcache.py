@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+
+from helpers import unittest, LocalServer
+from pycaustic import Scraper
+from pycaustic.errors import CacheStoreError
+from pycaustic.httpcache import ResponseCache, DiskBackend, fixtures
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_control = 'max-age=60'
+        self.server = LocalServer(self.respond)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def respond(self, handler):
+        headers = {'ETag': '"v1"', 'Cache-Control': self.cache_control,
+                   'Content-Type': 'text/html; charset=utf-8'}
+        if handler.path == '/latin':
+            headers['X-Flower'] = 'ros\xe9'
+        elif handler.path == '/instruction.json':
+            return 200, headers, '{"find": "roses are (\\\\w+)", "replace": "$1"}'
+        if handler.path == '/missing':
+            return 404, headers, 'no roses'
+        if handler.headers.get('If-None-Match') == '"v1"':
+            return 304, headers, ''
+        return 200, headers, 'roses are red'
+
+    def scrape(self, cache, path='/', **instruction):
+        instruction['load'] = self.server.url(path)
+        instruction.setdefault('then', {'find': 'roses are (\\w+)', 'replace': '$1',
+                                         'name': 'color'})
+        return Scraper(cache=cache).scrape(instruction, force=True)
+
+    def test_fresh_not_reloaded(self):
+        """
+        Fresh responses are not requested again.
+        """
+        cache = ResponseCache()
+        first = self.scrape(cache)
+        second = self.scrape(cache)
+        self.assertEquals('loaded', second.status)
+        self.assertEquals(first.results[0].value, second.results[0].value)
+        self.assertEquals('red', second.results[0].children[0].results[0].value)
+        self.assertEquals(1, len(self.server.requests))
+        self.assertEquals(1, cache.stats()['hits'])
+
+    def test_revalidate(self):
+        """
+        Stale responses are revalidated with their ETag.
+        """
+        self.cache_control = 'no-cache'
+        cache = ResponseCache()
+        self.scrape(cache)
+        resp = self.scrape(cache)
+        self.assertEquals('roses are red', resp.results[0].value)
+        self.assertEquals(2, len(self.server.requests))
+        self.assertEquals('"v1"', self.server.requests[1][2]['if-none-match'])
+        self.assertEquals(1, cache.stats()['not_modified'])
+
+    def test_keyed_on_request(self):
+        """
+        Loads with different posts or headers are cached separately.
+        """
+        cache = ResponseCache()
+        self.scrape(cache, posts={'color': 'red'})
+        self.scrape(cache, posts={'color': 'blue'})
+        self.scrape(cache, headers={'Accept-Language': 'fr'})
+        self.scrape(cache, posts={'color': 'red'})
+        self.assertEquals(3, len(self.server.requests))
+        self.assertEquals(3, cache.stats()['size'])
+
+    def test_no_store(self):
+        """
+        no-store responses are not cached.
+        """
+        self.cache_control = 'no-store'
+        cache = ResponseCache()
+        self.scrape(cache)
+        self.scrape(cache)
+        self.assertEquals(2, len(self.server.requests))
+        self.assertEquals(0, cache.stats()['size'])
+
+    def test_errors_not_cached(self):
+        """
+        Error statuses are not cached.
+        """
+        cache = ResponseCache()
+        self.assertEquals('failed', self.scrape(cache, '/missing').status)
+        self.assertEquals(0, cache.stats()['size'])
+
+    def test_disk_backend(self):
+        """
+        Responses on disk are reused by a new cache.
+        """
+        self.scrape(ResponseCache(DiskBackend(self.directory)))
+        cache = ResponseCache(DiskBackend(self.directory))
+        resp = self.scrape(cache)
+        self.assertEquals('red', resp.results[0].children[0].results[0].value)
+        self.assertEquals(1, len(self.server.requests))
+        self.assertEquals(1, cache.stats()['size'])
+
+    def test_replay(self):
+        """
+        In replay mode, stale responses are used without revalidation, and
+        uncached loads fail without touching the network.
+        """
+        self.cache_control = 'no-cache'
+        self.scrape(ResponseCache(DiskBackend(self.directory)))
+        cache = ResponseCache(DiskBackend(self.directory), replay=True)
+        self.assertEquals('loaded', self.scrape(cache).status)
+        self.assertEquals('failed', self.scrape(cache, '/other').status)
+        self.assertEquals(1, len(self.server.requests))
+
+    def test_record_and_replay(self):
+        """
+        Recording stores every response, even errors and no-store ones, to
+        replay later without the network.
+        """
+        self.cache_control = 'no-store'
+        record = fixtures(self.directory, record=True)
+        self.scrape(record)
+        self.scrape(record)
+        self.assertEquals('failed', self.scrape(record, '/missing').status)
+        self.assertEquals(3, len(self.server.requests))
+        self.assertEquals(2, record.stats()['size'])
+
+        replay = fixtures(self.directory)
+        resp = self.scrape(replay)
+        self.assertEquals('red', resp.results[0].children[0].results[0].value)
+        self.assertIn('404', self.scrape(replay, '/missing').reason)
+        self.assertEquals(3, len(self.server.requests))
+
+    def test_record_header_bytes(self):
+        """
+        Headers that aren't UTF-8 are recorded, and replayed.
+        """
+        self.scrape(fixtures(self.directory, record=True), '/latin')
+        resp = self.scrape(fixtures(self.directory), '/latin')
+        self.assertEquals('red', resp.results[0].children[0].results[0].value)
+
+    def test_record_unstorable(self):
+        """
+        Recording raises if a response can't be stored.
+        """
+        backend = DiskBackend(self.directory)
+        entry = {'url': 'http://example.com/', 'headers': {'X-Flower': object()},
+                 'body': 'roses'}
+        self.assertRaises(CacheStoreError, backend.set, 'key', entry)
+        self.assertEquals(0, len(backend))
+
+    def test_record_instructions(self):
+        """
+        Remote instructions are recorded and replayed with the loads.
+        """
+        instruction = {'load': self.server.url('/'), 'then': '/instruction.json'}
+        Scraper(cache=fixtures(self.directory, record=True)).scrape(
+            instruction, force=True, uri=self.server.url('/'))
+        self.assertEquals(2, len(self.server.requests))
+        self.server.stop()
+        resp = Scraper(cache=fixtures(self.directory)).scrape(
+            instruction, force=True, uri=self.server.url('/'))
+        self.assertEquals('red', resp.results[0].children[0].results[0].value)
+
+    def test_compressed(self):
+        """
+        Compressed responses on disk are read back as they were.
+        """
+        self.scrape(ResponseCache(DiskBackend(self.directory, compress=True)))
+        cache = ResponseCache(DiskBackend(self.directory), replay=True)
+        self.assertEquals('roses are red', self.scrape(cache).results[0].value)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import copy
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+import requests
+
+from helpers import unittest, LocalServer
+from pycaustic import Scraper, scraper as scraper_module
+from pycaustic.instructions import (freeze, FrozenDict, FrozenList,
+                                    InstructionFileCache, RemoteInstructionCache,
+                                    ExtendsResolver)
+from pycaustic.errors import InvalidInstructionError
+from pycaustic.retry import RetryPolicy
+
+
+class TestFreeze(unittest.TestCase):
+
+    def test_freeze_deep(self):
+        """
+        Nested dicts and lists are frozen, but still look like dicts and
+        lists.
+        """
+        frozen = freeze({'then': [{'find': 'roses'}], 'posts': {'a': 'b'}})
+        self.assertIsInstance(frozen, dict)
+        self.assertIsInstance(frozen['then'], list)
+        self.assertEquals({'then': [{'find': 'roses'}], 'posts': {'a': 'b'}}, frozen)
+
+        with self.assertRaises(TypeError):
+            frozen['find'] = 'violets'
+        with self.assertRaises(TypeError):
+            frozen['posts'].update({'c': 'd'})
+        with self.assertRaises(TypeError):
+            frozen['then'].append({'find': 'violets'})
+        with self.assertRaises(TypeError):
+            frozen['then'][0].pop('find')
+
+    def test_copy_and_pickle(self):
+        """
+        Frozen instructions survive deepcopy and pickle.
+        """
+        frozen = freeze({'then': [{'find': 'roses'}]})
+        self.assertIs(frozen, copy.deepcopy(frozen))
+
+        unpickled = pickle.loads(pickle.dumps(frozen, 2))
+        self.assertEquals(frozen, unpickled)
+        self.assertIsInstance(unpickled, FrozenDict)
+        self.assertIsInstance(unpickled['then'], FrozenList)
+
+
+class TestInstructionFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, instruction):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            json.dump(instruction, f)
+        return path
+
+    def test_hit_shares(self):
+        """
+        Hits return the same frozen instruction, without copying.
+        """
+        cache = InstructionFileCache()
+        path = self.write('roses.json', {'find': 'roses'})
+        instruction = cache.load(path)
+        self.assertIs(instruction, cache.load(path))
+        self.assertEquals(1, cache.stats()['hits'])
+
+    def test_reload_on_change(self):
+        """
+        Changing the file invalidates its entry.
+        """
+        cache = InstructionFileCache()
+        path = self.write('flowers.json', {'find': 'roses'})
+        cache.load(path)
+        self.write('flowers.json', {'find': 'violets'})
+        self.assertEquals({'find': 'violets'}, cache.load(path))
+        self.assertEquals(1, cache.stats()['invalidations'])
+
+    def test_least_recently_used(self):
+        """
+        Hits keep entries from being evicted.
+        """
+        cache = InstructionFileCache(maxsize=2)
+        roses = self.write('roses.json', {'find': 'roses'})
+        violets = self.write('violets.json', {'find': 'violets'})
+        petunias = self.write('petunias.json', {'find': 'petunias'})
+        cache.load(roses)
+        cache.load(violets)
+        cache.load(roses)
+        cache.load(petunias)
+        cache.load(roses)
+        self.assertEquals(2, cache.stats()['hits'])
+        self.assertEquals(1, cache.stats()['evictions'])
+
+    def test_missing_file(self):
+        """
+        Missing files raise an environment error.
+        """
+        with self.assertRaises(EnvironmentError):
+            InstructionFileCache().load(os.path.join(self.dir, 'nope.json'))
+
+    def test_max_size_setting(self):
+        """
+        Setting MAX_FILE_CACHE_SIZE resizes the scraper's file cache.
+        """
+        size = scraper_module.MAX_FILE_CACHE_SIZE
+        scraper_module.MAX_FILE_CACHE_SIZE = 1
+        try:
+            for flower in ('roses', 'violets'):
+                path = self.write('%s.json' % flower, {'find': flower})
+                Scraper().scrape(path, input=flower, uri=path)
+            self.assertEquals(1, scraper_module.FILE_CACHE.maxsize)
+            self.assertEquals(1, scraper_module.FILE_CACHE.stats()['size'])
+        finally:
+            scraper_module.MAX_FILE_CACHE_SIZE = size
+            Scraper().scrape(path, input='violets', uri=path)
+        self.assertEquals(size, scraper_module.FILE_CACHE.maxsize)
+
+    def test_scrape_frozen_extends(self):
+        """
+        Extending a cached instruction leaves it intact for the next scrape.
+        """
+        self.write('base.json', {'find': r'\w+', 'then': {'find': '^.'}})
+        path = self.write('child.json', {'extends': 'base.json', 'then': {'find': '.$'}})
+        for _ in range(2):
+            resp = Scraper().scrape(path, input='roses', uri=path)
+            self.assertEquals(['r', 's'],
+                              [c.results[0].value for c in resp.results[0].children])
+
+class TestExtendsResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = InstructionFileCache()
+        self.loads = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, instruction):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            json.dump(instruction, f)
+        return path
+
+    def load(self, base, ref):
+        self.loads.append(ref)
+        path = os.path.join(self.dir, ref)
+        return self.files.load(path), path
+
+    def test_no_extends(self):
+        """
+        Instructions without extends are frozen as-is.
+        """
+        flattened = ExtendsResolver().flatten({'find': 'roses'}, self.dir, self.load)
+        self.assertEquals({'find': 'roses'}, flattened)
+        self.assertIsInstance(flattened, FrozenDict)
+
+    def test_merge(self):
+        """
+        Extensions replace plain keys, prepend to then, and fill in posts.
+        """
+        flattened = ExtendsResolver().flatten({
+            'load': 'http://www.example.com/',
+            'then': {'find': 'violets'},
+            'posts': {'roses': 'red'},
+            'extends': {
+                'load': 'http://www.example.org/',
+                'then': {'find': 'roses'},
+                'posts': {'roses': 'pink', 'violets': 'blue'}
+            }
+        }, self.dir, self.load)
+        self.assertEquals({
+            'load': 'http://www.example.org/',
+            'then': [{'find': 'roses'}, {'find': 'violets'}],
+            'posts': {'roses': 'red', 'violets': 'blue'}
+        }, flattened)
+
+    def test_chain(self):
+        """
+        Extends are followed through files.
+        """
+        self.write('grandparent.json', {'find': 'roses', 'name': 'flower'})
+        self.write('parent.json', {'extends': 'grandparent.json', 'match': 0})
+        flattened = ExtendsResolver().flatten({'extends': 'parent.json'},
+                                              self.dir, self.load)
+        self.assertEquals({'find': 'roses', 'name': 'flower', 'match': 0}, flattened)
+
+    def test_memoized(self):
+        """
+        Flattening the same instruction twice only merges once, and shares
+        the result.
+        """
+        self.write('parent.json', {'find': 'roses'})
+        resolver = ExtendsResolver()
+        instruction = freeze({'extends': 'parent.json', 'name': 'flower'})
+        flattened = resolver.flatten(instruction, self.dir, self.load)
+        self.assertIs(flattened, resolver.flatten(instruction, self.dir, self.load))
+        self.assertEquals(1, resolver.stats()['hits'])
+
+        # Unfrozen instructions are memoized by content.
+        resolver.flatten({'extends': 'parent.json', 'name': 'flower'},
+                         self.dir, self.load)
+        resolver.flatten({'extends': 'parent.json', 'name': 'flower'},
+                         self.dir, self.load)
+        self.assertEquals(2, resolver.stats()['hits'])
+
+    def test_memo_invalidated(self):
+        """
+        Changing an extended file invalidates the memoized result.
+        """
+        self.write('parent.json', {'find': 'roses'})
+        resolver = ExtendsResolver()
+        instruction = freeze({'extends': 'parent.json'})
+        resolver.flatten(instruction, self.dir, self.load)
+        self.write('parent.json', {'find': 'violets'})
+        self.assertEquals({'find': 'violets'},
+                          resolver.flatten(instruction, self.dir, self.load))
+
+    def test_cycle(self):
+        """
+        Cyclic extends raise rather than looping forever.
+        """
+        self.write('roses.json', {'extends': 'violets.json'})
+        self.write('violets.json', {'extends': 'roses.json'})
+        with self.assertRaises(InvalidInstructionError):
+            ExtendsResolver().flatten({'extends': 'roses.json'}, self.dir, self.load)
+
+    def test_diamond(self):
+        """
+        Extending the same file along two paths is not a cycle.
+        """
+        self.write('base.json', {'find': 'roses'})
+        self.write('left.json', {'extends': 'base.json'})
+        self.write('right.json', {'extends': 'base.json'})
+        flattened = ExtendsResolver().flatten({'extends': ['left.json', 'right.json']},
+                                              self.dir, self.load)
+        self.assertEquals({'find': 'roses'}, flattened)
+
+    def test_recursive_template(self):
+        """
+        A template whose children extend the template itself compiles
+        lazily, and stops when there are no more matches.
+        """
+        path = self.write('recursive.json', {
+            'find': r'^\w(.*)$',
+            'replace': '$1',
+            'then': {'extends': 'recursive.json'}
+        })
+        resp = Scraper().scrape(path, input='abc', uri=path)
+        self.assertEquals('bc', resp.results[0].value)
+        self.assertEquals('c', resp.results[0].children[0].results[0].value)
+
+
+class TestRemoteInstructionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_control = 'max-age=60'
+        self.body = json.dumps({'find': 'roses'})
+        self.server = LocalServer(self.respond)
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def respond(self, handler):
+        if handler.headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"', 'Cache-Control': self.cache_control}, ''
+        return 200, {'ETag': '"v1"', 'Cache-Control': self.cache_control}, self.body
+
+    def test_fresh_not_reloaded(self):
+        """
+        Fresh instructions are not requested again.
+        """
+        cache = RemoteInstructionCache()
+        instruction = cache.load(self.session, self.server.url('/roses.json'))
+        self.assertEquals({'find': 'roses'}, instruction)
+        self.assertIs(instruction, cache.load(self.session, self.server.url('/roses.json')))
+        self.assertEquals(1, len(self.server.requests))
+
+    def test_revalidate(self):
+        """
+        Stale instructions are revalidated with their ETag.
+        """
+        self.cache_control = 'no-cache'
+        cache = RemoteInstructionCache()
+        instruction = cache.load(self.session, self.server.url('/roses.json'))
+        self.assertIs(instruction, cache.load(self.session, self.server.url('/roses.json')))
+        self.assertEquals(2, len(self.server.requests))
+        self.assertEquals('"v1"', self.server.requests[1][2]['if-none-match'])
+        self.assertEquals(1, cache.stats()['not_modified'])
+
+    def test_ttl_bounds_max_age(self):
+        """
+        No entry is fresh for longer than the cache's ttl.
+        """
+        cache = RemoteInstructionCache(ttl=0)
+        cache.load(self.session, self.server.url('/roses.json'))
+        cache.load(self.session, self.server.url('/roses.json'))
+        self.assertEquals(1, cache.stats()['revalidations'])
+
+    def test_no_store(self):
+        """
+        no-store responses are not cached.
+        """
+        self.cache_control = 'no-store'
+        cache = RemoteInstructionCache()
+        cache.load(self.session, self.server.url('/roses.json'))
+        cache.load(self.session, self.server.url('/roses.json'))
+        self.assertEquals(0, cache.stats()['size'])
+        self.assertEquals(0, cache.stats()['revalidations'])
+
+    def test_error_status(self):
+        """
+        Error statuses raise rather than being parsed.
+        """
+        server = LocalServer(lambda handler: (404, {}, 'not found'))
+        try:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                RemoteInstructionCache().load(self.session, server.url('/nope.json'))
+        finally:
+            server.stop()
+
+    def test_timeout(self):
+        """
+        Stalled instruction hosts time out.
+        """
+        server = LocalServer(lambda handler: (time.sleep(0.5), (200, {}, '{}'))[1])
+        try:
+            with self.assertRaises(requests.exceptions.Timeout):
+                RemoteInstructionCache(timeout=0.05).load(self.session, server.url('/'))
+            with self.assertRaises(InvalidInstructionError):
+                Scraper(session=self.session, retry=RetryPolicy(timeout=0.05)).scrape(
+                    '/slow.json', uri=server.url('/'))
+        finally:
+            server.stop()
+
+    def test_scrape_remote(self):
+        """
+        Scraping a remote instruction goes through the cache.
+        """
+        resp = Scraper(session=self.session).scrape(
+            '/remote-roses.json', input='roses', uri=self.server.url('/'))
+        self.assertEquals('roses', resp.results[0].value)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+
+from helpers import unittest
+from pycaustic import Scraper
+from pycaustic.mapped import MappedFile
+from pycaustic.patterns import cached_regex
+
+PAGE = '<ul><li>roses:red</li><li>violets:blue</li></ul>'
+INSTRUCTION = {
+    'find': r'(\w+):\w+',
+    'replace': '$1',
+    'name': 'flower'
+}
+
+
+class TestMappedFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'page.html')
+        with open(self.path, 'wb') as fp:
+            fp.write(PAGE)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_open(self):
+        """
+        Mapped files are buffers over all or part of the file.
+        """
+        self.assertEquals(PAGE, str(MappedFile(self.path).open()))
+        self.assertEquals('roses', str(MappedFile(self.path, 8, 5).open()))
+        empty = os.path.join(self.directory, 'empty')
+        open(empty, 'wb').close()
+        self.assertEquals('', str(MappedFile(empty).open()))
+
+    def test_substitutions(self):
+        """
+        Regexes match buffers in place, giving strings.
+        """
+        regex = cached_regex(r'(\w+):(\w+)', False, False, False, '$2')
+        subs = list(regex.substitutions(MappedFile(self.path).open()))
+        self.assertEquals(['red', 'blue'], subs)
+        self.assertIsInstance(subs[0], str)
+
+    def test_scrape(self):
+        """
+        Buffers scrape the same as strings, for regexes and xpaths.
+        """
+        scraper = Scraper()
+        buf = MappedFile(self.path).open()
+        self.assertEquals(scraper.scrape(INSTRUCTION, input=PAGE).flattened_values,
+                          scraper.scrape(INSTRUCTION, input=buf).flattened_values)
+        xpath = {'xpath': '//li', 'name': 'item'}
+        self.assertEquals(scraper.scrape(xpath, input=PAGE).flattened_values,
+                          scraper.scrape(xpath, input=buf).flattened_values)
+
+    def test_batch(self):
+        """
+        Batches map files, including in worker processes.
+        """
+        scraper = Scraper()
+        expected = scraper.scrape(INSTRUCTION, input=PAGE).flattened_values
+        for item in scraper.scrape_many(INSTRUCTION, [MappedFile(self.path)]):
+            self.assertEquals(expected, item.response.flattened_values)
+        for item in scraper.scrape_many(INSTRUCTION, [MappedFile(self.path)],
+                                        workers=1, backend='process'):
+            self.assertIn('violets', item.response)
+
+if __name__ == '__main__':
+    unittest.main()
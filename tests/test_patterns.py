@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from helpers import unittest
-from pycaustic.patterns import Regex, _switch_backreferences
+from pycaustic.patterns import Regex, REGEX_CACHE, cached_regex, _switch_backreferences
 from pycaustic.errors import PatternError
 
 
@@ -152,5 +152,33 @@ class TestRegex(unittest.TestCase):
         subs = [sub for sub in r.substitutions('the quick brown fox', 2, 3)]
         self.assertEquals(['brown'], subs)
 
+
+class TestCachedRegex(unittest.TestCase):
+
+    def test_same_arguments_shared(self):
+        """
+        The same arguments should produce the same Regex.
+        """
+        r = cached_regex(r'roses?', False, False, False, '$0')
+        hits = REGEX_CACHE.hits
+        self.assertIs(r, cached_regex(r'roses?', False, False, False, '$0'))
+        self.assertEquals(hits + 1, REGEX_CACHE.hits)
+
+    def test_flags_distinguished(self):
+        """
+        Flags and replacement are part of the key.
+        """
+        r = cached_regex(r'violets?', False, False, False, '$0')
+        self.assertIsNot(r, cached_regex(r'violets?', True, False, False, '$0'))
+        self.assertIsNot(r, cached_regex(r'violets?', False, False, False, 'v'))
+
+    def test_errors_not_cached(self):
+        """
+        Bad patterns raise every time.
+        """
+        for _ in range(2):
+            with self.assertRaises(PatternError):
+                cached_regex(r'(', False, False, False, '$0')
+
 if __name__ == '__main__':
     unittest.main()
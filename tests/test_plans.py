@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from helpers import unittest
+from pycaustic import Scraper
+from pycaustic.plans import FindPlan, ListPlan, ReferencePlan, LoadPlan
+from pycaustic.errors import InvalidInstructionError
+
+FILE_PATH = os.path.abspath(__file__)
+
+
+class TestCompile(unittest.TestCase):
+
+    def test_run_many_inputs(self):
+        """
+        A compiled plan can be run against many inputs.
+        """
+        plan = Scraper().compile({
+            "find": r"\w+",
+            "name": "word",
+            "match": 0
+        })
+        self.assertIsInstance(plan, FindPlan)
+        self.assertEquals({'word': 'roses'},
+                          plan.run(input='roses are red').flattened_values)
+        self.assertEquals({'word': 'violets'},
+                          plan.run(input='violets are blue').flattened_values)
+
+    def test_static_pattern_precompiled(self):
+        """
+        Patterns without tags should only be compiled once.
+        """
+        plan = Scraper().compile({"find": "foo"})
+        self.assertIs(plan.pattern('foo'), plan.pattern('foo'))
+
+    def test_tagged_pattern(self):
+        """
+        Patterns with tags are substituted at run time.
+        """
+        plan = Scraper().compile({"find": "{{{flower}}}", "name": "flower"})
+        resp = plan.run(tags={'flower': 'roses'}, input='violets roses')
+        self.assertEquals({'flower': 'roses'}, resp.flattened_values)
+        resp = plan.run(tags={'flower': 'violets'}, input='violets roses')
+        self.assertEquals({'flower': 'violets'}, resp.flattened_values)
+
+    def test_missing_tags(self):
+        """
+        Missing tags are reported when run, not when compiled.
+        """
+        plan = Scraper().compile({"find": "{{{flower}}}"})
+        self.assertEquals('missing', plan.run(input='roses').status)
+
+    def test_extends_flattened(self):
+        """
+        `extends` is resolved at compile time, without modifying the
+        instruction.
+        """
+        instruction = {
+            "extends": {
+                "find": r"foo\w+"
+            },
+            "match": 1
+        }
+        plan = Scraper().compile(instruction)
+        self.assertNotIn('extends', plan.instruction)
+        self.assertIn('extends', instruction)
+        self.assertEquals('foobaz', plan.run(input='foobar foobaz').results[0].value)
+        self.assertEquals('foobop', plan.run(input='foobar foobop').results[0].value)
+
+    def test_file_reference(self):
+        """
+        A string instruction without tags is loaded at compile time.
+        """
+        plan = Scraper().compile('fixtures/find-foobar.json', uri=FILE_PATH)
+        self.assertIsInstance(plan, FindPlan)
+        self.assertEquals('found', plan.run(input='foobar').status)
+        self.assertEquals('failed', plan.run(input='foobaz').status)
+
+    def test_nested_file_references(self):
+        """
+        References in `then` are resolved relative to their parent.
+        """
+        plan = Scraper().compile('fixtures/nested.json', uri=FILE_PATH)
+        resp = plan.run(input="there are some russian dolls")
+        self.assertEquals('dolls', resp.results[0].children[0].results[0].children[0].results[0].value)
+
+    def test_tagged_reference(self):
+        """
+        A string instruction with tags is resolved when run.
+        """
+        plan = Scraper().compile('fixtures/{{{name}}}.json', uri=FILE_PATH)
+        self.assertIsInstance(plan, ReferencePlan)
+        resp = plan.run(tags={'name': 'find-foobar'}, input='foobar')
+        self.assertEquals('foobar', resp.results[0].value)
+        self.assertEquals('missing', plan.run(input='foobar').status)
+
+    def test_list(self):
+        """
+        Lists compile to a plan for each element.
+        """
+        plan = Scraper().compile([{"find": "foo"}, {"load": "http://localhost/"}])
+        self.assertIsInstance(plan, ListPlan)
+        self.assertIsInstance(plan.plans[0], FindPlan)
+        self.assertIsInstance(plan.plans[1], LoadPlan)
+        self.assertEquals(['found', 'wait'],
+                          [r.status for r in plan.run(input='foo')])
+
+    def test_invalid(self):
+        """
+        Invalid instructions are caught at compile time.
+        """
+        with self.assertRaises(InvalidInstructionError):
+            Scraper().compile({"name": "nothing to do"})
+        with self.assertRaises(InvalidInstructionError):
+            Scraper().compile({"find": "foo", "xpath": "//foo"})
+        with self.assertRaises(InvalidInstructionError):
+            Scraper().compile({"load": "http://localhost/", "method": "delete"})
+
+if __name__ == '__main__':
+    unittest.main()
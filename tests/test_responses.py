@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import copy
+import cPickle
+
+from helpers import unittest, LocalServer
+from pycaustic import Scraper
+from pycaustic.errors import TemplateError
+from pycaustic.responses import Body, Result, LazyResults
+
+
+class TestBody(unittest.TestCase):
+
+    def test_text_decoded_once(self):
+        """
+        Text is decoded on demand, and then kept.
+        """
+        body = Body('ros\xc3\xa9s')
+        self.assertEquals(u'rosés', body.text)
+        self.assertIs(body.text, body.text)
+        self.assertEquals(6, len(body))
+
+    def test_result_value(self):
+        """
+        Results of loads have their body's text as their value.
+        """
+        result = Result(Body('roses'))
+        self.assertEquals(u'roses', result.value)
+        self.assertEquals({'value': u'roses'}, result.as_dict())
+
+
+class TestScraperBodies(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalServer(self.respond)
+        self.instruction = {'load': self.server.url(),
+                            'then': {'find': '.+', 'name': 'flower'}}
+
+    def tearDown(self):
+        self.server.stop()
+
+    def respond(self, handler):
+        if handler.path == '/latin-1':
+            return 200, {'Content-Type': 'text/plain; charset=iso-8859-1'}, 'ros\xe9s'
+        return 200, {'Content-Type': 'text/plain; charset=utf-8'}, 'ros\xc3\xa9s'
+
+    def test_children_share_body(self):
+        """
+        Children read the same UTF-8 body that the result keeps.
+        """
+        resp = Scraper().scrape(self.instruction, force=True)
+        result = resp.results[0]
+        self.assertEquals(u'rosés', result.value)
+        self.assertEquals('ros\xc3\xa9s', result.body.content)
+        self.assertEquals('ros\xc3\xa9s', result.children[0].results[0].value)
+
+    def test_reencoded(self):
+        """
+        Bodies that aren't UTF-8 are re-encoded for children.
+        """
+        self.instruction['load'] = self.server.url('/latin-1')
+        resp = Scraper().scrape(self.instruction, force=True)
+        self.assertEquals(u'rosés', resp.results[0].value)
+        self.assertEquals('ros\xc3\xa9s', resp.results[0].body.content)
+
+    def test_drop_bodies(self):
+        """
+        Scrapers that don't keep bodies still scrape children.
+        """
+        resp = Scraper(keep_bodies=False).scrape(self.instruction, force=True)
+        self.assertIsNone(resp.results[0].value)
+        self.assertIsNone(resp.results[0].body)
+        self.assertEquals({'flower': 'ros\xc3\xa9s'}, resp.flattened_values)
+        self.assertIsNone(resp.as_dict()['results'][0]['value'])
+
+class TestLazyResults(unittest.TestCase):
+
+    def setUp(self):
+        self.made = []
+
+        def results():
+            for i in range(5):
+                self.made.append(i)
+                yield Result(str(i))
+        self.results = LazyResults(results())
+
+    def test_produced_as_read(self):
+        """
+        Results are only produced as far as they are read.
+        """
+        self.assertEquals('1', self.results[1].value)
+        self.assertEquals(['0', '1'], [r.value for r in self.results[:2]])
+        self.assertEquals([0, 1], self.made)
+        self.assertEquals(5, len(self.results))
+        self.assertEquals('4', self.results[-1].value)
+
+    def test_reread(self):
+        """
+        Produced results are kept for later reads.
+        """
+        for result in self.results:
+            break
+        self.assertEquals(['0', '1', '2', '3', '4'],
+                          [r.value for r in self.results])
+        self.assertEquals([0, 1, 2, 3, 4], self.made)
+
+
+class TestScraperLazy(unittest.TestCase):
+
+    def setUp(self):
+        self.scraper = Scraper(lazy=True)
+        self.instruction = {
+            'find': r'\w+',
+            'name': 'flower',
+            'then': {'find': '^.', 'name': 'first'}
+        }
+
+    def test_stop_early(self):
+        """
+        Later matches and their children are only scraped when read.
+        """
+        resp = self.scraper.scrape(self.instruction, input='roses violets tulips')
+        self.assertEquals(0, resp.results.produced)
+        first = resp.results[0]
+        self.assertEquals('roses', first.value)
+        self.assertEquals('r', first.children[0].results[0].value)
+        self.assertEquals(1, resp.results.produced)
+
+    def test_same_as_eager(self):
+        """
+        Fully read, lazy results are the same as eager ones.
+        """
+        input = 'roses violets tulips'
+        self.assertEquals(Scraper().scrape(self.instruction, input=input).flattened_values,
+                          self.scraper.scrape(self.instruction, input=input).flattened_values)
+
+    def test_no_match(self):
+        """
+        Finds with no matches fail right away.
+        """
+        self.assertEquals('failed', self.scraper.scrape(self.instruction, input='...').status)
+
+    def test_single_match_eager(self):
+        """
+        Single matches still set tags for their siblings.
+        """
+        resp = self.scraper.scrape([{'find': r'\w+', 'name': 'flower', 'match': 0},
+                                    {'find': '{{flower}}', 'name': 'again'}],
+                                   input='roses violets')
+        self.assertEquals('found', resp[1].status)
+
+    def test_missing_tags_later(self):
+        """
+        Later matches missing tags raise when read.
+        """
+        resp = self.scraper.scrape({'find': r'\S+'}, input='roses {{color}}')
+        with self.assertRaises(TemplateError):
+            list(resp.results)
+
+class TestCompact(unittest.TestCase):
+
+    def test_no_dict(self):
+        """
+        Results and Responses have no __dict__.
+        """
+        resp = Scraper().scrape({'find': 'roses', 'name': 'flower'}, input='roses')
+        self.assertFalse(hasattr(resp, '__dict__'))
+        self.assertFalse(hasattr(resp.results[0], '__dict__'))
+
+    def test_drop_context(self):
+        """
+        Without context, Responses don't keep their tags or instruction but
+        scrape the same.
+        """
+        instruction = {'find': r'\w+', 'name': 'flower',
+                       'then': {'find': '{{flower}}', 'name': 'again'}}
+        resp = Scraper(keep_context=False).scrape(instruction, input='roses violets')
+        self.assertIsNone(dict(resp._fields())['tags'])
+        self.assertIsNone(resp.instruction)
+        self.assertEquals(Scraper().scrape(instruction, input='roses violets').flattened_values,
+                          resp.flattened_values)
+
+
+class TestCopy(unittest.TestCase):
+
+    def setUp(self):
+        self.instruction = {'find': r'\w+', 'name': 'flower',
+                            'then': {'find': r'^\w', 'name': 'initial'}}
+        self.resp = Scraper().scrape(self.instruction, input='roses violets')
+
+    def test_flattened(self):
+        """
+        Copies and pickles flatten the same as the original, whether or not
+        it has been flattened.
+        """
+        for flatten in (False, True):
+            if flatten:
+                self.resp.flattened_values
+            for resp in (copy.deepcopy(self.resp),
+                         cPickle.loads(cPickle.dumps(self.resp, 2))):
+                self.assertEquals([{'flower': 'roses', 'initial': 'r'},
+                                   {'flower': 'violets', 'initial': 'v'}],
+                                  resp.flattened_values)
+
+    def test_pickle_protocols(self):
+        """
+        Responses, Results and Bodies pickle under every protocol.
+        """
+        failed = Scraper().scrape({'find': 'tulips'}, input='roses')
+        for protocol in (0, 1, 2):
+            resp = cPickle.loads(cPickle.dumps(self.resp, protocol))
+            self.assertEquals(self.resp.as_dict(), resp.as_dict())
+            self.assertEquals(self.resp.instruction, resp.instruction)
+            self.assertEquals('roses', resp.results[0].value)
+            self.assertEquals(failed.reason,
+                              cPickle.loads(cPickle.dumps(failed, protocol)).reason)
+            body = cPickle.loads(cPickle.dumps(Result(Body('roses')), protocol)).body
+            self.assertEquals(u'roses', body.text)
+
+    def test_pickle_lazy(self):
+        """
+        Lazy Responses are scraped in full when they are pickled.
+        """
+        resp = Scraper(lazy=True).scrape(self.instruction, input='roses violets')
+        for protocol in (0, 2):
+            self.assertEquals(self.resp.flattened_values,
+                              cPickle.loads(cPickle.dumps(resp, protocol)).flattened_values)
+
+if __name__ == '__main__':
+    unittest.main()
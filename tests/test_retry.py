@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from helpers import unittest, LocalServer
+from pycaustic import Scraper
+from pycaustic.errors import InvalidInstructionError
+from pycaustic.retry import RetryPolicy
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_backoff_bounded(self):
+        """
+        Backoff grows with each retry, but never beyond max_backoff.
+        """
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+        for retry in range(10):
+            self.assertLessEqual(policy.delay(retry), min(5, 2 ** retry))
+
+    def test_override(self):
+        """
+        Overrides replace only the settings given.
+        """
+        policy = RetryPolicy(retries=3, timeout=10).override(timeout=(1, 2))
+        self.assertEquals(3, policy.retries)
+        self.assertEquals((1, 2), policy.timeout)
+
+
+class TestScraperRetry(unittest.TestCase):
+
+    def setUp(self):
+        self.statuses = []
+        self.delay = 0
+        self.retry_after = '0'
+        self.server = LocalServer(self.respond)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def respond(self, handler):
+        time.sleep(self.delay)
+        status = self.statuses.pop(0) if self.statuses else 200
+        return status, {'Retry-After': self.retry_after}, 'roses'
+
+    def test_retry_status(self):
+        """
+        Loads are retried on 5xx and 429 responses.
+        """
+        self.statuses = [503, 429]
+        scraper = Scraper(retry=RetryPolicy(retries=2))
+        resp = scraper.scrape({'load': self.server.url()}, force=True)
+        self.assertEquals('loaded', resp.status)
+        self.assertEquals(3, resp.attempts)
+        self.assertEquals(3, len(self.server.requests))
+
+    def test_retries_exhausted(self):
+        """
+        The last response fails once retries are exhausted.
+        """
+        self.statuses = [500, 500, 500]
+        scraper = Scraper(retry=RetryPolicy(retries=1))
+        resp = scraper.scrape({'load': self.server.url()}, force=True)
+        self.assertEquals('failed', resp.status)
+        self.assertEquals(2, resp.attempts)
+        self.assertEquals(2, resp.as_dict()['attempts'])
+
+    def test_no_retry_client_error(self):
+        """
+        Client errors other than 429 are not retried.
+        """
+        self.statuses = [404]
+        scraper = Scraper(retry=RetryPolicy(retries=3))
+        resp = scraper.scrape({'load': self.server.url()}, force=True)
+        self.assertEquals('failed', resp.status)
+        self.assertEquals(1, resp.attempts)
+
+    def test_long_retry_after(self):
+        """
+        Responses asking to wait longer than max_backoff aren't retried.
+        """
+        self.statuses = [503]
+        self.retry_after = '120'
+        scraper = Scraper(retry=RetryPolicy(retries=3, max_backoff=30))
+        start = time.time()
+        resp = scraper.scrape({'load': self.server.url()}, force=True)
+        self.assertEquals('failed', resp.status)
+        self.assertEquals(1, resp.attempts)
+        self.assertLess(time.time() - start, 5)
+
+    def test_timeout(self):
+        """
+        Slow responses time out, and are retried.
+        """
+        self.delay = 0.3
+        scraper = Scraper(retry=RetryPolicy(retries=1, timeout=0.05, backoff=0))
+        start = time.time()
+        resp = scraper.scrape({'load': self.server.url()}, force=True)
+        self.assertEquals('failed', resp.status)
+        self.assertEquals(2, resp.attempts)
+        self.assertLess(time.time() - start, 0.3)
+
+    def test_instruction_overrides(self):
+        """
+        Instructions may set their own retries and timeout.
+        """
+        self.statuses = [503]
+        resp = Scraper().scrape({'load': self.server.url(), 'retries': 1,
+                                 'timeout': [1, 1]}, force=True)
+        self.assertEquals('loaded', resp.status)
+        self.assertEquals(2, resp.attempts)
+
+    def test_invalid_retries(self):
+        """
+        Instructions with invalid retries can't be compiled.
+        """
+        with self.assertRaises(InvalidInstructionError):
+            Scraper().compile({'load': self.server.url(), 'retries': 'lots'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+from StringIO import StringIO
+
+from helpers import unittest
+from pycaustic import Scraper
+from pycaustic.responses import DoneFind, Result
+from pycaustic.scraper import Request
+from pycaustic.serialize import dump, dumps, dump_lines, dump_rows
+
+INSTRUCTION = [{
+    'find': r'\w+:\w+',
+    'name': 'pair',
+    'then': [{
+        'find': r'^\w+',
+        'name': 'flower'
+    }, {
+        'find': r'\w+$',
+        'name': 'color'
+    }]
+}, {
+    'find': 'daisies',
+    'name': 'missing'
+}]
+INPUT = 'roses:red violets:blue'
+
+
+def deep_tree(depth):
+    """
+    Build a chain of depth DoneFinds, each the only child of the last.
+    """
+    req = Request({}, {}, '', False, None, None)
+    resp = DoneFind(req, 'leaf', None, [Result('bottom')])
+    for i in range(depth):
+        resp = DoneFind(req, 'level%s' % i, None, [Result(str(i), [resp])])
+    return resp
+
+
+class TestSerialize(unittest.TestCase):
+
+    def setUp(self):
+        self.resps = Scraper().scrape(INSTRUCTION, tags={'season': 'spring'},
+                                      input=INPUT)
+
+    def test_same_as_dict(self):
+        """
+        Serialized responses with all their tags have the same JSON as
+        their dicts.
+        """
+        expected = [json.loads(json.dumps(r.as_dict(), default=dict))
+                    for r in self.resps]
+        self.assertEquals(expected, json.loads(dumps(self.resps, all_tags=True)))
+        fp = StringIO()
+        dump(self.resps, fp, all_tags=True)
+        self.assertEquals(expected, json.loads(fp.getvalue()))
+
+    def test_own_tags(self):
+        """
+        Nested responses only have the tags set since the response above.
+        """
+        found = json.loads(dumps(self.resps))[0]
+        self.assertEquals({'season': 'spring'}, found['tags'])
+        pair = found['results'][0]['children'][0]
+        self.assertEquals({'pair': 'roses:red'}, pair['tags'])
+        self.assertEquals('roses', pair['results'][0]['value'])
+
+    def test_truncated(self):
+        """
+        Long values are only shortened if asked.
+        """
+        resp = Scraper().scrape({'find': '.+'}, input='roses' * 100)
+        self.assertEquals(203, len(json.loads(dumps(resp))['results'][0]['value']))
+        self.assertEquals(500, len(json.loads(dumps(resp, truncated=False))['results'][0]['value']))
+
+    def test_lines(self):
+        """
+        Each response is written as a line.
+        """
+        fp = StringIO()
+        dump_lines(self.resps, fp)
+        lines = fp.getvalue().splitlines()
+        self.assertEquals(['found', 'failed'], [json.loads(l)['status'] for l in lines])
+
+    def test_rows(self):
+        """
+        Rows are written from flattened values.
+        """
+        fp = StringIO()
+        dump_rows(self.resps, fp)
+        self.assertEquals([{'pair': 'roses:red', 'flower': 'roses', 'color': 'red'},
+                           {'pair': 'violets:blue', 'flower': 'violets', 'color': 'blue'}],
+                          [json.loads(l) for l in fp.getvalue().splitlines()])
+
+    def test_deep(self):
+        """
+        Trees deeper than the recursion limit can be written and flattened.
+        """
+        resp = deep_tree(2000)
+        self.assertIn('bottom', dumps(resp))
+        self.assertEquals('bottom', resp.flattened_values['leaf'])
+        self.assertEquals('0', resp.flattened_values['level0'])
+
+if __name__ == '__main__':
+    unittest.main()
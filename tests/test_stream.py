@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from helpers import unittest, LocalServer
+from pycaustic import Scraper
+from pycaustic.concurrency import ThreadPool
+from pycaustic.responses import DoneFind, Result
+from pycaustic.scraper import Request
+from pycaustic.stream import leaves
+
+INSTRUCTION = {
+    'find': r'\w+:\w+',
+    'name': 'pair',
+    'then': [{
+        'find': r'^\w+',
+        'name': 'flower'
+    }, {
+        'find': r'\w+$',
+        'name': 'color'
+    }]
+}
+INPUT = 'roses:red violets:blue'
+LEAVES = [(('pair', 'flower'), 'roses'),
+          (('pair', 'color'), 'red'),
+          (('pair', 'flower'), 'violets'),
+          (('pair', 'color'), 'blue')]
+
+
+class TestSink(unittest.TestCase):
+
+    def setUp(self):
+        self.leaves = []
+
+    def test_leaves(self):
+        """
+        Each result with no children is sent to the sink with its path.
+        """
+        Scraper(sink=self.leaves.append).scrape(INSTRUCTION, input=INPUT)
+        self.assertEquals(LEAVES, [(leaf.path, leaf.value) for leaf in self.leaves])
+        self.assertEquals('violets:blue', self.leaves[-1].tags['pair'])
+        self.assertEquals('color', self.leaves[-1].name)
+
+    def test_pool(self):
+        """
+        Leaves from a pool are all sent, in any order.
+        """
+        with ThreadPool(4) as pool:
+            Scraper(pool=pool, sink=self.leaves.append).scrape(
+                INSTRUCTION, input=INPUT)
+        self.assertEquals(4, len(self.leaves))
+
+    def test_lazy(self):
+        """
+        Lazy scrapes send leaves as the tree is read.
+        """
+        resp = Scraper(lazy=True, sink=self.leaves.append).scrape(
+            INSTRUCTION, input=INPUT)
+        self.assertEquals([], self.leaves)
+        resp.results[0].children
+        self.assertEquals(2, len(self.leaves))
+
+    def test_drop_results(self):
+        """
+        Results sent to the sink can be left out of the Response tree.
+        """
+        resp = Scraper(sink=self.leaves.append, keep_results=False).scrape(
+            INSTRUCTION, input=INPUT)
+        self.assertEquals(LEAVES, [(leaf.path, leaf.value) for leaf in self.leaves])
+        self.assertEquals(['roses:red', 'violets:blue'],
+                          [result.value for result in resp.results])
+        for result in resp.results:
+            self.assertEquals([[], []], [child.results for child in result.children])
+
+    def test_drop_lazy_results(self):
+        """
+        Lazy scrapes send leaves that aren't kept as the tree is read.
+        """
+        resp = Scraper(lazy=True, sink=self.leaves.append, keep_results=False).scrape(
+            {'find': r'\w+', 'name': 'word'}, input=INPUT)
+        self.assertEquals([], list(resp.results))
+        self.assertEquals(['roses', 'red', 'violets', 'blue'],
+                          [leaf.value for leaf in self.leaves])
+
+    def test_drop_results_needs_sink(self):
+        """
+        Results can't be dropped without a sink.
+        """
+        self.assertRaises(ValueError, Scraper, keep_results=False)
+
+
+class TestLoadLeaves(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalServer(lambda handler: (200, {}, 'roses'))
+        self.instruction = {'load': self.server.url(), 'name': 'page'}
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_undecoded(self):
+        """
+        Loads with no children aren't decoded when there is no sink.
+        """
+        resp = Scraper().scrape(self.instruction, force=True)
+        self.assertIsNone(resp.results[0].body._text)
+
+    def test_sent(self):
+        """
+        Loads with no children are sent to the sink as text, and their bodies
+        can be dropped.
+        """
+        leaves = []
+        resp = Scraper(sink=leaves.append, keep_results=False).scrape(
+            self.instruction, force=True)
+        self.assertEquals([(('page', ), u'roses')],
+                          [(leaf.path, leaf.value) for leaf in leaves])
+        self.assertIsNone(resp.results[0].body)
+
+
+class TestLeaves(unittest.TestCase):
+
+    def test_walk(self):
+        """
+        Leaves can be read from a Response tree.
+        """
+        resp = Scraper().scrape(INSTRUCTION, input=INPUT)
+        self.assertEquals(LEAVES, [(leaf.path, leaf.value) for leaf in leaves(resp)])
+
+    def test_lazy_walk(self):
+        """
+        Reading leaves of a lazy scrape only scrapes as far as is read.
+        """
+        resp = Scraper(lazy=True).scrape(INSTRUCTION, input=INPUT)
+        first = next(leaves(resp))
+        self.assertEquals('roses', first.value)
+        self.assertEquals(1, resp.results.produced)
+
+    def test_deep(self):
+        """
+        Trees deeper than the recursion limit can be read.
+        """
+        req = Request({}, {}, '', False, None, None)
+        resp = DoneFind(req, 'leaf', None, [Result('bottom')])
+        for i in range(2000):
+            resp = DoneFind(req, None, None, [Result(str(i), [resp])])
+        self.assertEquals([(('leaf', ), 'bottom')],
+                          [(leaf.path, leaf.value) for leaf in leaves(resp)])
+
+if __name__ == '__main__':
+    unittest.main()
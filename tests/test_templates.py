@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import copy
+import cPickle
+
 from helpers import unittest
-from pycaustic.templates import Substitution
+from pycaustic import Scraper
+from pycaustic.templates import (InheritedDict, Substitution, Template, TEMPLATE_CACHE,
+                                 compile_template, compile_templates)
 from pycaustic.errors import TemplateError, TemplateResultError
 
 
@@ -137,6 +142,15 @@ class TestSubstitution(unittest.TestCase):
         })
         self.assertEquals(url, sub.result)
 
+    def test_values_not_expanded(self):
+        """
+        Templates in substituted values are left as they are, even when an
+        unencoded value looks like an encoded template.
+        """
+        sub = Substitution("{{{a}}}", {'a': '{{b}}', 'b': 'x'})
+        self.assertEquals("{{b}}", sub.result)
+        self.assertEquals([], sub.missing_tags)
+
     def test_substituting_blank(self):
         """
         We should be able to substitute in a blank string
@@ -146,3 +160,169 @@ class TestSubstitution(unittest.TestCase):
             'blank': ''
         })
         self.assertEquals("nothing inside ''", sub.result)
+
+
+class TestTemplate(unittest.TestCase):
+
+    def test_tags(self):
+        """
+        Required tags are known without rendering.
+        """
+        tmpl = Template('{{roses}} and {{{violets}}} and {{roses}}')
+        self.assertEquals(frozenset(['roses', 'violets']), tmpl.tags)
+
+    def test_render(self):
+        """
+        Encoded and unencoded references render in a single pass.
+        """
+        tmpl = Template('{{{a}}}|{{a}}|{{b}}')
+        self.assertEquals(('x y|x+y|z', []), tmpl.render({'a': 'x y', 'b': 'z'}))
+
+    def test_render_missing(self):
+        """
+        Missing tags are reported, and there is no result.
+        """
+        tmpl = Template('{{roses}} and {{violets}}')
+        self.assertEquals((None, ['violets']), tmpl.render({'roses': 'red'}))
+
+    def test_literal(self):
+        """
+        Templates without tags are literals.
+        """
+        tmpl = Template('roses are red')
+        self.assertTrue(tmpl.is_literal)
+        self.assertEquals(('roses are red', []), tmpl.render({}))
+
+    def test_unbalanced_braces(self):
+        """
+        Stray braces are left alone.
+        """
+        tmpl = Template('{{{a}} {b}}')
+        self.assertEquals(('{x {b}}', []), tmpl.render({'a': 'x', 'b': 'y'}))
+
+    def test_custom_delimiters(self):
+        """
+        Delimiters are literal strings.
+        """
+        tmpl = Template('$(a) $[b]', '$(', ')', '$[', ']')
+        self.assertEquals(('x+y z', []), tmpl.render({'a': 'x y', 'b': 'z'}))
+
+    def test_compile_cached(self):
+        """
+        Compiling the same template twice yields the same Template.
+        """
+        self.assertIs(compile_template('{{petunias}}'),
+                      compile_template('{{petunias}}'))
+        self.assertIsNot(compile_template('{{petunias}}'),
+                         compile_template('{{petunias}}', '<', '>', '<<', '>>'))
+
+    def test_compiled_substitution(self):
+        """
+        Substitutions can be made on compiled templates and dicts of them.
+        """
+        compiled = compile_templates({'{{a}}': '{{{b}}}', 'c': 'd'})
+        self.assertEquals({'x': 'y z', 'c': 'd'},
+                          Substitution(compiled, {'a': 'x', 'b': 'y z'}).result)
+        self.assertEquals('5', Substitution(compile_templates(5), {}).result)
+
+    def test_values_not_cached(self):
+        """
+        Only instruction templates are cached, not scraped values.
+        """
+        plan = Scraper().compile({'find': r'\w+', 'name': 'word',
+                                  'then': {'find': '{{word}}'}})
+        # Nested plans are compiled when they are first run.
+        plan.run(input='tulips')
+        cached = len(TEMPLATE_CACHE)
+        for i in xrange(5):
+            plan.run(input='roses%s violets%s {{word}}' % (i, i))
+        self.assertEquals(cached, len(TEMPLATE_CACHE))
+
+
+class TestInheritedDict(unittest.TestCase):
+
+    def chain(self, depth):
+        tags = InheritedDict({'roses': 'red'})
+        for i in xrange(depth):
+            tags = InheritedDict(tags)
+            tags['level%s' % i] = str(i)
+        return tags
+
+    def test_lookup(self):
+        """
+        Keys are found in this dict, its parents, or the root.
+        """
+        tags = self.chain(25)
+        self.assertEquals('24', tags['level24'])
+        self.assertEquals('0', tags['level0'])
+        self.assertEquals('red', tags['roses'])
+        self.assertRaises(KeyError, tags.__getitem__, 'violets')
+        self.assertIn('roses', tags)
+        self.assertFalse(tags.has_key('violets'))
+
+    def test_never_overwrites_parent(self):
+        """
+        Setting and deleting only affect this dict.
+        """
+        parent = InheritedDict({'roses': 'red'})
+        child = InheritedDict(parent)
+        child['roses'] = 'white'
+        self.assertEquals('red', parent['roses'])
+        del child['roses']
+        self.assertEquals('red', child['roses'])
+        self.assertRaises(KeyError, child.__delitem__, 'roses')
+
+    def test_parent_changes_seen(self):
+        """
+        Children see changes to their parents after they have looked a key
+        up.
+        """
+        root = {}
+        parent = InheritedDict(root)
+        child = InheritedDict(InheritedDict(parent))
+        self.assertRaises(KeyError, child.__getitem__, 'roses')
+        parent['roses'] = 'red'
+        self.assertEquals('red', child['roses'])
+        parent['roses'] = 'white'
+        self.assertEquals('white', child['roses'])
+        root['violets'] = 'blue'
+        self.assertEquals('blue', child['violets'])
+
+    def test_iteration(self):
+        """
+        Keys are iterated once each, and counted.
+        """
+        tags = self.chain(3)
+        tags['roses'] = 'white'
+        self.assertEquals(set(['roses', 'level0', 'level1', 'level2']), set(tags))
+        self.assertEquals(4, len(tags))
+        self.assertEquals({'roses': 'white', 'level0': '0', 'level1': '1',
+                           'level2': '2'}, dict(tags))
+
+    def test_copy(self):
+        """
+        Copies and pickles look keys up as the original does.
+        """
+        tags = self.chain(3)
+        tags['roses']
+        tags['violets'] = 'blue'
+        copies = [copy.deepcopy(tags)] + [
+            cPickle.loads(cPickle.dumps(tags, protocol)) for protocol in (0, 2)]
+        for tags_copy in copies:
+            self.assertEquals('red', tags_copy['roses'])
+            self.assertEquals('0', tags_copy['level0'])
+            self.assertEquals(dict(tags), dict(tags_copy))
+
+    def test_since(self):
+        """
+        Keys set below an ancestor are found without the ancestor's.
+        """
+        ancestor = self.chain(2)
+        tags = InheritedDict(InheritedDict(ancestor))
+        tags._parent['level0'] = 'zero'
+        tags['level3'] = '3'
+        self.assertEquals({'level0': 'zero', 'level3': '3'}, tags.since(ancestor))
+        self.assertEquals(dict(tags), tags.since(self.chain(2)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import urlparse
+
+from helpers import unittest, LocalServer
+from pycaustic import Scraper
+from pycaustic.concurrency import ThreadPool
+from pycaustic.throttle import HostScheduler
+
+
+class TestHostScheduler(unittest.TestCase):
+
+    def test_round_robin(self):
+        """
+        With a total limit, freed slots alternate between waiting hosts.
+        """
+        scheduler = HostScheduler(per_host=1, total=1)
+        order = []
+
+        def request(url):
+            host = scheduler.acquire(url)
+            order.append(url)
+            scheduler.release(host)
+
+        first = scheduler.acquire('http://roses.com/0')
+        threads = []
+        for url in ('http://roses.com/1', 'http://roses.com/2', 'http://violets.com/1'):
+            thread = threading.Thread(target=request, args=(url, ))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.05)
+
+        self.assertEquals(3, scheduler.stats()['queued'])
+        scheduler.release(first)
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(['http://roses.com/1', 'http://violets.com/1',
+                           'http://roses.com/2'], order)
+        self.assertEquals(0, scheduler.stats()['queued'])
+        self.assertGreater(scheduler.stats()['hosts']['roses.com']['wait_time'], 0)
+
+    def test_rate(self):
+        """
+        Requests to a host are spaced out by its rate.
+        """
+        scheduler = HostScheduler(per_host=10, rate=20)
+        start = time.time()
+        for _ in range(5):
+            with scheduler.slot('http://roses.com/'):
+                pass
+        self.assertGreaterEqual(time.time() - start, 0.19)
+
+    def test_burst(self):
+        """
+        Bursts are allowed up to burst.
+        """
+        scheduler = HostScheduler(per_host=10, rate=1, burst=3)
+        start = time.time()
+        for _ in range(3):
+            with scheduler.slot('http://roses.com/'):
+                pass
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_hosts_independent(self):
+        """
+        A busy host doesn't hold up others.
+        """
+        scheduler = HostScheduler(per_host=1)
+        roses = scheduler.acquire('http://roses.com/')
+        with scheduler.slot('http://violets.com/'):
+            self.assertEquals(2, scheduler.stats()['active'])
+        scheduler.release(roses)
+
+
+class TestScraperScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.server = LocalServer(self.respond)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def respond(self, handler):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return 200, {}, 'roses'
+
+    def pages(self, count):
+        return ' '.join(str(i) for i in range(count))
+
+    def fan_out(self):
+        return {'find': r'\d+', 'name': 'page',
+                'then': {'load': self.server.url('/{{page}}')}}
+
+    def test_per_host_limit(self):
+        """
+        Fanned-out loads respect the per-host limit.
+        """
+        scheduler = HostScheduler(per_host=2)
+        with ThreadPool(8) as pool:
+            resp = Scraper(pool=pool, scheduler=scheduler, force_all=True).scrape(
+                self.fan_out(), input=self.pages(8), force=True)
+        self.assertEquals(['loaded'] * 8,
+                          [r.children[0].status for r in resp.results])
+        self.assertEquals(2, self.max_active)
+        host = urlparse.urlsplit(self.server.url()).netloc
+        self.assertEquals(8, scheduler.stats()['hosts'][host]['requests'])
+
+    def test_gevent_pool(self):
+        """
+        Schedulers used with a gevent pool must be green.
+        """
+        import gevent.pool
+        pool = gevent.pool.Pool(8)
+        self.assertRaises(ValueError, Scraper, pool=pool,
+                          scheduler=HostScheduler(per_host=2))
+        scheduler = HostScheduler(per_host=2, green=True)
+        resp = Scraper(pool=pool, scheduler=scheduler, force_all=True).scrape(
+            self.fan_out(), input=self.pages(4), force=True)
+        self.assertEquals(['loaded'] * 4,
+                          [r.children[0].status for r in resp.results])
+
+if __name__ == '__main__':
+    unittest.main()